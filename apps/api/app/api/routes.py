@@ -1,15 +1,53 @@
+import asyncio
+import base64
+import binascii
+import hmac
 import logging
+import time
+from collections.abc import AsyncIterator, Callable
+from typing import TYPE_CHECKING, Literal
+from uuid import uuid4
 
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, HTTPException, Query, Request, Response, status
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
 
 from app.core.config import get_settings
+from app.engine.admission import Admission, AdmissionRejected, get_admission_controller
+from app.engine.cancellation import CancellationToken, SharedCancellation
 from app.engine.normalizer import normalize_photo_items, normalize_picker_payload
-from app.engine.scan import run_scan
-from app.engine.schemas import ScanRequest, ScanResult
+from app.engine.schemas import (
+    GroupPage,
+    PhotoItemPayload,
+    RegroupRequest,
+    RegroupResult,
+    ScanEstimate,
+    ScanRequest,
+    ScanResult,
+    ScanSummary,
+)
+from app.engine.singleflight import AsyncSingleFlight
+
+if TYPE_CHECKING:
+    from app.engine.artifacts import RunArtifactStore
+    from app.engine.run_store import RunStore
+    from app.engine.spill import SpilledScanInput
+
+# The scan engine (pipeline, hashing, downloads, caches, artifacts) is imported inside the
+# handlers that use it, so the app starts without loading it; ``app.engine.warmup`` preloads
+# it when SCAN_WARM_UP is set.
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+_DISCONNECT_POLL_SECONDS = 0.25
+_STREAM_BATCH_LINES = 500
+# Starlette 0.48 renamed the 413 constant and deprecated the old name; the locked release
+# predates the rename.
+_HTTP_413_CONTENT_TOO_LARGE: int = getattr(status, "HTTP_413_CONTENT_TOO_LARGE", 413)
+_scan_cancellation = SharedCancellation()
+_scan_flight: AsyncSingleFlight[tuple[ScanResult, Admission]] = AsyncSingleFlight()
+
 
 @router.get("/healthz")
 async def healthz() -> dict[str, str]:
@@ -22,7 +60,12 @@ async def health() -> dict[str, str]:
 
 
 @router.post("/api/scan", response_model=ScanResult)
-def scan(request: ScanRequest) -> ScanResult:
+async def scan(request: ScanRequest, http_request: Request) -> ScanResult:
+    from app.engine.budget import ScanBudget
+    from app.engine.cache import get_scan_cache, scan_cache_key
+    from app.engine.cost_model import get_cost_model_store
+    from app.engine.scan import run_scan
+
     settings = get_settings()
     if request.photo_items:
         items = normalize_photo_items(request.photo_items)
@@ -48,4 +91,427 @@ def scan(request: ScanRequest) -> ScanResult:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=message)
         logger.warning(message)
 
-    return run_scan(items, settings)
+    budget = ScanBudget(max_cost=request.max_cost, deadline_seconds=request.deadline_seconds)
+    artifact_store = _artifact_store()
+    run_store = _run_store()
+    cost_model_store = get_cost_model_store() if settings.scan_cost_model_enabled else None
+    deadline_seconds = request.deadline_seconds or settings.scan_deadline_seconds
+    if request.profile is not None:
+        _require_admin(http_request)
+    if not settings.scan_cache_enabled or request.profile is not None:
+        with _scan_cancellation.hold(uuid4().hex) as holder:
+            result = await _run_until_disconnected(
+                http_request,
+                holder.abandon,
+                holder.token,
+                deadline_seconds,
+                _profiled(
+                    lambda: run_scan(
+                        items,
+                        settings,
+                        budget=budget.restarted(),
+                        artifact_store=artifact_store,
+                        cancellation=holder.token,
+                        cost_model_store=cost_model_store,
+                        run_store=run_store,
+                    ),
+                    request.profile,
+                ),
+            )
+        return result if request.include_groups else _without_groups(result)
+    # Identical concurrent requests share one scan, which is only cancelled once every one
+    # of them has disconnected. Only the request that runs it is admitted; cached results
+    # and requests joining a running scan skip admission entirely. Budgets are restarted
+    # inside the scan, so their deadline, like the token's, starts once admitted.
+    cache_key = scan_cache_key(items, settings, budget)
+    cached = get_scan_cache().lookup(cache_key)
+    if cached is not None:
+        return cached if request.include_groups else _without_groups(cached)
+    with _scan_cancellation.hold(cache_key) as holder:
+        result = await _run_until_disconnected(
+            http_request,
+            holder.abandon,
+            holder.token,
+            deadline_seconds,
+            lambda: get_scan_cache().get_or_compute(
+                cache_key,
+                lambda: run_scan(
+                    items,
+                    settings,
+                    budget=budget.restarted(),
+                    artifact_store=artifact_store,
+                    cancellation=holder.token,
+                    cost_model_store=cost_model_store,
+                    run_store=run_store,
+                ),
+            ),
+            flight_key=cache_key,
+        )
+    return result if request.include_groups else _without_groups(result)
+
+
+@router.post("/api/scan/estimate", response_model=ScanEstimate)
+def estimate_scan(request: ScanRequest) -> ScanEstimate:
+    """Predict duration and cost from item metadata and learned timings, without downloading."""
+    from app.engine.cost_model import get_cost_model_store
+
+    if request.photo_items:
+        items = normalize_photo_items(request.photo_items)
+    else:
+        items = normalize_picker_payload(request.picker_payload or {})
+    if not items:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No valid photo items provided.",
+        )
+    return get_cost_model_store().load().estimate(items, get_settings())
+
+
+@router.post("/api/scan/stream", response_model=ScanResult)
+async def scan_stream(
+    request: Request,
+    consent_confirmed: bool = Query(default=False, alias="consentConfirmed"),
+) -> ScanResult:
+    from app.engine.scan import run_external_scan
+    from app.engine.spill import SpilledScanInput
+
+    settings = get_settings()
+    with SpilledScanInput(
+        run_items=settings.scan_spill_run_items,
+        match_filename_stem=settings.scan_exact_match_filename_stem,
+        dihedral=settings.scan_dihedral_invariant,
+        directory=settings.scan_spill_dir or None,
+    ) as spilled:
+        # Validation and spilling (sorting plus a disk flush per run) happen off the event
+        # loop, a batch of lines at a time.
+        line_number = 0
+        batch: list[bytes] = []
+        async for line in _ndjson_lines(request.stream(), settings.scan_stream_max_line_bytes):
+            batch.append(line)
+            if len(batch) >= _STREAM_BATCH_LINES:
+                await run_in_threadpool(_spill_lines, spilled, batch, line_number)
+                line_number += len(batch)
+                batch = []
+        if batch:
+            await run_in_threadpool(_spill_lines, spilled, batch, line_number)
+
+        input_count = spilled.item_count
+        if not input_count:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="No valid photo items provided.",
+            )
+        if input_count > settings.scan_stream_max_photos:
+            logger.warning(
+                "Streamed scan of %s items; max allowed is %s.",
+                input_count,
+                settings.scan_stream_max_photos,
+            )
+        if input_count > settings.scan_consent_threshold and not consent_confirmed:
+            message = "Scan exceeds consent threshold; explicit consent is required in production."
+            if settings.enforce_scan_limits:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=message)
+            logger.warning(message)
+
+        with _scan_cancellation.hold(uuid4().hex) as holder:
+            return await _run_until_disconnected(
+                request,
+                holder.abandon,
+                holder.token,
+                settings.scan_deadline_seconds,
+                lambda: run_external_scan(
+                    spilled,
+                    settings,
+                    cancellation=holder.token,
+                    artifact_store=_artifact_store(),
+                    run_store=_run_store(),
+                ),
+            )
+
+
+@router.get("/api/scans/{run_id}/summary", response_model=ScanSummary)
+def scan_summary(run_id: str) -> ScanSummary:
+    summary = _artifact_store().load_summary(run_id)
+    if summary is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Scan run not found or expired.",
+        )
+    return summary
+
+
+@router.get("/api/scans/{run_id}/groups", response_model=GroupPage)
+def scan_groups(
+    run_id: str,
+    category: str | None = None,
+    cursor: str | None = None,
+    limit: int = Query(default=50, ge=1, le=500),
+) -> GroupPage:
+    from app.engine.artifacts import GROUP_CATEGORIES
+
+    if category is not None:
+        category = category.upper()
+        if category not in GROUP_CATEGORIES:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown category; expected one of {', '.join(GROUP_CATEGORIES)}.",
+            )
+    offset = _decode_cursor(cursor)
+    page = _artifact_store().page_groups(run_id, category, offset, limit)
+    if page is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Scan run not found or expired.",
+        )
+    groups, total = page
+    next_offset = offset + len(groups)
+    return GroupPage(
+        runId=run_id,
+        category=category,
+        total=total,
+        groups=groups,
+        nextCursor=_encode_cursor(next_offset) if next_offset < total else None,
+    )
+
+
+@router.get("/api/scans/{run_id}/profile")
+def scan_profile(
+    run_id: str,
+    http_request: Request,
+    profile_format: Literal["collapsed", "pstats"] = Query(default="collapsed", alias="format"),
+) -> Response:
+    _require_admin(http_request)
+    data = _artifact_store().load_profile(run_id, profile_format)
+    if data is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found or expired.",
+        )
+    if profile_format == "collapsed":
+        return Response(content=data, media_type="text/plain; charset=utf-8")
+    return Response(
+        content=data,
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="{run_id}.pstats"'},
+    )
+
+
+@router.post("/api/scans/{run_id}/regroup", response_model=RegroupResult)
+def regroup(run_id: str, request: RegroupRequest) -> RegroupResult:
+    from app.engine.grouping import SimilarityThresholds, verification_policy
+
+    settings = get_settings()
+    thresholds = SimilarityThresholds(
+        dhash_very=_pick(request.dhash_threshold_very, settings.scan_dhash_threshold_very),
+        dhash_possible=_pick(
+            request.dhash_threshold_possible, settings.scan_dhash_threshold_possible
+        ),
+        phash_very=_pick(request.phash_threshold_very, settings.scan_phash_threshold_very),
+        phash_possible=_pick(
+            request.phash_threshold_possible, settings.scan_phash_threshold_possible
+        ),
+    )
+    start = time.perf_counter()
+    regrouped = _artifact_store().regroup(run_id, thresholds, verification_policy(settings))
+    if regrouped is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Scan run not found or expired.",
+        )
+    groups_very, groups_possible, pairs = regrouped
+    return RegroupResult(
+        runId=run_id,
+        pairsEvaluated=pairs,
+        regroupMs=round((time.perf_counter() - start) * 1000, 2),
+        groupsVerySimilar=groups_very,
+        groupsPossiblySimilar=groups_possible,
+    )
+
+
+async def _run_until_disconnected(
+    request: Request,
+    on_disconnect: Callable[[], None],
+    token: CancellationToken,
+    deadline_seconds: float | None,
+    compute: Callable[[], ScanResult],
+    *,
+    flight_key: str | None = None,
+) -> ScanResult:
+    """Run ``compute`` in the threadpool once admitted, starting the deadline at the grant.
+
+    Admission is awaited on the event loop, so queued requests hold no worker thread. With
+    ``flight_key``, identical concurrent requests share one run: only the first is admitted,
+    and the others await its result without a slot or a thread.
+    """
+    controller = get_admission_controller()
+    user = _client_identity(request)
+
+    async def admitted() -> tuple[ScanResult, Admission]:
+        admission = await controller.acquire(user)
+
+        def run() -> ScanResult:
+            try:
+                token.start_deadline(deadline_seconds)
+                return compute()
+            finally:
+                controller.release(user, admission)
+
+        return await run_in_threadpool(run), admission
+
+    watcher = asyncio.create_task(_watch_disconnect(request, on_disconnect))
+    try:
+        if flight_key is None:
+            (result, admission), shared = await admitted(), False
+        else:
+            (result, admission), shared = await _scan_flight.do_shared(flight_key, admitted)
+    except AdmissionRejected as exc:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(exc),
+            headers={"Retry-After": str(exc.retry_after_seconds)},
+        ) from exc
+    finally:
+        watcher.cancel()
+    if shared:
+        return result
+    metrics = result.stage_metrics
+    return result.model_copy(
+        update={
+            "stage_metrics": metrics.model_copy(
+                update={
+                    "counts": {**metrics.counts, "admission_queue_depth": admission.queue_depth},
+                    "timings_ms": {
+                        **metrics.timings_ms,
+                        "admission_wait_ms": round(admission.wait_seconds * 1000, 2),
+                    },
+                }
+            )
+        }
+    )
+
+
+async def _watch_disconnect(request: Request, on_disconnect: Callable[[], None]) -> None:
+    while not await request.is_disconnected():
+        await asyncio.sleep(_DISCONNECT_POLL_SECONDS)
+    on_disconnect()
+
+
+def _require_admin(request: Request) -> None:
+    expected = get_settings().admin_token
+    provided = request.headers.get("x-admin-token", "")
+    if not expected or not hmac.compare_digest(provided.encode(), expected.encode()):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin token required.",
+        )
+
+
+def _profiled(compute: Callable[[], ScanResult], mode: str | None) -> Callable[[], ScanResult]:
+    if mode is None:
+        return compute
+
+    def run() -> ScanResult:
+        from app.engine.profiling import profile_run
+
+        settings = get_settings()
+        result, profile = profile_run(
+            compute,
+            mode=mode,
+            interval_seconds=settings.scan_profile_interval_ms / 1000,
+            max_samples=settings.scan_profile_max_samples,
+        )
+        _artifact_store().save_profile(result.run_id, profile)
+        return result
+
+    return run
+
+
+def _artifact_store() -> "RunArtifactStore":
+    from app.engine.artifacts import get_artifact_store
+
+    return get_artifact_store()
+
+
+def _run_store() -> "RunStore | None":
+    if not get_settings().scan_run_store_enabled:
+        return None
+    from app.engine.run_store import get_run_store
+
+    return get_run_store()
+
+
+def _client_identity(request: Request) -> str:
+    """Fair-share key: the caller's address. The API has no authenticated user to key on,
+    and a client-supplied header would let one caller claim any number of identities."""
+    return f"addr:{request.client.host if request.client else 'unknown'}"
+
+
+def _spill_lines(spilled: "SpilledScanInput", lines: list[bytes], lines_before: int) -> None:
+    settings = get_settings()
+    for line_number, line in enumerate(lines, start=lines_before + 1):
+        if not line.strip():
+            continue
+        try:
+            payload = PhotoItemPayload.model_validate_json(line)
+        except ValidationError as exc:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid photo item on line {line_number}.",
+            ) from exc
+        spilled.add(normalize_photo_items([payload])[0])
+        if spilled.item_count > settings.scan_stream_max_photos and settings.enforce_scan_limits:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=(
+                    f"Streamed scan exceeds max allowed {settings.scan_stream_max_photos} items."
+                ),
+            )
+
+
+async def _ndjson_lines(chunks: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[bytes]:
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            _check_line_length(line, max_line_bytes)
+            yield line
+        # A body without newlines would otherwise be buffered whole.
+        _check_line_length(pending, max_line_bytes)
+    if pending:
+        yield pending
+
+
+def _check_line_length(line: bytes, max_line_bytes: int) -> None:
+    if len(line) > max_line_bytes:
+        raise HTTPException(
+            status_code=_HTTP_413_CONTENT_TOO_LARGE,
+            detail=f"Streamed line exceeds {max_line_bytes} bytes.",
+        )
+
+
+def _without_groups(result: ScanResult) -> ScanResult:
+    return result.model_copy(
+        update={"groups_exact": [], "groups_very_similar": [], "groups_possibly_similar": []}
+    )
+
+
+def _encode_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(f"o:{offset}".encode("ascii")).decode("ascii")
+
+
+def _decode_cursor(cursor: str | None) -> int:
+    if cursor is None:
+        return 0
+    try:
+        decoded = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("ascii")
+        prefix, _, value = decoded.partition(":")
+        if prefix == "o" and int(value) >= 0:
+            return int(value)
+    except (binascii.Error, UnicodeError, ValueError):
+        pass
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor.")
+
+
+def _pick(value: int | None, default: int) -> int:
+    return default if value is None else value
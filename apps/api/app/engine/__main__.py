@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Any, TextIO
+
+from app.core.config import get_settings
+from app.engine.local import LocalScan, discover_files, read_manifest, scan_local
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.engine",
+        description="Scan a local image directory or manifest for duplicates.",
+    )
+    parser.add_argument("source", type=Path, help="directory to walk, or a manifest of paths")
+    parser.add_argument("--output", type=Path, default=None, help="write here instead of stdout")
+    parser.add_argument("--format", choices=["json", "ndjson"], default="json")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="decode/hash processes (default: all cores)",
+    )
+    args = parser.parse_args(argv)
+
+    if args.source.is_dir():
+        paths = discover_files(args.source)
+    elif args.source.is_file():
+        paths = read_manifest(args.source)
+    else:
+        parser.error(f"{args.source} is neither a directory nor a manifest file")
+
+    scan = scan_local(paths, get_settings(), workers=args.workers)
+    if args.output is None:
+        write_output(scan, sys.stdout, args.format)
+    else:
+        with args.output.open("w", encoding="utf-8") as handle:
+            write_output(scan, handle, args.format)
+
+
+def write_output(scan: LocalScan, stream: TextIO, output_format: str) -> None:
+    """JSON: one ``{result, items}`` document. NDJSON: the result, then one item per line."""
+    result = scan.result.model_dump(mode="json", by_alias=True)
+    records = [_item_record(scan, item.id) for item in scan.items]
+    if output_format == "ndjson":
+        stream.write(json.dumps(result) + "\n")
+        for record in records:
+            stream.write(json.dumps(record) + "\n")
+        return
+    json.dump({"result": result, "items": records}, stream)
+    stream.write("\n")
+
+
+def _item_record(scan: LocalScan, item_id: str) -> dict[str, Any]:
+    # Items never compared (alone in their candidate bucket) were never hashed.
+    hashes = scan.perceptual_hashes.get(item_id)
+    return {
+        "path": item_id,
+        "sha256": scan.byte_hashes.get(item_id),
+        "dhash": None if hashes is None else f"{hashes.dhash:016x}",
+        "phash": None if hashes is None or hashes.phash is None else f"{hashes.phash:016x}",
+    }
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+
+from app.core.config import get_settings
+
+# Weight of the newest run in the moving average used for wait estimates.
+_DURATION_SMOOTHING = 0.2
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after_seconds: int) -> None:
+        super().__init__(f"Scan not admitted ({reason}); retry in {retry_after_seconds}s.")
+        self.reason = reason
+        self.retry_after_seconds = retry_after_seconds
+
+
+@dataclass(frozen=True)
+class Admission:
+    queue_depth: int
+    wait_seconds: float
+    granted_at: float
+
+
+@dataclass
+class _Waiter:
+    user: str
+    loop: asyncio.AbstractEventLoop
+    future: asyncio.Future[None]
+    granted: bool = False
+
+
+class AdmissionController:
+    """Caps concurrently running scans per process and per user, queueing the rest.
+
+    Queued scans are granted round-robin across users (FIFO within a user), so one user's
+    burst cannot starve another user's single scan. The queue and the wait are both bounded;
+    rejections carry a wait estimate from the moving average of recent scan durations.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_concurrent: int,
+        max_per_user: int,
+        max_queue: int,
+        max_wait_seconds: float,
+        initial_scan_seconds: float = 5.0,
+    ) -> None:
+        self.max_concurrent = max(max_concurrent, 1)
+        self.max_per_user = max(max_per_user, 1)
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+        self._lock = threading.Lock()
+        self._running_by_user: defaultdict[str, int] = defaultdict(int)
+        # Insertion order is the round-robin order; a user who was just served moves to the back.
+        self._waiting: OrderedDict[str, deque[_Waiter]] = OrderedDict()
+        self._running_total = 0
+        self._queued_total = 0
+        self._mean_scan_seconds = initial_scan_seconds
+        self.rejected_count = 0
+
+    @property
+    def running(self) -> int:
+        return self._running_total
+
+    @property
+    def queued(self) -> int:
+        return self._queued_total
+
+    @asynccontextmanager
+    async def admit(self, user: str) -> AsyncIterator[Admission]:
+        admission = await self.acquire(user)
+        try:
+            yield admission
+        finally:
+            self.release(user, admission)
+
+    async def acquire(self, user: str) -> Admission:
+        """Wait for a slot for ``user``; every grant must be paired with ``release``."""
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._can_run(user):
+                self._start(user)
+                waiter = None
+                depth = 0
+            else:
+                if self._queued_total >= self.max_queue:
+                    self.rejected_count += 1
+                    raise AdmissionRejected("queue_full", self._estimate(self._queued_total))
+                waiter = _Waiter(user, loop, loop.create_future())
+                self._waiting.setdefault(user, deque()).append(waiter)
+                self._queued_total += 1
+                depth = self._queued_total
+        if waiter is not None:
+            await self._wait(waiter, depth)
+        granted_at = time.perf_counter()
+        return Admission(queue_depth=depth, wait_seconds=granted_at - start, granted_at=granted_at)
+
+    def release(self, user: str, admission: Admission) -> None:
+        self._finish(user, time.perf_counter() - admission.granted_at)
+
+    async def _wait(self, waiter: _Waiter, depth: int) -> None:
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.max_wait_seconds)
+        except BaseException as exc:
+            with self._lock:
+                granted = waiter.granted
+                if not granted:
+                    self._withdraw(waiter)
+            if granted and isinstance(exc, TimeoutError):
+                # The grant raced the timeout; the slot is ours, so use it.
+                return
+            if granted:
+                self._finish(waiter.user, None)
+            if isinstance(exc, TimeoutError):
+                with self._lock:
+                    self.rejected_count += 1
+                    estimate = self._estimate(depth)
+                raise AdmissionRejected("timeout", estimate) from None
+            raise
+
+    def _finish(self, user: str, duration_seconds: float | None) -> None:
+        with self._lock:
+            self._running_by_user[user] -= 1
+            if not self._running_by_user[user]:
+                del self._running_by_user[user]
+            self._running_total -= 1
+            if duration_seconds is not None:
+                self._mean_scan_seconds += _DURATION_SMOOTHING * (
+                    duration_seconds - self._mean_scan_seconds
+                )
+            self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self._running_total < self.max_concurrent:
+            user = next(
+                (user for user in self._waiting if self._can_run_user(user)),
+                None,
+            )
+            if user is None:
+                return
+            pending = self._waiting.pop(user)
+            waiter = pending.popleft()
+            if pending:
+                self._waiting[user] = pending
+            self._queued_total -= 1
+            waiter.granted = True
+            self._start(user)
+            waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+
+    def _withdraw(self, waiter: _Waiter) -> None:
+        pending = self._waiting.get(waiter.user)
+        if pending is None or waiter not in pending:
+            return
+        pending.remove(waiter)
+        if not pending:
+            del self._waiting[waiter.user]
+        self._queued_total -= 1
+
+    def _can_run(self, user: str) -> bool:
+        return self._running_total < self.max_concurrent and self._can_run_user(user)
+
+    def _can_run_user(self, user: str) -> bool:
+        return self._running_by_user.get(user, 0) < self.max_per_user
+
+    def _start(self, user: str) -> None:
+        self._running_by_user[user] += 1
+        self._running_total += 1
+
+    def _estimate(self, ahead: int) -> int:
+        rounds = ahead / self.max_concurrent + 1
+        return max(math.ceil(rounds * self._mean_scan_seconds), 1)
+
+
+def _resolve(future: asyncio.Future[None]) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+@lru_cache
+def get_admission_controller() -> AdmissionController:
+    settings = get_settings()
+    return AdmissionController(
+        max_concurrent=settings.scan_admission_max_concurrent,
+        max_per_user=settings.scan_admission_max_per_user,
+        max_queue=settings.scan_admission_queue_size,
+        max_wait_seconds=settings.scan_admission_max_wait_seconds,
+    )
@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import json
+import zlib
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+from typing import Any
+
+from app.core.config import get_settings
+from app.engine.cache import CacheBackend, build_cache_backend
+from app.engine.grouping import (
+    PairDistance,
+    SimilarityThresholds,
+    VerificationPolicy,
+    classify_pair_distances,
+)
+from app.engine.hashing import PerceptualHashes
+from app.engine.models import GPSLocation, PhotoItem
+from app.engine.profiling import RunProfile
+from app.engine.schemas import GroupResult, ScanResult, ScanSummary
+
+GROUP_CATEGORIES = ("EXACT", "VERY_SIMILAR", "POSSIBLY_SIMILAR")
+# Groups are stored in chunks of this many so a page decompresses only the chunks it spans.
+GROUPS_PER_CHUNK = 100
+
+
+@dataclass(frozen=True)
+class RegroupArtifact:
+    items: list[PhotoItem]
+    hashes: dict[str, PerceptualHashes]
+    distances: list[PairDistance]
+
+
+class RunArtifactStore:
+    """Short-lived per-run artifacts, stored compactly in a cache backend with a TTL."""
+
+    def __init__(self, backend: CacheBackend, ttl_seconds: int) -> None:
+        self._backend = backend
+        self._ttl_seconds = ttl_seconds
+
+    def save_regroup(self, run_id: str, artifact: RegroupArtifact) -> None:
+        index = {item.id: position for position, item in enumerate(artifact.items)}
+        payload = {
+            "items": [_encode_item(item) for item in artifact.items],
+            "hashes": [
+                [index[item_id], hashes.dhash, hashes.phash]
+                for item_id, hashes in artifact.hashes.items()
+                if item_id in index
+            ],
+            "distances": [
+                [
+                    index[distance.left],
+                    index[distance.right],
+                    distance.dhash,
+                    distance.phash,
+                    distance.score,
+                ]
+                for distance in artifact.distances
+            ],
+        }
+        self._backend.set(self._key("regroup", run_id), _dumps(payload), self._ttl_seconds)
+
+    def load_regroup(self, run_id: str) -> RegroupArtifact | None:
+        raw = self._backend.get(self._key("regroup", run_id))
+        if raw is None:
+            return None
+        payload = json.loads(raw)
+        items = [_decode_item(entry) for entry in payload["items"]]
+        return RegroupArtifact(
+            items=items,
+            hashes={
+                items[position].id: PerceptualHashes(dhash=dhash, phash=phash)
+                for position, dhash, phash in payload["hashes"]
+            },
+            distances=[
+                PairDistance(
+                    left=items[left].id,
+                    right=items[right].id,
+                    dhash=dhash,
+                    phash=phash,
+                    # Artifacts written before pixel verification have no score.
+                    score=score[0] if score else None,
+                )
+                for left, right, dhash, phash, *score in payload["distances"]
+            ],
+        )
+
+    def regroup(
+        self,
+        run_id: str,
+        thresholds: SimilarityThresholds,
+        verification: VerificationPolicy | None = None,
+    ) -> tuple[list[GroupResult], list[GroupResult], int] | None:
+        """Reclassify stored distances; only pairs scored during the scan can be verified."""
+        artifact = self.load_regroup(run_id)
+        if artifact is None:
+            return None
+        id_to_item = {item.id: item for item in artifact.items}
+        groups_very, groups_possible = classify_pair_distances(
+            artifact.distances,
+            id_to_item,
+            thresholds,
+            verification=verification,
+        )
+        return groups_very, groups_possible, len(artifact.distances)
+
+    def save_result(self, result: ScanResult) -> None:
+        """Store a run's summary and its groups in per-category chunks that load independently."""
+        groups = _groups_by_category(result)
+        summary = ScanSummary(
+            runId=result.run_id,
+            inputCount=result.input_count,
+            stageMetrics=result.stage_metrics,
+            costEstimate=result.cost_estimate,
+            coverage=result.coverage,
+            groupCounts={category: len(entries) for category, entries in groups.items()},
+        )
+        for category, entries in groups.items():
+            for chunk in range(0, len(entries), GROUPS_PER_CHUNK):
+                payload = [
+                    entry.model_dump(mode="json", by_alias=True)
+                    for entry in entries[chunk : chunk + GROUPS_PER_CHUNK]
+                ]
+                self._backend.set(
+                    self._chunk_key(result.run_id, category, chunk // GROUPS_PER_CHUNK),
+                    zlib.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8")),
+                    self._ttl_seconds,
+                )
+        # The summary is written last so a visible summary implies its group pages exist.
+        self._backend.set(
+            self._key("summary", result.run_id),
+            zlib.compress(summary.model_dump_json(by_alias=True).encode("utf-8")),
+            self._ttl_seconds,
+        )
+
+    def load_summary(self, run_id: str) -> ScanSummary | None:
+        raw = self._backend.get(self._key("summary", run_id))
+        if raw is None:
+            return None
+        return ScanSummary.model_validate_json(zlib.decompress(raw))
+
+    def load_group_chunk(self, run_id: str, category: str, chunk: int) -> list[GroupResult] | None:
+        raw = self._backend.get(self._chunk_key(run_id, category, chunk))
+        if raw is None:
+            return None
+        return [GroupResult.model_validate(entry) for entry in json.loads(zlib.decompress(raw))]
+
+    def page_groups(
+        self,
+        run_id: str,
+        category: str | None,
+        offset: int,
+        limit: int,
+    ) -> tuple[list[GroupResult], int] | None:
+        """Return one page in stored order (EXACT, VERY_SIMILAR, POSSIBLY_SIMILAR) and the total.
+
+        ``None`` when the run is unknown or a chunk the summary counts has been evicted.
+        """
+        summary = self.load_summary(run_id)
+        if summary is None:
+            return None
+        categories = GROUP_CATEGORIES if category is None else (category,)
+        page: list[GroupResult] = []
+        total = 0
+        for name in categories:
+            count = summary.group_counts.get(name, 0)
+            start = max(offset - total, 0)
+            end = min(offset + limit - total, count)
+            # Only chunks overlapping the page are read and decoded.
+            first_chunk = start // GROUPS_PER_CHUNK
+            last_chunk = (end - 1) // GROUPS_PER_CHUNK if start < end else first_chunk - 1
+            for chunk in range(first_chunk, last_chunk + 1):
+                entries = self.load_group_chunk(run_id, name, chunk)
+                if entries is None:
+                    return None
+                chunk_start = chunk * GROUPS_PER_CHUNK
+                page.extend(entries[max(start - chunk_start, 0) : end - chunk_start])
+            total += count
+        return page, total
+
+    def save_profile(self, run_id: str, profile: RunProfile) -> None:
+        self._backend.set(
+            self._key("profile:collapsed", run_id),
+            zlib.compress(profile.collapsed.encode("utf-8")),
+            self._ttl_seconds,
+        )
+        if profile.pstats is not None:
+            self._backend.set(
+                self._key("profile:pstats", run_id),
+                zlib.compress(profile.pstats),
+                self._ttl_seconds,
+            )
+
+    def load_profile(self, run_id: str, profile_format: str) -> bytes | None:
+        """The stored ``collapsed`` stacks or ``pstats`` dump for a profiled run."""
+        raw = self._backend.get(self._key(f"profile:{profile_format}", run_id))
+        return None if raw is None else zlib.decompress(raw)
+
+    def _key(self, kind: str, run_id: str) -> str:
+        return f"photoprune:run:{run_id}:{kind}"
+
+    def _chunk_key(self, run_id: str, category: str, chunk: int) -> str:
+        return self._key(f"groups:{category.lower()}:{chunk}", run_id)
+
+
+@lru_cache
+def get_artifact_store() -> RunArtifactStore:
+    settings = get_settings()
+    return RunArtifactStore(
+        build_cache_backend(settings, max_bytes=settings.scan_artifact_memory_max_bytes),
+        settings.scan_artifact_ttl_seconds,
+    )
+
+
+def _groups_by_category(result: ScanResult) -> dict[str, list[GroupResult]]:
+    return {
+        "EXACT": result.groups_exact,
+        "VERY_SIMILAR": result.groups_very_similar,
+        "POSSIBLY_SIMILAR": result.groups_possibly_similar,
+    }
+
+
+def _dumps(payload: dict[str, Any]) -> bytes:
+    return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+
+def _encode_item(item: PhotoItem) -> list[Any]:
+    # Download URLs expire and are never persisted.
+    return [
+        item.id,
+        item.create_time.isoformat(),
+        item.filename,
+        item.mime_type,
+        item.width,
+        item.height,
+        None if item.gps is None else [item.gps.latitude, item.gps.longitude],
+        item.deep_link,
+    ]
+
+
+def _decode_item(entry: list[Any]) -> PhotoItem:
+    item_id, create_time, filename, mime_type, width, height, gps, deep_link = entry
+    return PhotoItem(
+        id=item_id,
+        create_time=datetime.fromisoformat(create_time),
+        filename=filename,
+        mime_type=mime_type,
+        width=width,
+        height=height,
+        gps=None if gps is None else GPSLocation(latitude=gps[0], longitude=gps[1]),
+        download_url=None,
+        deep_link=deep_link,
+    )
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import time
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass, field, replace
+
+from app.core.config import Settings
+from app.engine.models import PhotoItem
+
+# Photos taken within roughly this many seconds of each other are the likeliest duplicates.
+_BURST_SECONDS = 30.0
+# Absorbs float error when a budget is exactly the sum of stage predictions.
+_COST_EPSILON = 1e-9
+
+
+@dataclass(frozen=True)
+class ScanBudget:
+    max_cost: float | None = None
+    deadline_seconds: float | None = None
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def is_bounded(self) -> bool:
+        return self.max_cost is not None or self.deadline_seconds is not None
+
+    def restarted(self) -> ScanBudget:
+        """The same limits with the deadline clock starting now, e.g. once a queued scan is
+        admitted."""
+        return replace(self, started_at=time.monotonic())
+
+    def deadline_passed(self) -> bool:
+        if self.deadline_seconds is None:
+            return False
+        return time.monotonic() - self.started_at >= self.deadline_seconds
+
+
+@dataclass(frozen=True)
+class CandidateSetPlan:
+    items: list[PhotoItem]
+    predicted_cost: float
+    expected_yield: float
+
+    @property
+    def priority(self) -> float:
+        if self.predicted_cost <= 0:
+            return self.expected_yield
+        return self.expected_yield / self.predicted_cost
+
+
+def plan_candidate_sets(
+    candidate_sets: Sequence[list[PhotoItem]],
+    settings: Settings,
+) -> list[CandidateSetPlan]:
+    plans = [
+        CandidateSetPlan(
+            items=group,
+            predicted_cost=predict_candidate_set_cost(group, settings),
+            expected_yield=expected_duplicate_yield(group),
+        )
+        for group in candidate_sets
+    ]
+    order = sorted(range(len(plans)), key=lambda index: (-plans[index].priority, index))
+    return [plans[index] for index in order]
+
+
+def select_within_budget(
+    plans: Sequence[CandidateSetPlan],
+    max_cost: float | None,
+) -> tuple[list[CandidateSetPlan], list[CandidateSetPlan]]:
+    if max_cost is None:
+        return list(plans), []
+    remaining = max_cost
+    admitted: list[CandidateSetPlan] = []
+    skipped: list[CandidateSetPlan] = []
+    for plan in plans:
+        if plan.predicted_cost <= remaining + _COST_EPSILON:
+            admitted.append(plan)
+            remaining -= plan.predicted_cost
+        else:
+            skipped.append(plan)
+    return admitted, skipped
+
+
+def predict_candidate_set_cost(group: Sequence[PhotoItem], settings: Settings) -> float:
+    downloadable = sum(1 for item in group if item.download_url is not None)
+    comparisons = downloadable * (downloadable - 1) // 2
+    return (
+        downloadable * (settings.scan_cost_per_download + settings.scan_cost_per_perceptual_hash)
+        + comparisons * settings.scan_cost_per_comparison
+    )
+
+
+def predict_prefilter_cost(items: Sequence[PhotoItem], settings: Settings) -> float:
+    # A size probe and at most two range requests, then one partial hash, per item.
+    return len(items) * (
+        3 * settings.scan_cost_per_partial_request + settings.scan_cost_per_partial_hash
+    )
+
+
+def predict_exact_stage_cost(items: Sequence[PhotoItem], settings: Settings) -> float:
+    return len(items) * (settings.scan_cost_per_download + settings.scan_cost_per_byte_hash)
+
+
+def fit_within_budget(
+    candidate_sets: Sequence[list[PhotoItem]],
+    max_cost: float | None,
+    predict: Callable[[Sequence[PhotoItem]], float],
+) -> tuple[list[list[PhotoItem]], float, int]:
+    """Admit whole sets in order while they fit; returns them, their cost and the skip count."""
+    if max_cost is None:
+        return list(candidate_sets), sum(predict(group) for group in candidate_sets), 0
+    admitted: list[list[PhotoItem]] = []
+    spent = 0.0
+    skipped = 0
+    for group in candidate_sets:
+        cost = predict(group)
+        if spent + cost <= max_cost + _COST_EPSILON:
+            admitted.append(group)
+            spent += cost
+        else:
+            skipped += 1
+    return admitted, spent, skipped
+
+
+def expected_duplicate_yield(group: Sequence[PhotoItem]) -> float:
+    ordered = sorted(
+        (item for item in group if item.download_url is not None),
+        key=lambda entry: (entry.create_time, entry.id),
+    )
+    score = 0.0
+    for previous, current in zip(ordered, ordered[1:], strict=False):
+        gap = abs((current.create_time - previous.create_time).total_seconds())
+        score += 1.0 / (1.0 + gap / _BURST_SECONDS)
+    return score
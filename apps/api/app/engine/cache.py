@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Sequence
+from functools import lru_cache
+from typing import Any, Protocol
+
+from app.core.config import Settings, get_settings
+from app.engine.budget import ScanBudget
+from app.engine.models import PhotoItem
+from app.engine.redis_client import redis_client
+from app.engine.schemas import ScanResult
+from app.engine.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+class CacheBackend(Protocol):
+    def get(self, key: str) -> bytes | None: ...
+
+    def set(self, key: str, value: bytes, ttl_seconds: int) -> None: ...
+
+
+class MemoryCacheBackend:
+    """In-process LRU bounded by the total size of stored values."""
+
+    def __init__(self, max_bytes: int) -> None:
+        self._max_bytes = max_bytes
+        self._entries: OrderedDict[str, tuple[bytes, float]] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def size_bytes(self) -> int:
+        return self._size
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._evict(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, ttl_seconds: int) -> None:
+        if len(value) > self._max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._evict(key)
+            self._entries[key] = (value, time.monotonic() + ttl_seconds)
+            self._size += len(value)
+            while self._size > self._max_bytes:
+                oldest = next(iter(self._entries))
+                self._evict(oldest)
+
+    def _evict(self, key: str) -> None:
+        value, _ = self._entries.pop(key)
+        self._size -= len(value)
+
+
+class RedisCacheBackend:
+    """Redis-backed cache that degrades to a local backend when Redis is unavailable."""
+
+    def __init__(self, client: Any, fallback: CacheBackend) -> None:
+        self._client = client
+        self._fallback = fallback
+
+    def get(self, key: str) -> bytes | None:
+        try:
+            value = self._client.get(key)
+        except Exception as exc:  # pragma: no cover - depends on a live Redis
+            logger.warning("Redis cache read failed; using local cache: %s", exc)
+            return self._fallback.get(key)
+        return value if isinstance(value, bytes) else None
+
+    def set(self, key: str, value: bytes, ttl_seconds: int) -> None:
+        try:
+            self._client.set(key, value, ex=ttl_seconds)
+        except Exception as exc:  # pragma: no cover - depends on a live Redis
+            logger.warning("Redis cache write failed; using local cache: %s", exc)
+            self._fallback.set(key, value, ttl_seconds)
+
+
+def build_cache_backend(settings: Settings, *, max_bytes: int | None = None) -> CacheBackend:
+    memory = MemoryCacheBackend(
+        settings.scan_cache_memory_max_bytes if max_bytes is None else max_bytes
+    )
+    if settings.scan_cache_backend == "memory":
+        return memory
+    client = redis_client(
+        settings,
+        fallback="using in-process scan cache",
+        required=settings.scan_cache_backend == "redis",
+    )
+    if client is None:
+        return memory
+    return RedisCacheBackend(client, memory)
+
+
+class ScanResultCache:
+    def __init__(self, backend: CacheBackend, ttl_seconds: int, namespace: str = "scan") -> None:
+        self._backend = backend
+        self._ttl_seconds = ttl_seconds
+        self._namespace = namespace
+        self._inflight: SingleFlight[ScanResult] = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key: str) -> ScanResult | None:
+        cached = self._load(key)
+        if cached is not None:
+            self.hits += 1
+        return cached
+
+    def get_or_compute(self, key: str, compute: Callable[[], ScanResult]) -> ScanResult:
+        cached = self.lookup(key)
+        if cached is not None:
+            return cached
+        return self._inflight.do(key, lambda: self._compute_and_store(key, compute))
+
+    def _compute_and_store(self, key: str, compute: Callable[[], ScanResult]) -> ScanResult:
+        # A concurrent leader may have finished between our miss and acquiring the flight.
+        cached = self._load(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+        result = compute()
+        if result.coverage is None or result.coverage.complete:
+            self._backend.set(
+                self._storage_key(key),
+                result.model_dump_json(by_alias=True).encode("utf-8"),
+                self._ttl_seconds,
+            )
+        return result
+
+    def _load(self, key: str) -> ScanResult | None:
+        payload = self._backend.get(self._storage_key(key))
+        if payload is None:
+            return None
+        return ScanResult.model_validate_json(payload)
+
+    def _storage_key(self, key: str) -> str:
+        return f"photoprune:{self._namespace}:{key}"
+
+
+@lru_cache
+def get_scan_cache() -> ScanResultCache:
+    settings = get_settings()
+    return ScanResultCache(build_cache_backend(settings), settings.scan_cache_ttl_seconds)
+
+
+def scan_cache_key(
+    items: Sequence[PhotoItem],
+    settings: Settings,
+    budget: ScanBudget | None = None,
+) -> str:
+    """Digest of everything that determines a scan's result; download URLs are excluded."""
+    canonical_items = sorted(
+        (
+            item.id,
+            item.create_time.isoformat(),
+            item.filename,
+            item.mime_type,
+            item.width,
+            item.height,
+            None if item.gps is None else (item.gps.latitude, item.gps.longitude),
+            item.download_url is not None,
+            item.deep_link,
+        )
+        for item in items
+    )
+    payload = {
+        "items": canonical_items,
+        "settings": {
+            name: getattr(settings, name)
+            for name in sorted(Settings.model_fields)
+            if name.startswith("scan_") and name not in _CACHE_KEY_EXCLUDED_SETTINGS
+        },
+        "budget": None if budget is None else [budget.max_cost, budget.deadline_seconds],
+    }
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+_CACHE_KEY_EXCLUDED_SETTINGS = frozenset(
+    {
+        "scan_max_photos",
+        "scan_consent_threshold",
+        "scan_stream_max_photos",
+        "scan_stream_max_line_bytes",
+        "scan_spill_run_items",
+        "scan_spill_dir",
+        "scan_deadline_seconds",
+        "scan_decode_budget_bytes",
+        "scan_profile_interval_ms",
+        "scan_profile_max_samples",
+        "scan_admission_max_concurrent",
+        "scan_admission_max_per_user",
+        "scan_admission_queue_size",
+        "scan_admission_max_wait_seconds",
+        "scan_download_concurrency",
+        "scan_hash_concurrency",
+        "scan_pipeline_queue_size",
+        "scan_schedule_policy",
+        "scan_memory_tracking",
+        "scan_cache_enabled",
+        "scan_cache_backend",
+        "scan_cache_ttl_seconds",
+        "scan_cache_memory_max_bytes",
+        "scan_artifact_ttl_seconds",
+        "scan_artifact_memory_max_bytes",
+        "scan_cost_per_worker_second",
+        "scan_cost_model_enabled",
+        "scan_cost_model_window",
+        "scan_cost_model_path",
+        "scan_warm_up",
+        "scan_coalesce_enabled",
+        "scan_coalesce_backend",
+        "scan_coalesce_lock_ttl_seconds",
+        "scan_run_store_enabled",
+        "scan_run_store_batch_size",
+        "scan_run_store_flush_interval_seconds",
+        "scan_run_store_max_pending",
+    }
+)
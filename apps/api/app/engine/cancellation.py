@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+
+
+class ScanCancelled(Exception):
+    def __init__(self, reason: str) -> None:
+        super().__init__(f"Scan cancelled ({reason}).")
+        self.reason = reason
+
+
+class CancellationToken:
+    """Cooperative cancellation shared by every stage of one scan.
+
+    ``cancel()`` fires registered callbacks (used to abort in-flight requests). A passed
+    deadline cancels the token with reason ``deadline`` the next time anyone checks it.
+    """
+
+    def __init__(self, deadline_seconds: float | None = None) -> None:
+        self._deadline = None if deadline_seconds is None else time.monotonic() + deadline_seconds
+        self._lock = threading.Lock()
+        self._callbacks: dict[int, Callable[[], None]] = {}
+        self._next_callback = 0
+        self.reason: str | None = None
+
+    @property
+    def cancelled(self) -> bool:
+        deadline = self._deadline
+        if self.reason is None and deadline is not None and time.monotonic() >= deadline:
+            self.cancel("deadline")
+        return self.reason is not None
+
+    def start_deadline(self, deadline_seconds: float | None) -> None:
+        """Start the deadline now, unless one is already running."""
+        if deadline_seconds is not None and self._deadline is None:
+            self._deadline = time.monotonic() + deadline_seconds
+
+    def remaining_seconds(self) -> float | None:
+        if self._deadline is None:
+            return None
+        return max(self._deadline - time.monotonic(), 0.0)
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        with self._lock:
+            if self.reason is not None:
+                return
+            self.reason = reason
+            callbacks = list(self._callbacks.values())
+            self._callbacks.clear()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def propagate_to(self, other: CancellationToken) -> None:
+        """Cancel ``other`` with the same reason whenever this token is cancelled."""
+        with self._lock:
+            if self.reason is None:
+                self._callbacks[self._allocate_handle()] = lambda: other.cancel(
+                    self.reason or "cancelled"
+                )
+                return
+        other.cancel(self.reason)
+
+    def raise_if_cancelled(self) -> None:
+        if self.cancelled:
+            raise ScanCancelled(self.reason or "cancelled")
+
+    @contextmanager
+    def on_cancel(self, callback: Callable[[], None]) -> Iterator[None]:
+        """Run ``callback`` if the token is cancelled while the block is executing."""
+        with self._lock:
+            handle = self._allocate_handle()
+            self._callbacks[handle] = callback
+        try:
+            self.raise_if_cancelled()
+            yield
+        finally:
+            with self._lock:
+                self._callbacks.pop(handle, None)
+
+    def _allocate_handle(self) -> int:
+        handle = self._next_callback
+        self._next_callback += 1
+        return handle
+
+
+class SharedCancellation:
+    """One token per key (one in-flight scan), cancelled only once every request holding it
+    has disconnected. Tokens start without a deadline; the scan starts it once admitted."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._entries: dict[str, _SharedEntry] = {}
+
+    @contextmanager
+    def hold(self, key: str) -> Iterator[_Holder]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.token.reason is not None:
+                entry = _SharedEntry(CancellationToken())
+                self._entries[key] = entry
+            entry.holders += 1
+        holder = _Holder(self, entry)
+        try:
+            yield holder
+        finally:
+            with self._lock:
+                entry.holders -= 1
+                if holder.abandoned:
+                    entry.abandoned -= 1
+                if entry.holders == 0 and self._entries.get(key) is entry:
+                    del self._entries[key]
+
+    def _abandon(self, entry: _SharedEntry) -> None:
+        with self._lock:
+            entry.abandoned += 1
+            cancel = entry.abandoned >= entry.holders
+        if cancel:
+            entry.token.cancel("disconnected")
+
+
+class _SharedEntry:
+    def __init__(self, token: CancellationToken) -> None:
+        self.token = token
+        self.holders = 0
+        self.abandoned = 0
+
+
+class _Holder:
+    def __init__(self, owner: SharedCancellation, entry: _SharedEntry) -> None:
+        self._owner = owner
+        self._entry = entry
+        self.abandoned = False
+
+    @property
+    def token(self) -> CancellationToken:
+        return self._entry.token
+
+    def abandon(self) -> None:
+        if not self.abandoned:
+            self.abandoned = True
+            self._owner._abandon(self._entry)
@@ -1,15 +1,24 @@
 from __future__ import annotations
 
+import re
 from collections import defaultdict
 from collections.abc import Sequence
+from pathlib import PurePosixPath
 
+from app.engine import geohash
 from app.engine.models import PhotoItem
 
+_COPY_SUFFIX = re.compile(r"(?:[ _-]?\(\d+\)|[ _-]copy(?:[ _-]?\d+)?|~\d+)$")
 
-def build_candidate_sets(items: Sequence[PhotoItem]) -> list[list[PhotoItem]]:
+
+def build_candidate_sets(
+    items: Sequence[PhotoItem],
+    *,
+    dihedral: bool = False,
+) -> list[list[PhotoItem]]:
     buckets: dict[str, list[PhotoItem]] = defaultdict(list)
     for item in items:
-        buckets[_bucket_key(item)].append(item)
+        buckets[candidate_bucket_key(item, dihedral=dihedral)].append(item)
     candidate_sets: list[list[PhotoItem]] = []
     for key in sorted(buckets.keys()):
         bucket_items = sorted(
@@ -21,9 +30,105 @@ def build_candidate_sets(items: Sequence[PhotoItem]) -> list[list[PhotoItem]]:
     return candidate_sets
 
 
-def _bucket_key(item: PhotoItem) -> str:
+def refine_by_location(
+    candidate_sets: Sequence[list[PhotoItem]],
+    precision: int,
+) -> list[list[PhotoItem]]:
+    """Split candidate sets into geohash neighbourhoods (a cell plus its eight neighbours).
+
+    Items without GPS join every neighbourhood of their set so they are still compared with
+    everything; sets with fewer than two distinct cells are kept as they are.
+    """
+    if precision <= 0:
+        return [list(group) for group in candidate_sets]
+    refined: list[list[PhotoItem]] = []
+    for group in candidate_sets:
+        cells: dict[str, list[PhotoItem]] = defaultdict(list)
+        unlocated: list[PhotoItem] = []
+        for item in group:
+            if item.gps is None:
+                unlocated.append(item)
+            else:
+                cell = geohash.encode(item.gps.latitude, item.gps.longitude, precision)
+                cells[cell].append(item)
+        if len(cells) <= 1:
+            refined.append(list(group))
+            continue
+        seen: set[frozenset[str]] = set()
+        for cell in sorted(cells):
+            members = [
+                item
+                for neighbour in (cell, *geohash.neighbours(cell))
+                for item in cells.get(neighbour, [])
+            ]
+            members.extend(unlocated)
+            member_ids = frozenset(item.id for item in members)
+            if len(members) < 2 or member_ids in seen:
+                continue
+            seen.add(member_ids)
+            refined.append(sorted(members, key=lambda entry: (entry.create_time, entry.id)))
+    return refined
+
+
+def build_exact_candidate_sets(
+    items: Sequence[PhotoItem],
+    *,
+    match_filename_stem: bool = False,
+) -> list[list[PhotoItem]]:
+    """Bucket items that could be byte-identical; items alone in their bucket are dropped.
+
+    Items missing width, height or mime type are only bucketed with each other. Matching the
+    filename stem is opt-in: a renamed byte-identical copy lands in its own bucket and is
+    never byte-hashed.
+    """
+    buckets: dict[tuple[object, ...], list[PhotoItem]] = defaultdict(list)
+    unknown: list[PhotoItem] = []
+    for item in items:
+        key = exact_bucket_key(item, match_filename_stem=match_filename_stem)
+        if key is None:
+            unknown.append(item)
+            continue
+        buckets[key].append(item)
+    candidate_sets = [
+        bucket for _, bucket in sorted(buckets.items(), key=_sort_key) if len(bucket) >= 2
+    ]
+    if len(unknown) >= 2:
+        candidate_sets.append(unknown)
+    return candidate_sets
+
+
+def exact_bucket_key(
+    item: PhotoItem,
+    *,
+    match_filename_stem: bool = False,
+) -> tuple[object, ...] | None:
+    if not item.width or not item.height or not item.mime_type:
+        return None
+    key: tuple[object, ...] = (item.width, item.height, item.mime_type.lower())
+    if match_filename_stem:
+        key = (*key, _filename_stem(item.filename))
+    return key
+
+
+def _sort_key(entry: tuple[tuple[object, ...], list[PhotoItem]]) -> str:
+    return repr(entry[0])
+
+
+def _filename_stem(filename: str | None) -> str | None:
+    if not filename:
+        return None
+    stem = PurePosixPath(filename.strip().lower()).stem
+    return _COPY_SUFFIX.sub("", stem) or stem
+
+
+def candidate_bucket_key(item: PhotoItem, *, dihedral: bool = False) -> str:
+    """Date, aspect-ratio class and resolution. With ``dihedral`` the ratio is taken from the
+    long and short sides, so a copy rotated by 90° shares its original's bucket."""
     date_key = item.create_time.date().isoformat()
-    ratio_key = _aspect_ratio_class(item.width, item.height)
+    width, height = item.width, item.height
+    if dihedral and width and height:
+        width, height = max(width, height), min(width, height)
+    ratio_key = _aspect_ratio_class(width, height)
     resolution_key = _resolution_bucket(item.width, item.height)
     return f"{date_key}:{ratio_key}:{resolution_key}"
 
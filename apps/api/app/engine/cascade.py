@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+from collections.abc import Sequence
+
+from app.engine.grouping import SimilarityThresholds
+from app.engine.hashing import HashingService, PerceptualHashes, dhash_distance
+from app.engine.models import PhotoItem
+
+
+class LazyPerceptualHasher:
+    """Computes dHash for every member and pHash only for items in an inconclusive pair.
+
+    A pair is settled by dHash alone when its distance is within ``dhash_very`` (already
+    the strongest category). Any other pair could still match on pHash, so both items get
+    their pHash, unless an opt-in ``dhash_cutoff`` treats pairs beyond it as unrelated.
+    """
+
+    def __init__(
+        self,
+        hashing_service: HashingService,
+        thresholds: SimilarityThresholds,
+        *,
+        dhash_cutoff: int | None = None,
+    ) -> None:
+        self._hashing_service = hashing_service
+        self._thresholds = thresholds
+        self._dhash_cutoff = (
+            None if dhash_cutoff is None else max(dhash_cutoff, thresholds.dhash_very)
+        )
+
+    def __call__(self, items: Sequence[PhotoItem]) -> dict[str, PerceptualHashes]:
+        hashes = {item.id: self._hashing_service.get_dhash(item) for item in items}
+        needs_phash: set[str] = set()
+        for i, left in enumerate(items):
+            for right in items[i + 1 :]:
+                if self.is_inconclusive(hashes[left.id], hashes[right.id]):
+                    needs_phash.update((left.id, right.id))
+        for item in items:
+            if item.id in needs_phash:
+                hashes[item.id] = self._hashing_service.complete_phash(item)
+        return hashes
+
+    def is_inconclusive(self, left: PerceptualHashes, right: PerceptualHashes) -> bool:
+        distance = dhash_distance(left, right)
+        if distance <= self._thresholds.dhash_very:
+            return False
+        return self._dhash_cutoff is None or distance <= self._dhash_cutoff
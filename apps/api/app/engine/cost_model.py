@@ -0,0 +1,387 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import queue
+import threading
+import zlib
+from collections.abc import Iterable, Mapping, Sequence
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Protocol
+from urllib.parse import urlparse
+
+from app.core.config import Settings, get_settings
+from app.engine.candidates import (
+    build_candidate_sets,
+    build_exact_candidate_sets,
+    refine_by_location,
+)
+from app.engine.models import PhotoItem
+from app.engine.redis_client import redis_client
+from app.engine.schemas import OperationEstimate, ScanEstimate
+
+logger = logging.getLogger(__name__)
+
+OPERATIONS = ("size_probe", "download", "perceptual_hash", "comparison")
+# Used until an operation has been observed at any level of the segment hierarchy.
+PRIOR_SECONDS = {
+    "size_probe": 0.05,
+    "download": 0.25,
+    "perceptual_hash": 0.05,
+    "comparison": 0.000005,
+}
+ANY = "*"
+_ANY_SEGMENT = f"{ANY}|{ANY}|{ANY}"
+_MEGAPIXEL_EDGES = (1, 4, 12, 24, 48)
+_STORE_KEY = "photoprune:cost-model:v1"
+_MAX_PENDING_BATCHES = 256
+
+
+@dataclass
+class OperationStats:
+    count: int = 0
+    mean_seconds: float = 0.0
+
+    def add(self, seconds: float, window: int) -> None:
+        # A plain mean until ``window`` observations, then an EWMA that follows drift.
+        self.count += 1
+        self.mean_seconds += (seconds - self.mean_seconds) / min(self.count, window)
+
+
+@dataclass(frozen=True)
+class Observation:
+    operation: str
+    segment: str
+    seconds: float
+
+
+class CostModel:
+    """Per-operation seconds learned from completed runs, by mime type, megapixels and host.
+
+    Every observation also updates the coarser ``mime|megapixels|*`` and ``*|*|*`` segments,
+    which serve lookups for segments that have not been seen yet.
+    """
+
+    def __init__(
+        self,
+        stats: Mapping[str, OperationStats] | None = None,
+        *,
+        window: int = 500,
+    ) -> None:
+        self._stats: dict[str, OperationStats] = dict(stats or {})
+        self._window = max(window, 1)
+
+    def observe(self, observation: Observation) -> None:
+        for segment in _generalizations(observation.segment):
+            stats = self._stats.setdefault(f"{observation.operation}|{segment}", OperationStats())
+            stats.add(observation.seconds, self._window)
+
+    def seconds(self, operation: str, segment: str) -> float:
+        for candidate in _generalizations(segment):
+            stats = self._stats.get(f"{operation}|{candidate}")
+            if stats is not None and stats.count:
+                return stats.mean_seconds
+        return PRIOR_SECONDS[operation]
+
+    def observation_count(self, operation: str) -> int:
+        stats = self._stats.get(f"{operation}|{_ANY_SEGMENT}")
+        return 0 if stats is None else stats.count
+
+    def estimate(self, items: Sequence[PhotoItem], settings: Settings) -> ScanEstimate:
+        """Predict a scan's duration and cost from item metadata alone, before any download."""
+        downloadable = [item for item in items if item.download_url is not None]
+        exact_items = [
+            item
+            for group in build_exact_candidate_sets(
+                downloadable, match_filename_stem=settings.scan_exact_match_filename_stem
+            )
+            for item in group
+        ]
+        candidate_sets = [
+            [item for item in group if item.download_url is not None]
+            for group in refine_by_location(
+                build_candidate_sets(list(items), dihedral=settings.scan_dihedral_invariant),
+                settings.scan_geohash_precision,
+            )
+        ]
+        hashed = list({item.id: item for group in candidate_sets for item in group}.values())
+        # Which exact candidates survive the prefilter is only known after probing, so every
+        # one of them is assumed to be downloaded in full.
+        downloaded = list({item.id: item for item in [*hashed, *exact_items]}.values())
+        probed = exact_items if settings.scan_exact_prefilter_enabled else []
+        comparisons = sum(len(group) * (len(group) - 1) // 2 for group in candidate_sets)
+
+        seconds = {
+            "size_probe": sum(self.seconds("size_probe", segment_of(item)) for item in probed),
+            "download": sum(self.seconds("download", segment_of(item)) for item in downloaded),
+            "perceptual_hash": sum(
+                self.seconds("perceptual_hash", segment_of(item)) for item in hashed
+            ),
+            "comparison": comparisons * self.seconds("comparison", _ANY_SEGMENT),
+        }
+        operation_counts = {
+            "size_probe": len(probed),
+            "download": len(downloaded),
+            "perceptual_hash": len(hashed),
+            "comparison": comparisons,
+        }
+        unit_costs = {
+            "size_probe": settings.scan_cost_per_partial_request,
+            "download": settings.scan_cost_per_download,
+            "perceptual_hash": settings.scan_cost_per_perceptual_hash,
+            "comparison": settings.scan_cost_per_comparison,
+        }
+        operations = [
+            OperationEstimate(
+                operation=operation,
+                count=operation_counts[operation],
+                seconds=round(seconds[operation], 6),
+                cost=round(
+                    operation_counts[operation] * unit_costs[operation]
+                    + seconds[operation] * settings.scan_cost_per_worker_second,
+                    6,
+                ),
+                observations=self.observation_count(operation),
+            )
+            for operation in OPERATIONS
+        ]
+        # Size probes run before the pipeline; downloads and hashing overlap inside it.
+        duration = (
+            seconds["size_probe"] / max(settings.scan_download_concurrency, 1)
+            + max(
+                seconds["download"] / max(settings.scan_download_concurrency, 1),
+                seconds["perceptual_hash"] / max(settings.scan_hash_concurrency, 1),
+            )
+            + seconds["comparison"]
+        )
+        return ScanEstimate(
+            inputCount=len(items),
+            predictedDurationSeconds=round(duration, 3),
+            predictedCost=round(sum(operation.cost for operation in operations), 6),
+            consentRequired=len(items) > settings.scan_consent_threshold,
+            operations=operations,
+        )
+
+    def to_bytes(self) -> bytes:
+        payload = {key: [stats.count, stats.mean_seconds] for key, stats in self._stats.items()}
+        return zlib.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+
+    @classmethod
+    def from_bytes(cls, raw: bytes, *, window: int) -> CostModel:
+        payload = json.loads(zlib.decompress(raw))
+        return cls(
+            {key: OperationStats(count, mean) for key, (count, mean) in payload.items()},
+            window=window,
+        )
+
+
+class CostModelBackend(Protocol):
+    def load(self) -> bytes | None: ...
+
+    def save(self, raw: bytes) -> None: ...
+
+
+class MemoryCostModelBackend:
+    """Keeps the model in this process only; it is relearned after a restart."""
+
+    def __init__(self) -> None:
+        self._raw: bytes | None = None
+
+    def load(self) -> bytes | None:
+        return self._raw
+
+    def save(self, raw: bytes) -> None:
+        self._raw = raw
+
+
+class FileCostModelBackend:
+    """Keeps the model in a local file, replaced atomically on every save."""
+
+    def __init__(self, path: Path) -> None:
+        self._path = path
+
+    def load(self) -> bytes | None:
+        try:
+            return self._path.read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def save(self, raw: bytes) -> None:
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        staging = self._path.with_name(f"{self._path.name}.tmp")
+        staging.write_bytes(raw)
+        os.replace(staging, self._path)
+
+
+class RedisCostModelBackend:
+    """Keeps the model under its own Redis key, written without an expiry so that neither
+    TTLs nor volatile-* eviction policies can drop it; falls back to ``fallback``."""
+
+    def __init__(self, client: Any, fallback: CostModelBackend) -> None:
+        self._client = client
+        self._fallback = fallback
+
+    def load(self) -> bytes | None:
+        try:
+            value = self._client.get(_STORE_KEY)
+        except Exception as exc:  # pragma: no cover - depends on a live Redis
+            logger.warning("Redis cost model read failed; using local copy: %s", exc)
+            return self._fallback.load()
+        return value if isinstance(value, bytes) else None
+
+    def save(self, raw: bytes) -> None:
+        try:
+            self._client.set(_STORE_KEY, raw)
+        except Exception as exc:  # pragma: no cover - depends on a live Redis
+            logger.warning("Redis cost model write failed; using local copy: %s", exc)
+            self._fallback.save(raw)
+
+
+class CostModelStore:
+    """Loads and updates the learned model in a backend of its own, apart from the scan
+    cache, so result entries can never evict it.
+
+    Scans ``submit`` observations, which a background thread folds into the model, so a slow
+    or failing backend never delays or fails a scan.
+    """
+
+    def __init__(self, backend: CostModelBackend, window: int) -> None:
+        self._backend = backend
+        self._window = window
+        self._lock = threading.Lock()
+        self._pending: queue.Queue[list[Observation]] = queue.Queue(_MAX_PENDING_BATCHES)
+        self._writer: threading.Thread | None = None
+        self.dropped_batches = 0
+
+    def load(self) -> CostModel:
+        raw = self._backend.load()
+        if raw is None:
+            return CostModel(window=self._window)
+        return CostModel.from_bytes(raw, window=self._window)
+
+    def record(self, observations: Iterable[Observation]) -> None:
+        # Read-modify-write; concurrent replicas may drop each other's last batch.
+        with self._lock:
+            model = self.load()
+            for observation in observations:
+                model.observe(observation)
+            self._backend.save(model.to_bytes())
+
+    def submit(self, observations: Iterable[Observation]) -> None:
+        """Queue observations for the background writer; never blocks or raises."""
+        try:
+            self._pending.put_nowait(list(observations))
+        except queue.Full:
+            with self._lock:
+                self.dropped_batches += 1
+            logger.warning("Cost model backlog is full; dropping a run's observations")
+            return
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(
+                    target=self._run_writer, name="cost-model-writer", daemon=True
+                )
+                self._writer.start()
+
+    def flush(self) -> None:
+        """Wait until every submitted observation has been recorded (or dropped)."""
+        self._pending.join()
+
+    def _run_writer(self) -> None:
+        while True:
+            batches = [self._pending.get()]
+            # Fold everything already queued into one read-modify-write.
+            while True:
+                try:
+                    batches.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.record(observation for batch in batches for observation in batch)
+            except Exception as exc:
+                logger.warning("Cost model update failed: %s", exc)
+            finally:
+                for _ in batches:
+                    self._pending.task_done()
+
+
+def build_cost_model_backend(settings: Settings) -> CostModelBackend:
+    """Redis when the scan cache uses it, else ``SCAN_COST_MODEL_PATH``, else this process."""
+    local: CostModelBackend = (
+        FileCostModelBackend(Path(settings.scan_cost_model_path))
+        if settings.scan_cost_model_path
+        else MemoryCostModelBackend()
+    )
+    if settings.scan_cache_backend == "memory":
+        return local
+    client = redis_client(
+        settings,
+        fallback="keeping the cost model locally",
+        required=settings.scan_cache_backend == "redis",
+    )
+    if client is None:
+        return local
+    return RedisCostModelBackend(client, local)
+
+
+@lru_cache
+def get_cost_model_store() -> CostModelStore:
+    settings = get_settings()
+    return CostModelStore(build_cost_model_backend(settings), settings.scan_cost_model_window)
+
+
+def segment_of(item: PhotoItem) -> str:
+    host = urlparse(item.download_url).hostname if item.download_url else None
+    return f"{item.mime_type or 'unknown'}|{megapixel_bucket(item)}|{host or 'unknown'}"
+
+
+def megapixel_bucket(item: PhotoItem) -> str:
+    if not item.width or not item.height:
+        return "unknown"
+    megapixels = item.width * item.height / 1_000_000
+    lower = 0
+    for edge in _MEGAPIXEL_EDGES:
+        if megapixels < edge:
+            return f"{lower}-{edge}MP"
+        lower = edge
+    return f"{lower}+MP"
+
+
+def run_observations(
+    items: Iterable[PhotoItem],
+    *,
+    download_seconds: Mapping[str, float],
+    perceptual_seconds: Mapping[str, float],
+    timings_ms: Mapping[str, float],
+    counts: Mapping[str, int],
+    probe_workers: int,
+) -> list[Observation]:
+    """Per-item download and hash times, plus run-wide averages for probes and comparisons."""
+    observations: list[Observation] = []
+    for item in items:
+        segment = segment_of(item)
+        if item.id in download_seconds:
+            observations.append(Observation("download", segment, download_seconds[item.id]))
+        if item.id in perceptual_seconds:
+            observations.append(
+                Observation("perceptual_hash", segment, perceptual_seconds[item.id])
+            )
+    probes = counts.get("size_probes", 0) + counts.get("range_requests", 0)
+    if probes:
+        # The prefilter fans probes out over ``probe_workers`` threads.
+        prefilter_seconds = timings_ms.get("exact_prefilter_ms", 0.0) / 1000
+        probe_seconds = prefilter_seconds * max(probe_workers, 1) / probes
+        observations.append(Observation("size_probe", _ANY_SEGMENT, probe_seconds))
+    comparisons = counts.get("comparisons_executed", 0)
+    if comparisons:
+        comparison_seconds = timings_ms.get("near_grouping_ms", 0.0) / 1000 / comparisons
+        observations.append(Observation("comparison", _ANY_SEGMENT, comparison_seconds))
+    return observations
+
+
+def _generalizations(segment: str) -> list[str]:
+    mime, megapixels, _ = segment.split("|")
+    return list(dict.fromkeys([segment, f"{mime}|{megapixels}|{ANY}", _ANY_SEGMENT]))
@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import importlib
+import math
+import mmap
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from io import BytesIO
+from typing import IO, TYPE_CHECKING, cast
+
+from app.core.config import get_settings
+from app.engine.cancellation import CancellationToken
+
+if TYPE_CHECKING:
+    from PIL import Image as PilImage
+
+_WAIT_POLL_SECONDS = 0.05
+_EXIF_ORIENTATION = 0x0112
+
+# Downloaded bytes, or a read-only mapping of a local file.
+ImageSource = bytes | mmap.mmap
+
+
+@dataclass(frozen=True)
+class ImageHeader:
+    width: int
+    height: int
+    bands: int
+    format: str | None
+
+    @property
+    def pixels(self) -> int:
+        return self.width * self.height
+
+    @property
+    def decode_bytes(self) -> int:
+        # Full-colour decode plus the grayscale copy made for hashing.
+        return self.pixels * (self.bands + 1)
+
+
+class PixelBudget:
+    """Caps the bytes held by in-flight image decodes; reservations beyond it wait.
+
+    A single reservation larger than the whole budget is clamped to it, so it runs alone
+    rather than waiting forever.
+    """
+
+    def __init__(self, max_bytes: int | None) -> None:
+        self.max_bytes = max_bytes
+        self._condition = threading.Condition()
+        self._in_use = 0
+        self.peak_bytes = 0
+        self.wait_count = 0
+
+    @property
+    def in_use(self) -> int:
+        with self._condition:
+            return self._in_use
+
+    @contextmanager
+    def reserve(
+        self,
+        nbytes: int,
+        cancellation: CancellationToken | None = None,
+    ) -> Iterator[float]:
+        """Hold ``nbytes`` of the budget for the block; yields the seconds spent waiting."""
+        if self.max_bytes is not None:
+            nbytes = min(nbytes, self.max_bytes)
+        start = time.perf_counter()
+        with self._condition:
+            waited = False
+            while self._must_wait(nbytes):
+                waited = True
+                if cancellation is not None:
+                    cancellation.raise_if_cancelled()
+                self._condition.wait(timeout=_WAIT_POLL_SECONDS)
+            if waited:
+                self.wait_count += 1
+            self._in_use += nbytes
+            self.peak_bytes = max(self.peak_bytes, self._in_use)
+        try:
+            yield time.perf_counter() - start
+        finally:
+            with self._condition:
+                self._in_use -= nbytes
+                self._condition.notify_all()
+
+    def _must_wait(self, nbytes: int) -> bool:
+        if self.max_bytes is None or self._in_use == 0:
+            return False
+        return self._in_use + nbytes > self.max_bytes
+
+
+@lru_cache
+def get_decode_budget() -> PixelBudget:
+    return PixelBudget(get_settings().scan_decode_budget_bytes)
+
+
+def read_header(image_bytes: ImageSource) -> ImageHeader | None:
+    """Read dimensions from the image header without decoding pixel data."""
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        with Image.open(image_file(image_bytes)) as img:
+            return ImageHeader(
+                width=img.width,
+                height=img.height,
+                bands=len(img.getbands()),
+                format=img.format,
+            )
+    except (UnidentifiedImageError, OSError, ValueError):
+        return None
+
+
+def reduced_decode_bytes(header: ImageHeader, max_pixels: int) -> int:
+    """Expected cost of ``decode_grayscale(..., max_pixels=...)`` for an over-size image."""
+    if header.format != "JPEG":
+        # Only JPEG can decode at a reduced scale; everything else is decoded in full.
+        return header.decode_bytes
+    width, height = _draft_size(header.width, header.height, max_pixels)
+    # draft() picks the smallest DCT scale that still covers the requested size.
+    for denominator in (8, 4, 2, 1):
+        scaled_width = -(-header.width // denominator)
+        scaled_height = -(-header.height // denominator)
+        if scaled_width >= width and scaled_height >= height:
+            return scaled_width * scaled_height * 2
+    return header.pixels * 2
+
+
+def decode_grayscale(
+    image_bytes: ImageSource,
+    *,
+    max_pixels: int | None = None,
+    orientation: int | None = None,
+) -> tuple[PilImage.Image, int]:
+    """Decode to grayscale, returning the image and the pixel bytes materialized on the way.
+
+    With ``max_pixels``, JPEGs larger than that are decoded straight to grayscale at the
+    smallest DCT scale (1/2, 1/4 or 1/8) that still keeps at least ``max_pixels`` pixels.
+    ``orientation`` (an EXIF value) applies when the image carries no orientation of its own,
+    as with previews embedded in a RAW file whose orientation lives in the container.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(image_file(image_bytes)) as img:
+        if max_pixels is not None and img.width * img.height > max_pixels:
+            img.draft("L", _draft_size(img.width, img.height, max_pixels))
+        own_orientation = img.getexif().get(_EXIF_ORIENTATION)
+        transposed = ImageOps.exif_transpose(img)
+        if orientation is not None and own_orientation in (None, 1):
+            transposed = _apply_orientation(transposed, orientation)
+        grayscale = transposed.convert("L")
+        pixel_bytes = transposed.width * transposed.height * (len(transposed.getbands()) + 1)
+        return grayscale.copy(), pixel_bytes
+
+
+@lru_cache
+def register_heif_opener() -> bool:
+    """Let Pillow open HEIF/HEIC through the optional ``pillow-heif`` plugin, once."""
+    try:
+        plugin = importlib.import_module("pillow_heif")
+    except ImportError:
+        return False
+    plugin.register_heif_opener()
+    return True
+
+
+def _apply_orientation(img: PilImage.Image, orientation: int) -> PilImage.Image:
+    from PIL import Image
+
+    method = {
+        2: Image.Transpose.FLIP_LEFT_RIGHT,
+        3: Image.Transpose.ROTATE_180,
+        4: Image.Transpose.FLIP_TOP_BOTTOM,
+        5: Image.Transpose.TRANSPOSE,
+        6: Image.Transpose.ROTATE_270,
+        7: Image.Transpose.TRANSVERSE,
+        8: Image.Transpose.ROTATE_90,
+    }.get(orientation)
+    return img if method is None else img.transpose(method)
+
+
+def _draft_size(width: int, height: int, max_pixels: int) -> tuple[int, int]:
+    scale = math.sqrt(max_pixels / (width * height))
+    return max(int(width * scale), 1), max(int(height * scale), 1)
+
+
+def image_file(source: ImageSource) -> IO[bytes]:
+    if isinstance(source, bytes):
+        return BytesIO(source)
+    source.seek(0)
+    return cast(IO[bytes], source)
@@ -1,27 +1,53 @@
 from __future__ import annotations
 
+import hashlib
 import ipaddress
 import socket
+import threading
+import time
 import urllib.request
-from collections.abc import Callable
-from functools import partial
-from typing import cast
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager
+from functools import lru_cache, partial
+from typing import Any, cast
 from urllib.parse import urlparse
 
+from app.engine.cancellation import CancellationToken
 from app.engine.models import PhotoItem
+from app.engine.singleflight import SingleFlight
+
+_READ_CHUNK_BYTES = 64 * 1024
 
 DownloadFetcher = Callable[[PhotoItem], bytes]
+SizeFetcher = Callable[[PhotoItem], int | None]
+# Size and range fetchers return ``None`` when the server cannot answer the cheap request;
+# the prefilter then treats the item as unknown and leaves it to the full hash.
+RangeFetcher = Callable[[PhotoItem, int, int], bytes | None]
 
 
 class DownloadManager:
+    """Fetches and caches item bytes for one scan.
+
+    With a ``flight``, fetches are keyed by download URL: concurrent scans, or items of one
+    selection that share a URL, wait on a single download instead of each fetching it.
+    """
+
     def __init__(
         self,
         fetcher: DownloadFetcher | None = None,
         headers: dict[str, str] | None = None,
         timeout_seconds: float = 30.0,
         allowed_hosts: list[str] | None = None,
+        size_fetcher: SizeFetcher | None = None,
+        range_fetcher: RangeFetcher | None = None,
+        cancellation: CancellationToken | None = None,
+        flight: SingleFlight[bytes] | None = None,
     ) -> None:
+        self.cancellation = cancellation or CancellationToken()
         self._cache: dict[str, bytes] = {}
+        self._flight = flight
+        self._url_owners: dict[str, str] = {}
+        self._sizes: dict[str, int | None] = {}
         self._headers = headers or {}
         self._timeout_seconds = timeout_seconds
         self._allowed_hosts = allowed_hosts or []
@@ -30,35 +56,267 @@ class DownloadManager:
             headers=self._headers,
             timeout_seconds=self._timeout_seconds,
             allowed_hosts=self._allowed_hosts,
+            cancellation=self.cancellation,
         )
+        # A custom fetcher has no cheaper size/range path unless one is supplied explicitly;
+        # in that case both fall back to slicing the full download.
+        self._size_fetcher: SizeFetcher | None = size_fetcher
+        self._range_fetcher: RangeFetcher | None = range_fetcher
+        if fetcher is None:
+            self._size_fetcher = self._size_fetcher or partial(
+                _default_size_fetcher,
+                headers=self._headers,
+                timeout_seconds=self._timeout_seconds,
+                allowed_hosts=self._allowed_hosts,
+                cancellation=self.cancellation,
+            )
+            self._range_fetcher = self._range_fetcher or partial(
+                _default_range_fetcher,
+                headers=self._headers,
+                timeout_seconds=self._timeout_seconds,
+                allowed_hosts=self._allowed_hosts,
+                cancellation=self.cancellation,
+                keep_body=self._keep_body,
+            )
+        self._lock = threading.Lock()
         self.download_count = 0
+        self.size_probe_count = 0
+        self.range_request_count = 0
+        self.coalesced_download_count = 0
+        self._download_seconds: dict[str, float] = {}
+
+    @property
+    def download_seconds(self) -> dict[str, float]:
+        """Fetch time of each item downloaded by this manager."""
+        with self._lock:
+            return dict(self._download_seconds)
 
     def get_bytes(self, item: PhotoItem) -> bytes:
-        if item.id in self._cache:
-            return self._cache[item.id]
+        with self._lock:
+            cached = self._cache.get(item.id)
+            if cached is None and self._flight is not None and item.download_url:
+                owner = self._url_owners.get(item.download_url)
+                cached = None if owner is None else self._cache.get(owner)
+                if cached is not None:
+                    self.coalesced_download_count += 1
+        if cached is not None:
+            return cached
+        self.cancellation.raise_if_cancelled()
+        if self._flight is None:
+            data = self._fetch(item)
+        else:
+            data, shared = self._flight.do_shared(
+                content_key(item), lambda: self._fetch(item), cancellation=self.cancellation
+            )
+            if shared:
+                with self._lock:
+                    self.coalesced_download_count += 1
+        with self._lock:
+            self._cache[item.id] = data
+            if item.download_url:
+                self._url_owners[item.download_url] = item.id
+        return data
+
+    def content_digest(self, item: PhotoItem) -> str:
+        """SHA-256 of the item's bytes, as hex."""
+        return hashlib.sha256(self.get_bytes(item)).hexdigest()
+
+    def _keep_body(self, item: PhotoItem, data: bytes, elapsed: float) -> None:
+        # A server that ignores Range sends the whole body; keep it instead of fetching twice.
+        with self._lock:
+            self._cache[item.id] = data
+            self._download_seconds[item.id] = elapsed
+            self.download_count += 1
+            if item.download_url:
+                self._url_owners[item.download_url] = item.id
+
+    def _fetch(self, item: PhotoItem) -> bytes:
+        start = time.perf_counter()
         data = self._fetcher(item)
-        self._cache[item.id] = data
-        self.download_count += 1
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._download_seconds[item.id] = elapsed
+            self.download_count += 1
+        return data
+
+    def prefetch(self, item: PhotoItem) -> None:
+        """Make ``item`` cheap to read later; remote items are downloaded into the cache."""
+        self.get_bytes(item)
+
+    @property
+    def cached_bytes(self) -> int:
+        with self._lock:
+            return sum(len(data) for data in self._cache.values())
+
+    def has_bytes(self, item: PhotoItem) -> bool:
+        with self._lock:
+            return item.id in self._cache
+
+    def evict(self, items: Iterable[PhotoItem]) -> None:
+        with self._lock:
+            for item in items:
+                self._cache.pop(item.id, None)
+                self._sizes.pop(item.id, None)
+
+    def get_content_length(self, item: PhotoItem) -> int | None:
+        with self._lock:
+            cached = self._cache.get(item.id)
+            if cached is not None:
+                return len(cached)
+            if item.id in self._sizes:
+                return self._sizes[item.id]
+        if self._size_fetcher is None:
+            return len(self.get_bytes(item))
+        self.cancellation.raise_if_cancelled()
+        size = self._size_fetcher(item)
+        with self._lock:
+            self._sizes[item.id] = size
+            self.size_probe_count += 1
+        return size
+
+    def known_content_length(self, item: PhotoItem) -> int | None:
+        """Size from a completed download or size probe, without any new request."""
+        with self._lock:
+            cached = self._cache.get(item.id)
+            if cached is not None:
+                return len(cached)
+            return self._sizes.get(item.id)
+
+    def get_byte_range(self, item: PhotoItem, start: int, length: int) -> bytes | None:
+        with self._lock:
+            cached = self._cache.get(item.id)
+        if cached is not None:
+            return cached[start : start + length]
+        if self._range_fetcher is None:
+            return self.get_bytes(item)[start : start + length]
+        self.cancellation.raise_if_cancelled()
+        data = self._range_fetcher(item, start, length)
+        with self._lock:
+            self.range_request_count += 1
         return data
 
 
+def content_key(item: PhotoItem) -> str:
+    """What identifies an item's bytes across scans: its download URL, else its id."""
+    return item.download_url or f"id:{item.id}"
+
+
+@lru_cache
+def get_download_flight() -> SingleFlight[bytes]:
+    """Process-wide flight shared by every scan's downloads; bytes never leave the process."""
+    return SingleFlight()
+
+
 def _default_fetcher(
     item: PhotoItem,
     *,
     headers: dict[str, str],
     timeout_seconds: float,
     allowed_hosts: list[str],
+    cancellation: CancellationToken,
 ) -> bytes:
     if not item.download_url:
         raise ValueError(f"Photo item {item.id} missing download URL")
     validate_download_url(item.download_url, allowed_hosts)
     request = urllib.request.Request(item.download_url, headers=headers)
-    with urllib.request.urlopen(request, timeout=timeout_seconds) as response:
-        return cast(bytes, response.read())
+    with _open(request, timeout_seconds, cancellation) as response:
+        return _read_body(response, cancellation)
+
+
+def _default_size_fetcher(
+    item: PhotoItem,
+    *,
+    headers: dict[str, str],
+    timeout_seconds: float,
+    allowed_hosts: list[str],
+    cancellation: CancellationToken,
+) -> int | None:
+    if not item.download_url:
+        raise ValueError(f"Photo item {item.id} missing download URL")
+    validate_download_url(item.download_url, allowed_hosts)
+    request = urllib.request.Request(item.download_url, headers=headers, method="HEAD")
+    try:
+        with _open(request, timeout_seconds, cancellation) as response:
+            length = response.headers.get("Content-Length")
+    except OSError:
+        # HEAD is often refused on signed CDN URLs (403/405), or times out; either way the
+        # size is unknown and the item falls back to the full hash.
+        cancellation.raise_if_cancelled()
+        return None
+    try:
+        return int(length) if length is not None else None
+    except ValueError:
+        return None
+
+
+def _default_range_fetcher(
+    item: PhotoItem,
+    start: int,
+    length: int,
+    *,
+    headers: dict[str, str],
+    timeout_seconds: float,
+    allowed_hosts: list[str],
+    cancellation: CancellationToken,
+    keep_body: Callable[[PhotoItem, bytes, float], None] | None = None,
+) -> bytes | None:
+    if not item.download_url:
+        raise ValueError(f"Photo item {item.id} missing download URL")
+    validate_download_url(item.download_url, allowed_hosts)
+    range_headers = {**headers, "Range": f"bytes={start}-{start + length - 1}"}
+    request = urllib.request.Request(item.download_url, headers=range_headers)
+    started = time.perf_counter()
+    try:
+        with _open(request, timeout_seconds, cancellation) as response:
+            data = _read_body(response, cancellation)
+            if response.status == 206:
+                return data
+    except OSError:
+        # URLError, HTTPError and read timeouts alike leave the range unknown.
+        cancellation.raise_if_cancelled()
+        return None
+    # The server ignored the Range header and sent the whole body.
+    if keep_body is not None:
+        keep_body(item, data, time.perf_counter() - started)
+    return data[start : start + length]
+
+
+@contextmanager
+def _open(
+    request: urllib.request.Request,
+    timeout_seconds: float,
+    cancellation: CancellationToken,
+) -> Iterator[Any]:
+    remaining = cancellation.remaining_seconds()
+    timeout = timeout_seconds if remaining is None else max(min(timeout_seconds, remaining), 0.1)
+    cancellation.raise_if_cancelled()
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        # Closing the response unblocks a read in progress when the scan is cancelled.
+        with cancellation.on_cancel(response.close):
+            yield response
+
+
+def _read_body(response: Any, cancellation: CancellationToken) -> bytes:
+    chunks: list[bytes] = []
+    while True:
+        cancellation.raise_if_cancelled()
+        try:
+            chunk = cast(bytes, response.read(_READ_CHUNK_BYTES))
+        except Exception:
+            # A read interrupted by closing the response surfaces as an arbitrary error.
+            cancellation.raise_if_cancelled()
+            raise
+        if not chunk:
+            break
+        chunks.append(chunk)
+    cancellation.raise_if_cancelled()
+    return b"".join(chunks)
 
 
 def validate_download_url(url: str, allowed_hosts: list[str]) -> None:
     parsed = urlparse(url)
+    if _is_allowed_origin(parsed.scheme, parsed.netloc, allowed_hosts):
+        return
     if parsed.scheme != "https":
         raise ValueError("Download URL must use https.")
     if not parsed.hostname:
@@ -69,6 +327,13 @@ def validate_download_url(url: str, allowed_hosts: list[str]) -> None:
     _reject_private_addresses(hostname)
 
 
+def _is_allowed_origin(scheme: str, netloc: str, allowed_hosts: list[str]) -> bool:
+    # Full origins (scheme://host:port) only reach the allowlist through the test-only
+    # SCAN_DOWNLOAD_TEST_ORIGIN setting and bypass the https and public-address checks.
+    origin = f"{scheme}://{netloc}".lower()
+    return any(allowed.lower().rstrip("/") == origin for allowed in allowed_hosts)
+
+
 def _is_allowed_host(hostname: str, allowed_hosts: list[str]) -> bool:
     if not allowed_hosts:
         return False
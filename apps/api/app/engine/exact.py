@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from collections.abc import Callable, Hashable, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from app.engine.hashing import HashingService
+from app.engine.models import PhotoItem
+
+
+@dataclass(frozen=True)
+class ExactPrefilterResult:
+    candidates: list[PhotoItem]
+    skipped_by_size: int
+    skipped_by_partial: int
+
+
+def prefilter_exact_candidates(
+    items: Sequence[PhotoItem],
+    hashing_service: HashingService,
+    *,
+    partial_window: int,
+    workers: int = 1,
+) -> ExactPrefilterResult:
+    downloadable = [item for item in items if item.download_url is not None]
+    download_manager = hashing_service.download_manager
+
+    sizes = _map_concurrently(download_manager.get_content_length, downloadable, workers)
+    size_collisions = _colliding(downloadable, sizes)
+
+    partial_hashes = _map_concurrently(
+        lambda item: hashing_service.get_partial_hash(item, window=partial_window),
+        size_collisions,
+        workers,
+    )
+    candidates = _colliding(size_collisions, partial_hashes)
+    return ExactPrefilterResult(
+        candidates=candidates,
+        skipped_by_size=len(downloadable) - len(size_collisions),
+        skipped_by_partial=len(size_collisions) - len(candidates),
+    )
+
+
+def _colliding(
+    items: Sequence[PhotoItem],
+    keys: Sequence[Hashable | None],
+) -> list[PhotoItem]:
+    # Items with an unknown key cannot be ruled out and always survive.
+    counts: dict[Hashable, int] = defaultdict(int)
+    for key in keys:
+        if key is not None:
+            counts[key] += 1
+    return [item for item, key in zip(items, keys, strict=True) if key is None or counts[key] >= 2]
+
+
+def _map_concurrently(
+    func: Callable[[PhotoItem], Hashable | None],
+    items: Sequence[PhotoItem],
+    workers: int,
+) -> list[Hashable | None]:
+    if workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(func, items))
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_DECODE = {char: index for index, char in enumerate(_BASE32)}
+
+
+def encode(latitude: float, longitude: float, precision: int) -> str:
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars: list[str] = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        target, value = (lon_range, longitude) if even else (lat_range, latitude)
+        mid = (target[0] + target[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            target[0] = mid
+        else:
+            target[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+def bounds(cell: str) -> tuple[float, float, float, float]:
+    """Return ``(min_lat, max_lat, min_lon, max_lon)`` for a geohash cell."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for char in cell:
+        code = _DECODE[char]
+        for shift in range(4, -1, -1):
+            target = lon_range if even else lat_range
+            mid = (target[0] + target[1]) / 2
+            if (code >> shift) & 1:
+                target[0] = mid
+            else:
+                target[1] = mid
+            even = not even
+    return lat_range[0], lat_range[1], lon_range[0], lon_range[1]
+
+
+def neighbours(cell: str) -> list[str]:
+    """The up to eight cells surrounding ``cell``; longitude wraps, the poles do not."""
+    min_lat, max_lat, min_lon, max_lon = bounds(cell)
+    lat_step = max_lat - min_lat
+    lon_step = max_lon - min_lon
+    center_lat = (min_lat + max_lat) / 2
+    center_lon = (min_lon + max_lon) / 2
+    result: list[str] = []
+    for lat_offset in (-1, 0, 1):
+        latitude = center_lat + lat_offset * lat_step
+        if not -90.0 < latitude < 90.0:
+            continue
+        for lon_offset in (-1, 0, 1):
+            if lat_offset == 0 and lon_offset == 0:
+                continue
+            longitude = (center_lon + lon_offset * lon_step + 180.0) % 360.0 - 180.0
+            neighbour = encode(latitude, longitude, len(cell))
+            if neighbour != cell and neighbour not in result:
+                result.append(neighbour)
+    return result
@@ -2,11 +2,18 @@ from __future__ import annotations
 
 import hashlib
 from collections import defaultdict, deque
+from collections.abc import Mapping
 from dataclasses import dataclass
+from typing import TYPE_CHECKING, NamedTuple
 
-from app.engine.hashing import PerceptualHashes, hamming_distance
+from app.engine.cancellation import CancellationToken
+from app.engine.hashing import PerceptualHashes, dhash_distance, phash_distance
 from app.engine.models import PhotoItem
 from app.engine.schemas import GroupRepresentativePair, GroupResult, PhotoItemSummary
+from app.engine.verification import ThumbnailScorer
+
+if TYPE_CHECKING:
+    from app.core.config import Settings
 
 
 @dataclass(frozen=True)
@@ -17,6 +24,27 @@ class SimilarityThresholds:
     phash_possible: int
 
 
+@dataclass(frozen=True)
+class VerificationPolicy:
+    """How pixel scores settle pairs in the POSSIBLY_SIMILAR band."""
+
+    metric: str
+    promote_score: float
+    drop_score: float
+    dihedral: bool = False
+
+
+def verification_policy(settings: Settings) -> VerificationPolicy | None:
+    if not settings.scan_verify_enabled:
+        return None
+    return VerificationPolicy(
+        metric=settings.scan_verify_metric,
+        promote_score=settings.scan_verify_promote_score,
+        drop_score=settings.scan_verify_drop_score,
+        dihedral=settings.scan_dihedral_invariant,
+    )
+
+
 def group_exact_duplicates(
     items: list[PhotoItem],
     byte_hashes: dict[str, str],
@@ -37,40 +65,136 @@ def group_exact_duplicates(
     )
 
 
+class PairDistance(NamedTuple):
+    left: str
+    right: str
+    dhash: int
+    # None when either side's pHash was never computed (lazy hashing).
+    phash: int | None
+    # Pixel similarity, only computed for pairs in the POSSIBLY_SIMILAR band.
+    score: float | None = None
+
+
 def group_near_duplicates(
     candidate_sets: list[list[PhotoItem]],
     perceptual_hashes: dict[str, PerceptualHashes],
     thresholds: SimilarityThresholds,
+    *,
+    distances_out: list[PairDistance] | None = None,
+    cancellation: CancellationToken | None = None,
+    thumbnails: Mapping[str, bytes] | None = None,
+    verification: VerificationPolicy | None = None,
 ) -> tuple[list[GroupResult], list[GroupResult], int]:
-    comparisons = 0
-    edges_very: dict[str, set[str]] = defaultdict(set)
-    edges_possible: dict[str, set[str]] = defaultdict(set)
-    seen_pairs: set[tuple[str, str]] = set()
+    distances = compute_pair_distances(candidate_sets, perceptual_hashes, cancellation=cancellation)
+    if verification is not None and thumbnails is not None:
+        distances = score_borderline_pairs(distances, thumbnails, thresholds, verification)
+    if distances_out is not None:
+        distances_out.extend(distances)
     id_to_item: dict[str, PhotoItem] = {
         item.id: item for candidate in candidate_sets for item in candidate
     }
+    groups_very, groups_possible = classify_pair_distances(
+        distances, id_to_item, thresholds, verification=verification
+    )
+    return groups_very, groups_possible, len(distances)
+
+
+def score_borderline_pairs(
+    distances: list[PairDistance],
+    thumbnails: Mapping[str, bytes],
+    thresholds: SimilarityThresholds,
+    verification: VerificationPolicy,
+) -> list[PairDistance]:
+    """Score POSSIBLY_SIMILAR-band pairs from their thumbnails; other pairs are untouched.
+
+    Pairs missing a thumbnail keep no score and stay in the band unverified.
+    """
+    scorer = ThumbnailScorer(verification.metric, dihedral=verification.dihedral)
+    scored: list[PairDistance] = []
+    for distance in distances:
+        left = thumbnails.get(distance.left)
+        right = thumbnails.get(distance.right)
+        if (
+            distance.score is None
+            and left is not None
+            and right is not None
+            and _band(distance, thresholds) == "possible"
+        ):
+            distance = distance._replace(score=scorer.score(left, right))
+        scored.append(distance)
+    return scored
+
+
+def verification_counts(
+    distances: list[PairDistance],
+    thresholds: SimilarityThresholds,
+    verification: VerificationPolicy,
+) -> dict[str, int]:
+    verdicts = [
+        _verdict(distance, verification)
+        for distance in distances
+        if distance.score is not None and _band(distance, thresholds) == "possible"
+    ]
+    return {
+        "verified_pairs": len(verdicts),
+        "verify_promoted": verdicts.count("very"),
+        "verify_dropped": verdicts.count(None),
+    }
+
+
+def compute_pair_distances(
+    candidate_sets: list[list[PhotoItem]],
+    perceptual_hashes: dict[str, PerceptualHashes],
+    *,
+    cancellation: CancellationToken | None = None,
+) -> list[PairDistance]:
+    """Pairwise distances within each set; stops after the current set once cancelled."""
+    distances: list[PairDistance] = []
+    seen_pairs: set[tuple[str, str]] = set()
     for candidates in candidate_sets:
+        if cancellation is not None and cancellation.cancelled:
+            break
         for i, left in enumerate(candidates):
             for right in candidates[i + 1 :]:
                 pair = (left.id, right.id) if left.id < right.id else (right.id, left.id)
                 if pair in seen_pairs:
                     continue
                 seen_pairs.add(pair)
-                comparisons += 1
-                left_hashes = perceptual_hashes[left.id]
-                right_hashes = perceptual_hashes[right.id]
-                dhash_distance = hamming_distance(left_hashes.dhash, right_hashes.dhash)
-                phash_distance = hamming_distance(left_hashes.phash, right_hashes.phash)
-                if (
-                    dhash_distance <= thresholds.dhash_very
-                    or phash_distance <= thresholds.phash_very
-                ):
-                    _add_edge(edges_very, left.id, right.id)
-                elif (
-                    dhash_distance <= thresholds.dhash_possible
-                    or phash_distance <= thresholds.phash_possible
-                ):
-                    _add_edge(edges_possible, left.id, right.id)
+                left_hashes = perceptual_hashes[pair[0]]
+                right_hashes = perceptual_hashes[pair[1]]
+                distances.append(
+                    PairDistance(
+                        left=pair[0],
+                        right=pair[1],
+                        dhash=dhash_distance(left_hashes, right_hashes),
+                        phash=phash_distance(left_hashes, right_hashes),
+                    )
+                )
+    return distances
+
+
+def classify_pair_distances(
+    distances: list[PairDistance],
+    id_to_item: dict[str, PhotoItem],
+    thresholds: SimilarityThresholds,
+    *,
+    verification: VerificationPolicy | None = None,
+) -> tuple[list[GroupResult], list[GroupResult]]:
+    """Build groups from hash-distance bands.
+
+    With ``verification``, scored pairs in the POSSIBLY_SIMILAR band are promoted to
+    VERY_SIMILAR, kept, or dropped by their pixel score.
+    """
+    edges_very: dict[str, set[str]] = defaultdict(set)
+    edges_possible: dict[str, set[str]] = defaultdict(set)
+    for distance in distances:
+        band = _band(distance, thresholds)
+        if band == "possible" and verification is not None and distance.score is not None:
+            band = _verdict(distance, verification)
+        if band == "very":
+            _add_edge(edges_very, distance.left, distance.right)
+        elif band == "possible":
+            _add_edge(edges_possible, distance.left, distance.right)
     very_groups, very_ids = _connected_components(edges_very, id_to_item)
     possible_groups, _ = _connected_components(
         edges_possible,
@@ -84,7 +208,6 @@ def group_near_duplicates(
             category="POSSIBLY_SIMILAR",
             explanation=_explain(thresholds, False),
         ),
-        comparisons,
     )
 
 
@@ -98,6 +221,30 @@ def select_representative_pair(items: list[PhotoItem]) -> GroupRepresentativePai
     )
 
 
+def _band(distance: PairDistance, thresholds: SimilarityThresholds) -> str | None:
+    phash = distance.phash
+    if distance.dhash <= thresholds.dhash_very or (
+        phash is not None and phash <= thresholds.phash_very
+    ):
+        return "very"
+    if distance.dhash <= thresholds.dhash_possible or (
+        phash is not None and phash <= thresholds.phash_possible
+    ):
+        return "possible"
+    return None
+
+
+def _verdict(distance: PairDistance, verification: VerificationPolicy) -> str | None:
+    score = distance.score
+    if score is None:
+        return "possible"
+    if score >= verification.promote_score:
+        return "very"
+    if score < verification.drop_score:
+        return None
+    return "possible"
+
+
 def _add_edge(edges: dict[str, set[str]], left: str, right: str) -> None:
     edges[left].add(right)
     edges[right].add(left)
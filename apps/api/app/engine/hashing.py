@@ -1,17 +1,50 @@
 from __future__ import annotations
 
+import base64
 import hashlib
+import json
 import math
-from io import BytesIO
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from functools import lru_cache
 from typing import TYPE_CHECKING, NamedTuple
 
-from app.engine.downloads import DownloadManager
+from app.core.config import get_settings
+from app.engine.cancellation import CancellationToken
+from app.engine.decoding import (
+    ImageHeader,
+    PixelBudget,
+    decode_grayscale,
+    read_header,
+    reduced_decode_bytes,
+    register_heif_opener,
+)
+from app.engine.downloads import DownloadManager, content_key
 from app.engine.models import PhotoItem
+from app.engine.previews import HEIF_MIME_TYPES, extract_preview
+from app.engine.singleflight import Flight, build_flight
+from app.engine.verification import THUMBNAIL_SIZE
 
 
 class PerceptualHashes(NamedTuple):
     dhash: int
-    phash: int
+    # None when lazy hashing decided every pair involving the item from dHash alone.
+    phash: int | None
+    # Hashes of all eight rotations/flips (identity first) in dihedral mode, else empty.
+    dhash_variants: tuple[int, ...] = ()
+    phash_variants: tuple[int, ...] = ()
+
+
+class PerceptualWork(NamedTuple):
+    """Everything one decode produces, so nothing needs the image again."""
+
+    hashes: PerceptualHashes
+    # Kept for a dHash-only result, to finish its pHash later.
+    phash_input: list[int] | None = None
+    # Grayscale thumbnail for pixel verification, when thumbnails are kept.
+    thumbnail: bytes | None = None
 
 
 if TYPE_CHECKING:
@@ -19,35 +52,351 @@ if TYPE_CHECKING:
 
 
 class HashingService:
-    def __init__(self, download_manager: DownloadManager) -> None:
+    def __init__(
+        self,
+        download_manager: DownloadManager,
+        *,
+        decode_budget: PixelBudget | None = None,
+        max_decode_pixels: int | None = None,
+        dihedral: bool = False,
+        flight: Flight[PerceptualWork] | None = None,
+        keep_thumbnails: bool = False,
+    ) -> None:
         self._download_manager = download_manager
+        self._dihedral = dihedral
+        self._keep_thumbnails = keep_thumbnails
+        self._thumbnails: dict[str, bytes] = {}
+        self._flight = flight
+        self._shared_work: dict[str, PerceptualWork] = {}
+        self._decode_budget = decode_budget or PixelBudget(None)
+        self._max_decode_pixels = max_decode_pixels
         self._byte_hash_cache: dict[str, str] = {}
         self._perceptual_cache: dict[str, PerceptualHashes] = {}
+        self._partial_hash_cache: dict[str, str | None] = {}
+        self._phash_inputs: dict[str, list[int]] = {}
+        self._perceptual_seconds: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._item_locks: dict[str, threading.Lock] = {}
         self.byte_hash_count = 0
+        self.partial_hash_count = 0
         self.perceptual_hash_count = 0
+        self.deferred_phash_count = 0
+        self.decoded_pixel_bytes = 0
+        self.decoded_pixel_bytes_peak = 0
+        self.reduced_decode_count = 0
+        self.preview_decode_count = 0
+        self.coalesced_hash_count = 0
+        self.decode_wait_seconds = 0.0
+
+    @property
+    def download_manager(self) -> DownloadManager:
+        return self._download_manager
+
+    @property
+    def cancellation(self) -> CancellationToken:
+        return self._download_manager.cancellation
+
+    @property
+    def byte_hashes(self) -> dict[str, str]:
+        with self._lock:
+            return dict(self._byte_hash_cache)
+
+    @property
+    def perceptual_hashes(self) -> dict[str, PerceptualHashes]:
+        with self._lock:
+            return dict(self._perceptual_cache)
+
+    @property
+    def thumbnails(self) -> dict[str, bytes]:
+        """Verification thumbnails taken from the hashing decode, when ``keep_thumbnails``."""
+        with self._lock:
+            return dict(self._thumbnails)
+
+    @property
+    def perceptual_seconds(self) -> dict[str, float]:
+        """Decode-and-hash time of each item, excluding waits for the decode budget."""
+        with self._lock:
+            return dict(self._perceptual_seconds)
 
     def get_byte_hash(self, item: PhotoItem) -> str:
-        if item.id in self._byte_hash_cache:
-            return self._byte_hash_cache[item.id]
-        digest = hashlib.sha256(self._download_manager.get_bytes(item)).hexdigest()
-        self._byte_hash_cache[item.id] = digest
-        self.byte_hash_count += 1
-        return digest
+        with self._item_lock(item.id):
+            if item.id in self._byte_hash_cache:
+                return self._byte_hash_cache[item.id]
+            self.cancellation.raise_if_cancelled()
+            digest = self._download_manager.content_digest(item)
+            with self._lock:
+                self._byte_hash_cache[item.id] = digest
+                self.byte_hash_count += 1
+            return digest
+
+    def get_partial_hash(self, item: PhotoItem, *, window: int) -> str | None:
+        """Hash the length plus first/last ``window`` bytes; ``None`` if either is unavailable."""
+        with self._item_lock(item.id):
+            if item.id in self._partial_hash_cache:
+                return self._partial_hash_cache[item.id]
+            size = self._download_manager.get_content_length(item)
+            digest: str | None = None
+            if size is not None:
+                hasher = hashlib.sha256(str(size).encode("ascii"))
+                if size <= 2 * window:
+                    hasher.update(self._download_manager.get_bytes(item))
+                    digest = hasher.hexdigest()
+                else:
+                    head = self._download_manager.get_byte_range(item, 0, window)
+                    tail = None
+                    if head is not None:
+                        tail = self._download_manager.get_byte_range(item, size - window, window)
+                    if head is not None and tail is not None:
+                        hasher.update(head)
+                        hasher.update(tail)
+                        digest = hasher.hexdigest()
+            with self._lock:
+                self._partial_hash_cache[item.id] = digest
+                if digest is not None:
+                    self.partial_hash_count += 1
+            return digest
 
     def get_perceptual_hashes(self, item: PhotoItem) -> PerceptualHashes:
-        if item.id in self._perceptual_cache:
-            return self._perceptual_cache[item.id]
+        with self._item_lock(item.id):
+            if item.id in self._perceptual_cache:
+                return self._perceptual_cache[item.id]
+            return self._compute_perceptual(item)
+
+    def get_dhash(self, item: PhotoItem) -> PerceptualHashes:
+        """Compute dHash only, keeping the small pHash input so pHash never re-decodes."""
+        with self._item_lock(item.id):
+            if item.id in self._perceptual_cache:
+                return self._perceptual_cache[item.id]
+            self.cancellation.raise_if_cancelled()
+            return self._coalesced(item, "dhash", lambda: self._compute_dhash(item)).hashes
+
+    def complete_phash(self, item: PhotoItem) -> PerceptualHashes:
+        with self._item_lock(item.id):
+            cached = self._perceptual_cache.get(item.id)
+            if cached is None:
+                return self._compute_perceptual(item)
+            if cached.phash is not None:
+                return cached
+            self.cancellation.raise_if_cancelled()
+            with self._lock:
+                pixels = self._phash_inputs.pop(item.id)
+            if self._dihedral:
+                variants = dihedral_phashes(pixels)
+                hashes = cached._replace(phash=variants[0], phash_variants=variants)
+            else:
+                hashes = cached._replace(phash=phash_from_pixels(pixels))
+            with self._lock:
+                self._perceptual_cache[item.id] = hashes
+                self.deferred_phash_count -= 1
+            return hashes
+
+    def release_phash_inputs(self) -> None:
+        """Drop the pixels kept for deferred pHashes once no candidate set can need them."""
+        with self._lock:
+            self._phash_inputs.clear()
+            for key, work in self._shared_work.items():
+                if work.phash_input is not None:
+                    self._shared_work[key] = work._replace(phash_input=None)
+
+    def _compute_perceptual(self, item: PhotoItem) -> PerceptualHashes:
+        self.cancellation.raise_if_cancelled()
+        return self._coalesced(item, "full", lambda: self._hash_item(item)).hashes
+
+    def _hash_item(self, item: PhotoItem) -> PerceptualWork:
+        data = self._download_manager.get_bytes(item)
+        with self._decoded(item, data) as (image, pixel_bytes):
+            hashes = perceptual_hashes_from_image(image, dihedral=self._dihedral)
+            thumbnail = self._thumbnail(item.id, image)
+        self._store_perceptual(item.id, hashes, pixel_bytes)
+        return PerceptualWork(hashes, thumbnail=thumbnail)
+
+    def _compute_dhash(self, item: PhotoItem) -> PerceptualWork:
         data = self._download_manager.get_bytes(item)
-        dhash_value = compute_dhash(data)
-        phash_value = compute_phash(data)
-        hashes = PerceptualHashes(dhash=dhash_value, phash=phash_value)
-        self._perceptual_cache[item.id] = hashes
-        self.perceptual_hash_count += 1
-        return hashes
+        with self._decoded(item, data) as (image, pixel_bytes):
+            hashes = dhash_only(image, dihedral=self._dihedral)
+            pixels = phash_input(image)
+            thumbnail = self._thumbnail(item.id, image)
+        with self._lock:
+            self._phash_inputs[item.id] = pixels
+            self.deferred_phash_count += 1
+        self._store_perceptual(item.id, hashes, pixel_bytes)
+        return PerceptualWork(hashes, pixels, thumbnail)
+
+    def _thumbnail(self, item_id: str, grayscale: PilImage.Image) -> bytes | None:
+        if not self._keep_thumbnails:
+            return None
+        thumbnail = verification_thumbnail(grayscale)
+        with self._lock:
+            self._thumbnails[item_id] = thumbnail
+        return thumbnail
+
+    def _coalesced(
+        self, item: PhotoItem, mode: str, compute: Callable[[], PerceptualWork]
+    ) -> PerceptualWork:
+        """Share one decode-and-hash per content key across scans and across this selection.
+
+        ``compute`` stores its result for ``item`` itself; a result computed for another item
+        or by another scan is stored here without counting as a hash of this scan.
+        """
+        if self._flight is None:
+            return compute()
+        key = ":".join(
+            (
+                mode,
+                str(self._dihedral),
+                str(self._max_decode_pixels),
+                str(self._keep_thumbnails),
+                content_key(item),
+            )
+        )
+        with self._lock:
+            work = self._shared_work.get(key)
+        shared = work is not None
+        if work is None:
+            work, shared = self._flight.do_shared(key, compute, cancellation=self.cancellation)
+        with self._lock:
+            self._shared_work[key] = work
+            if shared:
+                self._perceptual_cache[item.id] = work.hashes
+                self.coalesced_hash_count += 1
+                if work.phash_input is not None:
+                    self._phash_inputs[item.id] = work.phash_input
+                    self.deferred_phash_count += 1
+                if work.thumbnail is not None:
+                    self._thumbnails[item.id] = work.thumbnail
+        return work
+
+    @contextmanager
+    def _decoded(self, item: PhotoItem, data: bytes) -> Iterator[tuple[PilImage.Image, int]]:
+        """Decode under a pixel-budget reservation sized from the header before decoding.
+
+        RAW and HEIF originals decode their embedded JPEG preview instead when they have one.
+        """
+        preview = extract_preview(data, item.mime_type)
+        if preview is None and item.mime_type in HEIF_MIME_TYPES:
+            register_heif_opener()
+        source = data if preview is None else preview.data
+        header = read_header(source) or _header_from_metadata(item)
+        max_pixels = self._max_decode_pixels
+        reduced = header is not None and max_pixels is not None and header.pixels > max_pixels
+        if header is None:
+            cost = 0
+        elif reduced and max_pixels is not None:
+            cost = reduced_decode_bytes(header, max_pixels)
+        else:
+            cost = header.decode_bytes
+        with self._decode_budget.reserve(cost, self.cancellation) as waited:
+            start = time.perf_counter()
+            if preview is not None:
+                decoded = decode_grayscale(
+                    preview.data,
+                    max_pixels=max_pixels if reduced else None,
+                    orientation=preview.orientation,
+                )
+            elif reduced:
+                decoded = decode_grayscale(data, max_pixels=max_pixels)
+            else:
+                decoded = _decode(data)
+            with self._lock:
+                self.decode_wait_seconds += waited
+                if reduced:
+                    self.reduced_decode_count += 1
+                if preview is not None:
+                    self.preview_decode_count += 1
+            yield decoded
+            with self._lock:
+                self._perceptual_seconds[item.id] = time.perf_counter() - start
+
+    def _store_perceptual(self, item_id: str, hashes: PerceptualHashes, pixel_bytes: int) -> None:
+        with self._lock:
+            self._perceptual_cache[item_id] = hashes
+            self.perceptual_hash_count += 1
+            self.decoded_pixel_bytes += pixel_bytes
+            self.decoded_pixel_bytes_peak = max(self.decoded_pixel_bytes_peak, pixel_bytes)
+
+    def _item_lock(self, item_id: str) -> threading.Lock:
+        with self._lock:
+            return self._item_locks.setdefault(item_id, threading.Lock())
+
+
+@lru_cache
+def get_hash_flight() -> Flight[PerceptualWork]:
+    """Process-wide flight for perceptual hashing, Redis-locked across replicas if configured."""
+    return build_flight(
+        get_settings(),
+        namespace="perceptual",
+        encode=_encode_work,
+        decode=_decode_work,
+    )
+
+
+def _encode_work(work: PerceptualWork) -> bytes:
+    hashes = work.hashes
+    thumbnail = None if work.thumbnail is None else base64.b64encode(work.thumbnail).decode()
+    payload = [
+        [hashes.dhash, hashes.phash],
+        hashes.dhash_variants,
+        hashes.phash_variants,
+        work.phash_input,
+        thumbnail,
+    ]
+    return json.dumps(payload).encode("utf-8")
+
+
+def _decode_work(payload: bytes) -> PerceptualWork:
+    (dhash, phash), dhash_variants, phash_variants, pixels, thumbnail = json.loads(payload)
+    hashes = PerceptualHashes(dhash, phash, tuple(dhash_variants), tuple(phash_variants))
+    return PerceptualWork(
+        hashes, pixels, None if thumbnail is None else base64.b64decode(thumbnail)
+    )
+
+
+def perceptual_hashes_from_image(
+    grayscale: PilImage.Image, *, dihedral: bool = False
+) -> PerceptualHashes:
+    if not dihedral:
+        return PerceptualHashes(
+            dhash=dhash_from_image(grayscale), phash=phash_from_image(grayscale)
+        )
+    dhashes = dihedral_dhashes(grayscale)
+    phashes = dihedral_phashes(phash_input(grayscale))
+    return PerceptualHashes(
+        dhash=dhashes[0], phash=phashes[0], dhash_variants=dhashes, phash_variants=phashes
+    )
+
+
+def dhash_only(grayscale: PilImage.Image, *, dihedral: bool = False) -> PerceptualHashes:
+    if not dihedral:
+        return PerceptualHashes(dhash=dhash_from_image(grayscale), phash=None)
+    dhashes = dihedral_dhashes(grayscale)
+    return PerceptualHashes(dhash=dhashes[0], phash=None, dhash_variants=dhashes)
+
+
+def dhash_distance(left: PerceptualHashes, right: PerceptualHashes) -> int:
+    """Hamming distance, minimised over ``right``'s orientations when both carry variants."""
+    if left.dhash_variants and right.dhash_variants:
+        return min(hamming_distance(left.dhash, variant) for variant in right.dhash_variants)
+    return hamming_distance(left.dhash, right.dhash)
+
+
+def phash_distance(left: PerceptualHashes, right: PerceptualHashes) -> int | None:
+    if left.phash is None or right.phash is None:
+        return None
+    if left.phash_variants and right.phash_variants:
+        return min(hamming_distance(left.phash, variant) for variant in right.phash_variants)
+    return hamming_distance(left.phash, right.phash)
 
 
 def compute_dhash(image_bytes: bytes, *, size: int = 8) -> int:
-    image = _load_image(image_bytes).resize((size + 1, size), resample=_resample_lanczos())
+    return dhash_from_image(_load_image(image_bytes), size=size)
+
+
+def compute_phash(image_bytes: bytes, *, size: int = 32, hash_size: int = 8) -> int:
+    return phash_from_image(_load_image(image_bytes), size=size, hash_size=hash_size)
+
+
+def dhash_from_image(grayscale: PilImage.Image, *, size: int = 8) -> int:
+    image = grayscale.resize((size + 1, size), resample=_resample_lanczos())
     pixels = list(image.getdata())
     result = 0
     for row in range(size):
@@ -58,18 +407,64 @@ def compute_dhash(image_bytes: bytes, *, size: int = 8) -> int:
     return result
 
 
-def compute_phash(image_bytes: bytes, *, size: int = 32, hash_size: int = 8) -> int:
-    image = _load_image(image_bytes).resize((size, size), resample=_resample_lanczos())
+def dihedral_dhashes(grayscale: PilImage.Image, *, size: int = 8) -> tuple[int, ...]:
+    """dHash of all eight rotations/flips, from one square (size+1)² downscale."""
+    side = size + 1
+    image = grayscale.resize((side, side), resample=_resample_lanczos())
     pixels = list(image.getdata())
-    matrix = [pixels[i * size : (i + 1) * size] for i in range(size)]
-    dct = _dct_2d(matrix)
-    dct_low = [row[:hash_size] for row in dct[:hash_size]]
-    flat = [coef for row in dct_low for coef in row]
-    median = _median(flat[1:])
-    result = 0
-    for coef in flat:
-        result = (result << 1) | (1 if coef > median else 0)
-    return result
+    grid = [pixels[row * side : (row + 1) * side] for row in range(side)]
+    variants: list[int] = []
+    for block in _dihedral_blocks(grid):
+        result = 0
+        for row in range(size):
+            for col in range(size):
+                result = (result << 1) | (1 if block[row][col] > block[row][col + 1] else 0)
+        variants.append(result)
+    return tuple(variants)
+
+
+def dihedral_phashes(pixels: list[int], *, size: int = 32, hash_size: int = 8) -> tuple[int, ...]:
+    """pHash of all eight rotations/flips from one DCT.
+
+    Flipping the input negates the odd-frequency coefficients along that axis, and
+    transposing it transposes the coefficients, so no variant needs its own DCT.
+    """
+    low = _dct_low(pixels, size=size, hash_size=hash_size)
+    variants: list[int] = []
+    for transposed in (False, True):
+        block = [list(row) for row in zip(*low, strict=True)] if transposed else low
+        for flip_rows, flip_cols in _FLIPS:
+            variants.append(
+                _phash_bits(
+                    [
+                        [
+                            coef * _flip_sign(u, v, flip_rows, flip_cols)
+                            for v, coef in enumerate(row)
+                        ]
+                        for u, row in enumerate(block)
+                    ]
+                )
+            )
+    return tuple(variants)
+
+
+def phash_from_image(grayscale: PilImage.Image, *, size: int = 32, hash_size: int = 8) -> int:
+    return phash_from_pixels(phash_input(grayscale, size=size), size=size, hash_size=hash_size)
+
+
+def verification_thumbnail(grayscale: PilImage.Image) -> bytes:
+    """The ``THUMBNAIL_SIZE``² grayscale pixels pixel verification compares."""
+    size = (THUMBNAIL_SIZE, THUMBNAIL_SIZE)
+    return grayscale.resize(size, resample=_resample_lanczos()).tobytes()
+
+
+def phash_input(grayscale: PilImage.Image, *, size: int = 32) -> list[int]:
+    image = grayscale.resize((size, size), resample=_resample_lanczos())
+    return list(image.getdata())
+
+
+def phash_from_pixels(pixels: list[int], *, size: int = 32, hash_size: int = 8) -> int:
+    return _phash_bits(_dct_low(pixels, size=size, hash_size=hash_size))
 
 
 def hamming_distance(left: int, right: int) -> int:
@@ -77,12 +472,53 @@ def hamming_distance(left: int, right: int) -> int:
 
 
 def _load_image(image_bytes: bytes) -> PilImage.Image:
-    from PIL import Image, ImageOps
+    # No MIME type here, so RAW/HEIF containers are recognised by their magic bytes.
+    preview = extract_preview(image_bytes, None)
+    if preview is None:
+        return _decode(image_bytes)[0]
+    return decode_grayscale(preview.data, orientation=preview.orientation)[0]
 
-    with Image.open(BytesIO(image_bytes)) as img:
-        transposed = ImageOps.exif_transpose(img)
-        grayscale = transposed.convert("L")
-        return grayscale.copy()
+
+def _decode(image_bytes: bytes) -> tuple[PilImage.Image, int]:
+    return decode_grayscale(image_bytes)
+
+
+def _header_from_metadata(item: PhotoItem) -> ImageHeader | None:
+    if not item.width or not item.height:
+        return None
+    return ImageHeader(width=item.width, height=item.height, bands=3, format=None)
+
+
+_FLIPS = ((False, False), (True, False), (False, True), (True, True))
+
+
+def _dihedral_blocks(grid: list[list[int]]) -> list[list[list[int]]]:
+    transposed = [list(row) for row in zip(*grid, strict=True)]
+    blocks: list[list[list[int]]] = []
+    for block in (grid, transposed):
+        for flip_rows, flip_cols in _FLIPS:
+            rows = block[::-1] if flip_rows else block
+            blocks.append([row[::-1] if flip_cols else list(row) for row in rows])
+    return blocks
+
+
+def _flip_sign(u: int, v: int, flip_rows: bool, flip_cols: bool) -> int:
+    odd = (flip_rows and u % 2 == 1) != (flip_cols and v % 2 == 1)
+    return -1 if odd else 1
+
+
+def _dct_low(pixels: list[int], *, size: int, hash_size: int) -> list[list[float]]:
+    matrix = [pixels[i * size : (i + 1) * size] for i in range(size)]
+    return [row[:hash_size] for row in _dct_2d(matrix)[:hash_size]]
+
+
+def _phash_bits(dct_low: list[list[float]]) -> int:
+    flat = [coef for row in dct_low for coef in row]
+    median = _median(flat[1:])
+    result = 0
+    for coef in flat:
+        result = (result << 1) | (1 if coef > median else 0)
+    return result
 
 
 def _resample_lanczos() -> int:
@@ -0,0 +1,336 @@
+from __future__ import annotations
+
+import hashlib
+import mmap
+import multiprocessing
+import os
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, TypeVar
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+
+from app.core.config import Settings
+from app.engine.cancellation import CancellationToken
+from app.engine.decoding import (
+    ImageSource,
+    decode_grayscale,
+    image_file,
+    read_header,
+    register_heif_opener,
+)
+from app.engine.downloads import DownloadManager
+from app.engine.hashing import (
+    HashingService,
+    PerceptualHashes,
+    PerceptualWork,
+    dhash_only,
+    perceptual_hashes_from_image,
+    phash_input,
+    verification_thumbnail,
+)
+from app.engine.models import PhotoItem
+from app.engine.previews import HEIF_MIME_TYPES, extract_preview
+from app.engine.scan import run_scan
+from app.engine.schemas import ScanResult
+
+if TYPE_CHECKING:
+    from PIL import Image as PilImage
+    from PIL.Image import Exif
+
+T = TypeVar("T")
+
+# Containers Pillow cannot identify (or misreads as plain TIFF), typed by suffix instead.
+SUFFIX_MIME_TYPES = {
+    ".heic": "image/heic",
+    ".heif": "image/heif",
+    ".dng": "image/x-adobe-dng",
+    ".cr2": "image/x-canon-cr2",
+    ".nef": "image/x-nikon-nef",
+    ".arw": "image/x-sony-arw",
+}
+IMAGE_SUFFIXES = frozenset(
+    {".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tif", ".tiff", ".webp", *SUFFIX_MIME_TYPES}
+)
+
+_EXIF_IFD = 0x8769
+_EXIF_DATETIME_ORIGINAL = 36867
+_EXIF_DATETIME = 306
+
+
+@dataclass
+class LocalScan:
+    result: ScanResult
+    items: list[PhotoItem]
+    byte_hashes: dict[str, str]
+    perceptual_hashes: dict[str, PerceptualHashes]
+
+
+class LocalFileManager(DownloadManager):
+    """Reads ``file://`` items through read-only mmaps instead of caching their bytes.
+
+    Files are already local, so the page cache does the caching: prefetching only advises the
+    kernel, partial hashes touch just the mapped pages they slice, byte hashes stream the file
+    through a fixed buffer, and sizes come from stat.
+    """
+
+    def __init__(self, cancellation: CancellationToken | None = None) -> None:
+        super().__init__(
+            fetcher=read_file,
+            size_fetcher=lambda item: item_path(item).stat().st_size,
+            range_fetcher=read_file_range,
+            cancellation=cancellation,
+        )
+
+    def get_bytes(self, item: PhotoItem) -> bytes:
+        self.cancellation.raise_if_cancelled()
+        return read_file(item)
+
+    def content_digest(self, item: PhotoItem) -> str:
+        self.cancellation.raise_if_cancelled()
+        with open(item_path(item), "rb") as handle:
+            return hashlib.file_digest(handle, "sha256").hexdigest()
+
+    def known_content_length(self, item: PhotoItem) -> int | None:
+        return item_path(item).stat().st_size
+
+    def prefetch(self, item: PhotoItem) -> None:
+        advise = getattr(os, "posix_fadvise", None)
+        if advise is None:
+            return
+        with open(item_path(item), "rb") as handle:
+            advise(handle.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+
+
+class PooledHashingService(HashingService):
+    """Decodes and perceptually hashes local files in worker processes, by path."""
+
+    def __init__(
+        self,
+        download_manager: DownloadManager,
+        executor: Executor,
+        *,
+        max_decode_pixels: int | None = None,
+        dihedral: bool = False,
+        keep_thumbnails: bool = False,
+    ) -> None:
+        super().__init__(
+            download_manager,
+            max_decode_pixels=max_decode_pixels,
+            dihedral=dihedral,
+            keep_thumbnails=keep_thumbnails,
+        )
+        self._executor = executor
+
+    def _compute_perceptual(self, item: PhotoItem) -> PerceptualHashes:
+        self.cancellation.raise_if_cancelled()
+        hashes, pixel_bytes, reduced, from_preview, thumbnail = self._submit(hash_file, item)
+        self._record_decode(item, reduced, from_preview, thumbnail)
+        self._store_perceptual(item.id, hashes, pixel_bytes)
+        return hashes
+
+    def _compute_dhash(self, item: PhotoItem) -> PerceptualWork:
+        hashes, pixels, pixel_bytes, reduced, from_preview, thumbnail = self._submit(
+            dhash_file, item
+        )
+        self._record_decode(item, reduced, from_preview, thumbnail)
+        with self._lock:
+            self._phash_inputs[item.id] = pixels
+            self.deferred_phash_count += 1
+        self._store_perceptual(item.id, hashes, pixel_bytes)
+        return PerceptualWork(hashes, pixels, thumbnail)
+
+    def _submit(self, worker: Callable[..., T], item: PhotoItem) -> T:
+        return self._executor.submit(
+            worker,
+            str(item_path(item)),
+            mime_type=item.mime_type,
+            max_decode_pixels=self._max_decode_pixels,
+            dihedral=self._dihedral,
+            keep_thumbnail=self._keep_thumbnails,
+        ).result()
+
+    def _record_decode(
+        self, item: PhotoItem, reduced: bool, from_preview: bool, thumbnail: bytes | None
+    ) -> None:
+        with self._lock:
+            self.reduced_decode_count += reduced
+            self.preview_decode_count += from_preview
+            if thumbnail is not None:
+                self._thumbnails[item.id] = thumbnail
+
+
+def scan_local(paths: Iterable[Path], settings: Settings, *, workers: int) -> LocalScan:
+    """Describe and scan local image files, decoding across ``workers`` processes."""
+    workers = max(workers, 1)
+    # Pipeline threads mostly wait on pool futures, so run one per worker process.
+    settings = settings.model_copy(
+        update={"scan_hash_concurrency": workers, "scan_download_concurrency": workers}
+    )
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        described = pool.map(describe_file, [str(path) for path in paths], chunksize=64)
+        items = [item for item in described if item is not None]
+        hashing_service = PooledHashingService(
+            LocalFileManager(),
+            pool,
+            max_decode_pixels=settings.scan_decode_max_pixels,
+            dihedral=settings.scan_dihedral_invariant,
+            keep_thumbnails=settings.scan_verify_enabled,
+        )
+        result = run_scan(items, settings, hashing_service=hashing_service)
+    return LocalScan(
+        result=result,
+        items=items,
+        byte_hashes=hashing_service.byte_hashes,
+        perceptual_hashes=hashing_service.perceptual_hashes,
+    )
+
+
+def discover_files(root: Path) -> list[Path]:
+    return sorted(
+        path for path in root.rglob("*") if path.suffix.lower() in IMAGE_SUFFIXES and path.is_file()
+    )
+
+
+def read_manifest(manifest: Path) -> list[Path]:
+    """One path per line, relative to the manifest's directory; blank and ``#`` lines skipped."""
+    paths: list[Path] = []
+    for line in manifest.read_text(encoding="utf-8").splitlines():
+        entry = line.strip()
+        if entry and not entry.startswith("#"):
+            paths.append(manifest.parent / entry)
+    return paths
+
+
+def describe_file(path: str) -> PhotoItem | None:
+    """Build a ``PhotoItem`` from the file's header and EXIF; ``None`` if it is not an image.
+
+    RAW and HEIF files are described from their embedded preview when Pillow cannot open them.
+    """
+    from PIL import Image, UnidentifiedImageError
+
+    file_path = Path(path).resolve()
+    mime_type = SUFFIX_MIME_TYPES.get(file_path.suffix.lower())
+    try:
+        with _mapped(file_path) as source:
+            preview = extract_preview(source, mime_type)
+            if preview is None and mime_type in HEIF_MIME_TYPES:
+                register_heif_opener()
+            opened = source if preview is None else preview.data
+            with Image.open(image_file(opened)) as img:
+                width, height, image_format = img.width, img.height, img.format
+                create_time = _exif_datetime(img.getexif())
+    except (OSError, UnidentifiedImageError, ValueError):
+        return None
+    if create_time is None:
+        create_time = datetime.fromtimestamp(file_path.stat().st_mtime, tz=UTC)
+    return PhotoItem(
+        id=str(file_path),
+        create_time=create_time,
+        filename=file_path.name,
+        mime_type=mime_type or Image.MIME.get(image_format or ""),
+        width=width,
+        height=height,
+        gps=None,
+        download_url=file_path.as_uri(),
+        deep_link=None,
+    )
+
+
+def hash_file(
+    path: str,
+    *,
+    mime_type: str | None = None,
+    max_decode_pixels: int | None = None,
+    dihedral: bool = False,
+    keep_thumbnail: bool = False,
+) -> tuple[PerceptualHashes, int, bool, bool, bytes | None]:
+    """Worker-side decode of a mapped file.
+
+    Returns the hashes, decoded pixel bytes, whether the decode was reduced-scale, whether it
+    used an embedded preview, and the verification thumbnail if ``keep_thumbnail``.
+    """
+    image, pixel_bytes, reduced, from_preview = _decode_file(path, mime_type, max_decode_pixels)
+    hashes = perceptual_hashes_from_image(image, dihedral=dihedral)
+    thumbnail = verification_thumbnail(image) if keep_thumbnail else None
+    return hashes, pixel_bytes, reduced, from_preview, thumbnail
+
+
+def dhash_file(
+    path: str,
+    *,
+    mime_type: str | None = None,
+    max_decode_pixels: int | None = None,
+    dihedral: bool = False,
+    keep_thumbnail: bool = False,
+) -> tuple[PerceptualHashes, list[int], int, bool, bool, bytes | None]:
+    """Like :func:`hash_file` for the lazy cascade: dHash plus the pHash input, not pHash."""
+    image, pixel_bytes, reduced, from_preview = _decode_file(path, mime_type, max_decode_pixels)
+    hashes = dhash_only(image, dihedral=dihedral)
+    thumbnail = verification_thumbnail(image) if keep_thumbnail else None
+    return hashes, phash_input(image), pixel_bytes, reduced, from_preview, thumbnail
+
+
+def _decode_file(
+    path: str, mime_type: str | None, max_decode_pixels: int | None
+) -> tuple[PilImage.Image, int, bool, bool]:
+    with _mapped(Path(path)) as source:
+        preview = extract_preview(source, mime_type)
+        if preview is None and mime_type in HEIF_MIME_TYPES:
+            register_heif_opener()
+        decoded = source if preview is None else preview.data
+        header = read_header(decoded)
+        reduced = (
+            header is not None
+            and max_decode_pixels is not None
+            and header.pixels > max_decode_pixels
+        )
+        image, pixel_bytes = decode_grayscale(
+            decoded,
+            max_pixels=max_decode_pixels,
+            orientation=None if preview is None else preview.orientation,
+        )
+    return image, pixel_bytes, reduced, preview is not None
+
+
+def item_path(item: PhotoItem) -> Path:
+    if not item.download_url or not item.download_url.startswith("file:"):
+        raise ValueError(f"Photo item {item.id} is not a local file")
+    return Path(url2pathname(urlparse(item.download_url).path))
+
+
+def read_file(item: PhotoItem) -> bytes:
+    with _mapped(item_path(item)) as source:
+        return source[:]
+
+
+def read_file_range(item: PhotoItem, start: int, length: int) -> bytes:
+    with _mapped(item_path(item)) as source:
+        return source[start : start + length]
+
+
+@contextmanager
+def _mapped(path: Path) -> Iterator[ImageSource]:
+    with open(path, "rb") as handle:
+        try:
+            mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped.
+            yield b""
+            return
+        with mapped:
+            yield mapped
+
+
+def _exif_datetime(exif: Exif) -> datetime | None:
+    value = exif.get_ifd(_EXIF_IFD).get(_EXIF_DATETIME_ORIGINAL) or exif.get(_EXIF_DATETIME)
+    if not isinstance(value, str):
+        return None
+    try:
+        return datetime.strptime(value.strip("\x00 "), "%Y:%m:%d %H:%M:%S").replace(tzinfo=UTC)
+    except ValueError:
+        return None
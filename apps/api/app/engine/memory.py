@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import os
+import resource
+import threading
+import tracemalloc
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+_tracing_lock = threading.Lock()
+
+
+class MemoryTracker:
+    """Per-stage memory accounting for a scan.
+
+    ``rss`` mode records RSS deltas and engine counters. ``traced`` also records the change in
+    tracemalloc's traced memory per stage. tracemalloc is process-wide: it is started once (see
+    ``start_tracing``) and never stopped or reset by a scan, so concurrent scans cannot disturb
+    each other's tracing, but traced deltas include their allocations.
+    """
+
+    def __init__(self, mode: str = "off") -> None:
+        self.enabled = mode in {"rss", "traced"}
+        self.tracing = mode == "traced"
+        self._rss_at_begin = 0
+        self._traced_at_begin = 0
+        self._values: dict[str, int] = {}
+
+    def start(self) -> None:
+        if not self.enabled:
+            return
+        if self.tracing:
+            start_tracing()
+        self._values["rss_start"] = current_rss_bytes()
+
+    def begin(self) -> None:
+        if not self.enabled:
+            return
+        self._rss_at_begin = current_rss_bytes()
+        if self.tracing:
+            self._traced_at_begin = tracemalloc.get_traced_memory()[0]
+
+    def end(self, stage: str) -> None:
+        if not self.enabled:
+            return
+        self._values[f"{stage}_rss_delta"] = current_rss_bytes() - self._rss_at_begin
+        if self.tracing and tracemalloc.is_tracing():
+            traced = tracemalloc.get_traced_memory()[0]
+            self._values[f"{stage}_traced_delta"] = traced - self._traced_at_begin
+
+    def record(self, name: str, value: int) -> None:
+        if self.enabled:
+            self._values[name] = value
+
+    def finish(self) -> dict[str, int]:
+        if not self.enabled:
+            return {}
+        self._values["rss_end"] = current_rss_bytes()
+        self._values["rss_peak"] = peak_rss_bytes()
+        if self.tracing and tracemalloc.is_tracing():
+            self._values["traced_process_peak"] = tracemalloc.get_traced_memory()[1]
+        return dict(self._values)
+
+
+def start_tracing() -> None:
+    """Turn on process-wide tracemalloc for ``traced`` mode; it stays on for the process."""
+    with _tracing_lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+
+def current_rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm", encoding="ascii") as statm:
+            return int(statm.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes() -> int:
+    # ru_maxrss is kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
@@ -0,0 +1,334 @@
+from __future__ import annotations
+
+import itertools
+import math
+import queue
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Callable, Iterator, Sequence
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import TypeVar
+
+from app.engine.cancellation import ScanCancelled
+from app.engine.downloads import DownloadManager
+from app.engine.hashing import HashingService, PerceptualHashes
+from app.engine.models import PhotoItem
+from app.engine.scheduling import expected_bytes, order_items
+
+QueueValue = TypeVar("QueueValue")
+
+_POLL_SECONDS = 0.05
+_STAGES = ("download", "byte_hash", "perceptual_hash")
+
+SetHasher = Callable[[Sequence[PhotoItem]], dict[str, PerceptualHashes]]
+
+
+@dataclass
+class PipelineResult:
+    byte_hashes: dict[str, str]
+    perceptual_hashes: dict[str, PerceptualHashes]
+    completed_sets: set[int]
+    wall_ms: float
+    halted: bool = False
+    busy_ms: dict[str, float] = field(default_factory=dict)
+    occupancy: dict[str, float] = field(default_factory=dict)
+    # First start to last finish of each stage's work, against busy_ms (the per-item sum).
+    makespan_ms: dict[str, float] = field(default_factory=dict)
+    peak_queue_depth: dict[str, int] = field(default_factory=dict)
+
+
+class _Sentinel:
+    pass
+
+
+_DONE = _Sentinel()
+
+
+class ScanPipeline:
+    """Runs download, SHA-256 and perceptual hashing as overlapping stages.
+
+    Download workers feed byte-hash workers through a bounded queue. Once every
+    downloadable member of a candidate set has been fetched (and byte-hashed when
+    requested), the set is queued for perceptual hashing, so decoding starts while
+    other downloads are still in flight. ``schedule_policy`` (see ``order_items``) orders
+    downloads and ready sets by expected cost; ``input`` keeps the given order.
+    """
+
+    def __init__(
+        self,
+        download_manager: DownloadManager,
+        hashing_service: HashingService,
+        *,
+        download_workers: int = 4,
+        hash_workers: int = 2,
+        queue_size: int = 16,
+        set_hasher: SetHasher | None = None,
+        schedule_policy: str = "input",
+    ) -> None:
+        self._download_manager = download_manager
+        self._schedule_policy = schedule_policy
+        self._hashing_service = hashing_service
+        self._set_hasher = set_hasher or _eager_set_hasher(hashing_service)
+        self._workers = {
+            "download": max(download_workers, 1),
+            "byte_hash": max(hash_workers, 1),
+            "perceptual_hash": max(hash_workers, 1),
+        }
+        self._queue_size = max(queue_size, 1)
+
+    def run(
+        self,
+        byte_hash_items: Sequence[PhotoItem],
+        candidate_sets: Sequence[Sequence[PhotoItem]],
+        should_stop: Callable[[], bool] | None = None,
+    ) -> PipelineResult:
+        """Process candidate sets in the given order; ``should_stop`` halts new downloads."""
+        return _PipelineRun(self, byte_hash_items, candidate_sets, should_stop).execute()
+
+
+class _PipelineRun:
+    def __init__(
+        self,
+        pipeline: ScanPipeline,
+        byte_hash_items: Sequence[PhotoItem],
+        candidate_sets: Sequence[Sequence[PhotoItem]],
+        should_stop: Callable[[], bool] | None,
+    ) -> None:
+        self._pipeline = pipeline
+        self._should_stop = should_stop
+        self._halted = False
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._errors: list[BaseException] = []
+        self._byte_hash_ids = {item.id for item in byte_hash_items}
+        self._sets = [list(group) for group in candidate_sets]
+        self._pending: list[int] = []
+        self._sets_by_item: dict[str, list[int]] = defaultdict(list)
+        fetch_order: dict[str, PhotoItem] = {}
+        for index, group in enumerate(self._sets):
+            members = {item.id: item for item in group if item.download_url is not None}
+            self._pending.append(len(members))
+            for item_id, item in members.items():
+                self._sets_by_item[item_id].append(index)
+                fetch_order.setdefault(item_id, item)
+        for item in byte_hash_items:
+            if item.download_url is not None:
+                fetch_order.setdefault(item.id, item)
+        content_length = pipeline._download_manager.known_content_length
+        self._fetch_items = order_items(
+            list(fetch_order.values()),
+            pipeline._schedule_policy,
+            content_length=content_length,
+            set_sizes={
+                item_id: max(self._pending[index] for index in indexes)
+                for item_id, indexes in self._sets_by_item.items()
+            },
+        )
+        self._set_priority = [
+            _set_priority(pipeline._schedule_policy, index, group, content_length)
+            for index, group in enumerate(self._sets)
+        ]
+        self._sequence = itertools.count()
+        self._inbox: queue.Queue[PhotoItem] = queue.Queue()
+        self._fetched: queue.Queue[PhotoItem | _Sentinel] = queue.Queue(pipeline._queue_size)
+        # Ready sets are served in priority order: (priority, sequence, set index).
+        self._ready_sets: queue.PriorityQueue[tuple[float, int, int | _Sentinel]] = (
+            queue.PriorityQueue(pipeline._queue_size)
+        )
+        self._byte_hashes: dict[str, str] = {}
+        self._digest_counts: dict[str, int] = defaultdict(int)
+        self._perceptual: dict[str, PerceptualHashes] = {}
+        self._completed_sets: set[int] = set()
+        self._busy: dict[str, float] = {stage: 0.0 for stage in _STAGES}
+        self._spans: dict[str, tuple[float, float]] = {}
+        self._peak_depth = {"fetched": 0, "ready_sets": 0}
+
+    def execute(self) -> PipelineResult:
+        start = time.perf_counter()
+        for item in self._fetch_items:
+            self._inbox.put(item)
+
+        workers = self._pipeline._workers
+        downloaders = self._spawn(workers["download"], self._download_worker)
+        hashers = self._spawn(workers["byte_hash"], self._byte_hash_worker)
+        decoders = self._spawn(workers["perceptual_hash"], self._perceptual_worker)
+
+        self._join(downloaders)
+        for _ in hashers:
+            self._put(self._fetched, _DONE)
+        self._join(hashers)
+        for _ in decoders:
+            self._put(self._ready_sets, (math.inf, next(self._sequence), _DONE))
+        self._join(decoders)
+
+        if self._errors:
+            raise self._errors[0]
+
+        wall_seconds = time.perf_counter() - start
+        return PipelineResult(
+            byte_hashes=self._byte_hashes,
+            perceptual_hashes=self._perceptual,
+            completed_sets=self._completed_sets,
+            halted=self._halted,
+            wall_ms=round(wall_seconds * 1000, 2),
+            busy_ms={stage: round(busy * 1000, 2) for stage, busy in self._busy.items()},
+            makespan_ms={
+                stage: round((end - begin) * 1000, 2) for stage, (begin, end) in self._spans.items()
+            },
+            occupancy={
+                stage: _occupancy(self._busy[stage], wall_seconds, workers[stage])
+                for stage in _STAGES
+            },
+            peak_queue_depth=dict(self._peak_depth),
+        )
+
+    def _download_worker(self) -> None:
+        while not self._stop.is_set():
+            if self._should_stop is not None and self._should_stop():
+                self._halted = True
+                return
+            try:
+                item = self._inbox.get_nowait()
+            except queue.Empty:
+                return
+            with self._timed("download"):
+                self._pipeline._download_manager.prefetch(item)
+            self._put(self._fetched, item)
+            self._track_depth("fetched", self._fetched)
+
+    def _byte_hash_worker(self) -> None:
+        hashing_service = self._pipeline._hashing_service
+        while True:
+            entry = self._get(self._fetched)
+            if entry is None or isinstance(entry, _Sentinel):
+                return
+            if entry.id in self._byte_hash_ids:
+                with self._timed("byte_hash"):
+                    digest = hashing_service.get_byte_hash(entry)
+                with self._lock:
+                    self._byte_hashes[entry.id] = digest
+                    self._digest_counts[digest] += 1
+            for index in self._sets_by_item.get(entry.id, []):
+                with self._lock:
+                    self._pending[index] -= 1
+                    ready = self._pending[index] == 0
+                if ready:
+                    priority = (self._set_priority[index], next(self._sequence), index)
+                    self._put(self._ready_sets, priority)
+                    self._track_depth("ready_sets", self._ready_sets)
+
+    def _perceptual_worker(self) -> None:
+        set_hasher = self._pipeline._set_hasher
+        while True:
+            queued = self._get(self._ready_sets)
+            if queued is None or isinstance(queued[2], _Sentinel):
+                return
+            entry = queued[2]
+            members = [
+                item
+                for item in self._sets[entry]
+                if item.download_url is not None and not self._is_known_exact_duplicate(item.id)
+            ]
+            with self._timed("perceptual_hash"):
+                hashes = set_hasher(members)
+            with self._lock:
+                for item_id, value in hashes.items():
+                    # An item shared with another set may already carry a pHash from there.
+                    known = self._perceptual.get(item_id)
+                    if known is None or known.phash is None:
+                        self._perceptual[item_id] = value
+            with self._lock:
+                self._completed_sets.add(entry)
+
+    def _is_known_exact_duplicate(self, item_id: str) -> bool:
+        with self._lock:
+            digest = self._byte_hashes.get(item_id)
+            return digest is not None and self._digest_counts[digest] >= 2
+
+    def _spawn(self, count: int, target: Callable[[], None]) -> list[threading.Thread]:
+        threads = [
+            threading.Thread(target=self._guarded, args=(target,), daemon=True)
+            for _ in range(count)
+        ]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def _guarded(self, target: Callable[[], None]) -> None:
+        try:
+            target()
+        except ScanCancelled:
+            self._halted = True
+            self._stop.set()
+        except Exception as exc:
+            with self._lock:
+                self._errors.append(exc)
+            self._stop.set()
+
+    def _join(self, threads: list[threading.Thread]) -> None:
+        for thread in threads:
+            thread.join()
+
+    def _put(self, target: queue.Queue[QueueValue], value: QueueValue) -> None:
+        while not self._stop.is_set():
+            try:
+                target.put(value, timeout=_POLL_SECONDS)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, source: queue.Queue[QueueValue]) -> QueueValue | None:
+        while not self._stop.is_set():
+            try:
+                return source.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                continue
+        return None
+
+    def _track_depth(self, name: str, source: queue.Queue[QueueValue]) -> None:
+        depth = source.qsize()
+        with self._lock:
+            if depth > self._peak_depth[name]:
+                self._peak_depth[name] = depth
+
+    @contextmanager
+    def _timed(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self._busy[stage] += end - start
+                begin = self._spans.get(stage, (start, end))[0]
+                self._spans[stage] = (min(begin, start), end)
+
+
+def _eager_set_hasher(hashing_service: HashingService) -> SetHasher:
+    def hash_members(items: Sequence[PhotoItem]) -> dict[str, PerceptualHashes]:
+        return {item.id: hashing_service.get_perceptual_hashes(item) for item in items}
+
+    return hash_members
+
+
+def _set_priority(
+    policy: str,
+    index: int,
+    group: Sequence[PhotoItem],
+    content_length: Callable[[PhotoItem], int | None],
+) -> float:
+    """Lower is served first: input order, or the largest total bytes / member count."""
+    members = [item for item in group if item.download_url is not None]
+    if policy == "largest_first":
+        return -sum(expected_bytes(item, content_length(item)) for item in members)
+    if policy == "largest_sets_first":
+        return -float(len(members))
+    return float(index)
+
+
+def _occupancy(busy_seconds: float, wall_seconds: float, workers: int) -> float:
+    if wall_seconds <= 0:
+        return 0.0
+    return round(min(busy_seconds / (wall_seconds * workers), 1.0), 4)
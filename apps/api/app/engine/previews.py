@@ -0,0 +1,273 @@
+from __future__ import annotations
+
+import struct
+from dataclasses import dataclass
+
+from app.engine.decoding import ImageSource
+
+RAW_MIME_TYPES = frozenset(
+    {
+        "image/dng",
+        "image/x-adobe-dng",
+        "image/x-canon-cr2",
+        "image/x-nikon-nef",
+        "image/x-sony-arw",
+        "image/x-pentax-pef",
+        "image/x-raw",
+    }
+)
+HEIF_MIME_TYPES = frozenset({"image/heic", "image/heif", "image/heic-sequence", "image/avif"})
+
+_TIFF_ORIENTATION = 274
+_TIFF_COMPRESSION = 259
+_TIFF_STRIP_OFFSETS = 273
+_TIFF_STRIP_BYTE_COUNTS = 279
+_TIFF_SUB_IFDS = 330
+_TIFF_JPEG_OFFSET = 513
+_TIFF_JPEG_LENGTH = 514
+_TIFF_JPEG_COMPRESSIONS = (6, 7)
+_TIFF_TYPE_SIZES = {1: 1, 3: 2, 4: 4, 13: 4}
+_MAX_IFDS = 64
+# Baseline, extended and progressive DCT; lossless (SOF3) previews are not decodable.
+_JPEG_DCT_MARKERS = (0xC0, 0xC1, 0xC2)
+_HEIF_BRANDS = (b"heic", b"heix", b"heim", b"heis", b"hevc", b"hevx", b"mif1", b"msf1", b"avif")
+
+
+@dataclass(frozen=True)
+class EmbeddedPreview:
+    data: bytes
+    # TIFF orientation of the container, applied when the preview carries none of its own.
+    orientation: int | None
+    source: str
+
+
+def extract_preview(data: ImageSource, mime_type: str | None) -> EmbeddedPreview | None:
+    """Largest decodable JPEG preview embedded in a RAW (TIFF-based) or HEIF container.
+
+    The container is chosen by ``mime_type``, or sniffed from its first bytes when the type
+    is missing or generic. Returns ``None`` for other formats and for containers without a
+    usable preview, so callers fall back to a full decode.
+    """
+    kind = _container_kind(data, mime_type)
+    try:
+        if kind == "raw":
+            return _tiff_preview(data, 0, source="raw")
+        if kind == "heif":
+            return _heif_preview(data)
+    except (struct.error, ValueError, IndexError):
+        return None
+    return None
+
+
+def _container_kind(data: ImageSource, mime_type: str | None) -> str | None:
+    mime = (mime_type or "").lower()
+    if mime in RAW_MIME_TYPES:
+        return "raw"
+    if mime in HEIF_MIME_TYPES:
+        return "heif"
+    if mime and mime not in {"application/octet-stream", "image/x-unknown"}:
+        return None
+    head = data[:12]
+    if head[4:8] == b"ftyp" and head[8:12] in _HEIF_BRANDS:
+        return "heif"
+    if head[:4] in (b"II*\x00", b"MM\x00*") and data[8:10] == b"CR":
+        return "raw"
+    return None
+
+
+def _tiff_preview(data: ImageSource, base: int, *, source: str) -> EmbeddedPreview | None:
+    """Walk IFD0's chain and SubIFDs of a TIFF starting at ``base`` for JPEG previews."""
+    order = {b"II": "<", b"MM": ">"}.get(data[base : base + 2])
+    if order is None or struct.unpack_from(f"{order}H", data, base + 2)[0] != 42:
+        return None
+    pending = [struct.unpack_from(f"{order}I", data, base + 4)[0]]
+    visited: set[int] = set()
+    orientation: int | None = None
+    candidates: list[tuple[int, int]] = []
+    while pending and len(visited) < _MAX_IFDS:
+        offset = pending.pop(0)
+        if not offset or offset in visited or base + offset + 2 > len(data):
+            continue
+        visited.add(offset)
+        tags, next_offset = _read_ifd(data, base, offset, order)
+        if orientation is None and _TIFF_ORIENTATION in tags:
+            orientation = tags[_TIFF_ORIENTATION][0]
+        if _TIFF_JPEG_OFFSET in tags and _TIFF_JPEG_LENGTH in tags:
+            candidates.append((tags[_TIFF_JPEG_OFFSET][0], tags[_TIFF_JPEG_LENGTH][0]))
+        compression = tags.get(_TIFF_COMPRESSION, [0])[0]
+        strips = tags.get(_TIFF_STRIP_OFFSETS, [])
+        if compression in _TIFF_JPEG_COMPRESSIONS and len(strips) == 1:
+            candidates.append((strips[0], tags.get(_TIFF_STRIP_BYTE_COUNTS, [0])[0]))
+        pending.extend(tags.get(_TIFF_SUB_IFDS, []))
+        pending.append(next_offset)
+    previews = [
+        bytes(data[base + start : base + start + length])
+        for start, length in candidates
+        if length > 0 and base + start + length <= len(data)
+    ]
+    decodable = [preview for preview in previews if _is_dct_jpeg(preview)]
+    if not decodable:
+        return None
+    return EmbeddedPreview(
+        data=max(decodable, key=len),
+        orientation=orientation,
+        source=source,
+    )
+
+
+def _read_ifd(
+    data: ImageSource, base: int, offset: int, order: str
+) -> tuple[dict[int, list[int]], int]:
+    position = base + offset
+    (count,) = struct.unpack_from(f"{order}H", data, position)
+    tags: dict[int, list[int]] = {}
+    for index in range(count):
+        entry = position + 2 + index * 12
+        tag, value_type, value_count = struct.unpack_from(f"{order}HHI", data, entry)
+        size = _TIFF_TYPE_SIZES.get(value_type)
+        if size is None or value_count == 0:
+            continue
+        value_offset = entry + 8
+        if size * value_count > 4:
+            value_offset = base + struct.unpack_from(f"{order}I", data, entry + 8)[0]
+        code = {1: "B", 2: "H", 4: "I"}[size]
+        tags[tag] = list(struct.unpack_from(f"{order}{value_count}{code}", data, value_offset))
+    (next_offset,) = struct.unpack_from(f"{order}I", data, position + 2 + count * 12)
+    return tags, next_offset
+
+
+def _heif_preview(data: ImageSource) -> EmbeddedPreview | None:
+    """A ``jpeg`` item, else the thumbnail inside the ``Exif`` item (HEVC is not decoded)."""
+    meta = _find_box(data, 0, len(data), b"meta")
+    if meta is None:
+        return None
+    # meta is a full box: skip version and flags.
+    children = (meta[0] + 4, meta[1])
+    item_types = _heif_item_types(data, children)
+    locations = _heif_item_locations(data, children)
+    jpeg_items = [
+        blob
+        for item_id, item_type in item_types.items()
+        if item_type == b"jpeg" and item_id in locations
+        for blob in [_read_extents(data, locations[item_id])]
+        if _is_dct_jpeg(blob)
+    ]
+    if jpeg_items:
+        return EmbeddedPreview(data=max(jpeg_items, key=len), orientation=None, source="heif")
+    for item_id, item_type in item_types.items():
+        if item_type == b"Exif" and item_id in locations:
+            exif = _read_extents(data, locations[item_id])
+            # The Exif item starts with the offset of the TIFF header within it.
+            (tiff_offset,) = struct.unpack_from(">I", exif, 0)
+            preview = _tiff_preview(exif, 4 + tiff_offset, source="heif-exif")
+            if preview is not None:
+                return preview
+    return None
+
+
+def _heif_item_types(data: ImageSource, bounds: tuple[int, int]) -> dict[int, bytes]:
+    iinf = _find_box(data, bounds[0], bounds[1], b"iinf")
+    if iinf is None:
+        return {}
+    version = data[iinf[0]]
+    position = iinf[0] + 4 + (2 if version == 0 else 4)
+    item_types: dict[int, bytes] = {}
+    for start, end in _iter_boxes(data, position, iinf[1], b"infe"):
+        infe_version = data[start]
+        if infe_version < 2:
+            continue
+        if infe_version == 2:
+            (item_id,) = struct.unpack_from(">H", data, start + 4)
+            type_offset = start + 8
+        else:
+            (item_id,) = struct.unpack_from(">I", data, start + 4)
+            type_offset = start + 10
+        if type_offset + 4 <= end:
+            item_types[item_id] = bytes(data[type_offset : type_offset + 4])
+    return item_types
+
+
+def _heif_item_locations(
+    data: ImageSource, bounds: tuple[int, int]
+) -> dict[int, list[tuple[int, int]]]:
+    iloc = _find_box(data, bounds[0], bounds[1], b"iloc")
+    if iloc is None:
+        return {}
+    position = iloc[0]
+    version = data[position]
+    sizes = data[position + 4]
+    offset_size, length_size = sizes >> 4, sizes & 0x0F
+    more_sizes = data[position + 5]
+    base_offset_size = more_sizes >> 4
+    index_size = more_sizes & 0x0F if version in (1, 2) else 0
+    position += 6
+    item_count, position = _read_uint(data, position, 2 if version < 2 else 4)
+    locations: dict[int, list[tuple[int, int]]] = {}
+    for _ in range(item_count):
+        item_id, position = _read_uint(data, position, 2 if version < 2 else 4)
+        construction_method = 0
+        if version in (1, 2):
+            method, position = _read_uint(data, position, 2)
+            construction_method = method & 0x0F
+        position += 2  # data_reference_index
+        base_offset, position = _read_uint(data, position, base_offset_size)
+        extent_count, position = _read_uint(data, position, 2)
+        extents: list[tuple[int, int]] = []
+        for _ in range(extent_count):
+            position += index_size
+            extent_offset, position = _read_uint(data, position, offset_size)
+            extent_length, position = _read_uint(data, position, length_size)
+            extents.append((base_offset + extent_offset, extent_length))
+        # Only file-offset items (method 0) can be read without the idat box.
+        if construction_method == 0:
+            locations[item_id] = extents
+    return locations
+
+
+def _read_extents(data: ImageSource, extents: list[tuple[int, int]]) -> bytes:
+    return b"".join(bytes(data[offset : offset + length]) for offset, length in extents)
+
+
+def _read_uint(data: ImageSource, position: int, size: int) -> tuple[int, int]:
+    if size == 0:
+        return 0, position
+    return int.from_bytes(data[position : position + size], "big"), position + size
+
+
+def _find_box(data: ImageSource, start: int, end: int, box_type: bytes) -> tuple[int, int] | None:
+    return next(iter(_iter_boxes(data, start, end, box_type)), None)
+
+
+def _iter_boxes(data: ImageSource, start: int, end: int, box_type: bytes) -> list[tuple[int, int]]:
+    """Payload ``(start, end)`` of each ``box_type`` box directly inside ``[start, end)``."""
+    boxes: list[tuple[int, int]] = []
+    position = start
+    while position + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", data, position)
+        header = 8
+        if size == 1:
+            (size,) = struct.unpack_from(">Q", data, position + 8)
+            header = 16
+        elif size == 0:
+            size = end - position
+        if size < header:
+            break
+        if kind == box_type:
+            boxes.append((position + header, min(position + size, end)))
+        position += size
+    return boxes
+
+
+def _is_dct_jpeg(blob: bytes) -> bool:
+    if not blob.startswith(b"\xff\xd8"):
+        return False
+    position = 2
+    while position + 4 <= len(blob):
+        if blob[position] != 0xFF:
+            return False
+        marker = blob[position + 1]
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            return marker in _JPEG_DCT_MARKERS
+        (length,) = struct.unpack_from(">H", blob, position + 2)
+        position += 2 + length
+    return False
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import cProfile
+import marshal
+import os
+import sys
+import threading
+from collections import Counter
+from collections.abc import Callable
+from dataclasses import dataclass
+from types import FrameType
+from typing import TypeVar
+
+ResultType = TypeVar("ResultType")
+
+
+@dataclass(frozen=True)
+class RunProfile:
+    mode: str
+    samples: int
+    # Brendan Gregg's collapsed-stack format: "thread;outer;...;inner count" per line.
+    collapsed: str
+    # Marshalled cProfile stats (what ``Profile.dump_stats`` writes); deterministic mode only.
+    pstats: bytes | None = None
+
+
+class StackSampler:
+    """Wall-clock sampler of every thread's Python stack, stopped after ``max_samples``.
+
+    Sampling is process-wide, so concurrent scans' threads show up too; their stacks are
+    labelled with the thread name.
+    """
+
+    def __init__(self, interval_seconds: float, max_samples: int) -> None:
+        self._interval = max(interval_seconds, 0.001)
+        self._max_samples = max_samples
+        self._stacks: Counter[str] = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self.samples = 0
+
+    def __enter__(self) -> StackSampler:
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self._stacks.items()))
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self._interval) and self.samples < self._max_samples:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                label = names.get(thread_id, f"thread-{thread_id}")
+                self._stacks[";".join([label, *_frame_labels(frame)])] += 1
+            self.samples += 1
+
+
+def profile_run(
+    compute: Callable[[], ResultType],
+    *,
+    mode: str,
+    interval_seconds: float,
+    max_samples: int,
+) -> tuple[ResultType, RunProfile]:
+    """Run ``compute`` under the sampler and, in deterministic mode, cProfile on this thread."""
+    profiler = cProfile.Profile() if mode == "deterministic" else None
+    with StackSampler(interval_seconds, max_samples) as sampler:
+        if profiler is None:
+            result = compute()
+        else:
+            # cProfile only sees the calling thread; pipeline workers appear in the samples.
+            result = profiler.runcall(compute)
+    pstats_bytes = None
+    if profiler is not None:
+        profiler.create_stats()
+        pstats_bytes = marshal.dumps(profiler.stats)
+    return result, RunProfile(
+        mode=mode,
+        samples=sampler.samples,
+        collapsed=sampler.collapsed(),
+        pstats=pstats_bytes,
+    )
+
+
+def _frame_labels(frame: FrameType | None) -> list[str]:
+    labels: list[str] = []
+    while frame is not None:
+        code = frame.f_code
+        location = f"{os.path.basename(code.co_filename)}:{code.co_firstlineno}"
+        labels.append(f"{code.co_name} ({location})")
+        frame = frame.f_back
+    labels.reverse()
+    return labels
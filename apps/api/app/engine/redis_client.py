@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+import importlib
+import logging
+from typing import Any
+
+from app.core.config import Settings
+
+logger = logging.getLogger(__name__)
+
+
+def redis_client(settings: Settings, *, fallback: str, required: bool = False) -> Any | None:
+    """A client for ``REDIS_URL``, or ``None`` when the optional ``redis`` extra is missing.
+
+    The miss is logged as a warning when Redis was asked for (``required``, or ``REDIS_URL``
+    set in the environment), since every replica then silently keeps its state to itself.
+    """
+    try:
+        redis_module = importlib.import_module("redis")
+    except ImportError:
+        expected = required or "redis_url" in settings.model_fields_set
+        (logger.warning if expected else logger.info)(
+            "redis package not installed (install photoprune-api[redis]); %s", fallback
+        )
+        return None
+    return redis_module.Redis.from_url(settings.redis_url, socket_timeout=0.5)
@@ -0,0 +1,396 @@
+from __future__ import annotations
+
+import importlib
+import logging
+import queue
+import threading
+from collections.abc import Callable, Mapping, Sequence
+from dataclasses import dataclass, field, replace
+from datetime import UTC, datetime
+from functools import lru_cache
+from typing import Any, Protocol
+
+from app.core.config import get_settings
+from app.engine.hashing import PerceptualHashes
+from app.engine.schemas import CostEstimate, ScanResult
+
+logger = logging.getLogger(__name__)
+
+# Children reference runs, and the (run_id, ...) primary keys double as the runId index.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scan_runs (
+    run_id text PRIMARY KEY,
+    created_at timestamptz NOT NULL,
+    input_count integer NOT NULL,
+    complete boolean NOT NULL,
+    stop_reason text,
+    total_cost double precision NOT NULL,
+    download_cost double precision NOT NULL,
+    hash_cost double precision NOT NULL,
+    comparison_cost double precision NOT NULL,
+    avoided_cost double precision NOT NULL
+);
+CREATE INDEX IF NOT EXISTS scan_runs_created_at_idx ON scan_runs (created_at);
+CREATE TABLE IF NOT EXISTS scan_run_metrics (
+    run_id text NOT NULL REFERENCES scan_runs (run_id) ON DELETE CASCADE,
+    kind text NOT NULL,
+    name text NOT NULL,
+    value double precision NOT NULL,
+    PRIMARY KEY (run_id, kind, name)
+);
+CREATE TABLE IF NOT EXISTS scan_run_group_members (
+    run_id text NOT NULL REFERENCES scan_runs (run_id) ON DELETE CASCADE,
+    group_id text NOT NULL,
+    category text NOT NULL,
+    position integer NOT NULL,
+    item_id text NOT NULL,
+    sha256 text,
+    dhash bigint,
+    phash bigint,
+    PRIMARY KEY (run_id, group_id, position)
+);
+"""
+
+_RUN_COLUMNS = (
+    "run_id, created_at, input_count, complete, stop_reason, total_cost, download_cost,"
+    " hash_cost, comparison_cost, avoided_cost"
+)
+_METRIC_COLUMNS = "run_id, kind, name, value"
+_MEMBER_COLUMNS = "run_id, group_id, category, position, item_id, sha256, dhash, phash"
+
+RunRow = tuple[str, datetime, int, bool, str | None, float, float, float, float, float]
+MetricRow = tuple[str, str, str, float]
+MemberRow = tuple[str, str, str, int, str, str | None, int | None, int | None]
+
+
+@dataclass(frozen=True)
+class RunRows:
+    run: RunRow
+    metrics: list[MetricRow]
+    members: list[MemberRow]
+
+
+@dataclass(frozen=True)
+class StoredMember:
+    group_id: str
+    category: str
+    item_id: str
+    sha256: str | None
+    dhash: int | None
+    phash: int | None
+
+
+@dataclass(frozen=True)
+class StoredRun:
+    run_id: str
+    created_at: datetime
+    input_count: int
+    complete: bool
+    stop_reason: str | None
+    cost_estimate: CostEstimate
+    # Filled by ``get_run`` only; listings return the run rows alone.
+    metrics: dict[str, dict[str, float]] = field(default_factory=dict)
+    members: list[StoredMember] = field(default_factory=list)
+
+
+def run_rows(
+    result: ScanResult,
+    *,
+    created_at: datetime,
+    byte_hashes: Mapping[str, str] | None = None,
+    perceptual_hashes: Mapping[str, PerceptualHashes] | None = None,
+) -> RunRows:
+    """Flatten a result into table rows: ids, numbers and hashes only, no URLs or filenames."""
+    run_id = result.run_id
+    cost = result.cost_estimate
+    coverage = result.coverage
+    run: RunRow = (
+        run_id,
+        created_at,
+        result.input_count,
+        True if coverage is None else coverage.complete,
+        None if coverage is None else coverage.stop_reason,
+        cost.total_cost,
+        cost.download_cost,
+        cost.hash_cost,
+        cost.comparison_cost,
+        cost.avoided_cost,
+    )
+    metrics = result.stage_metrics
+    metric_rows: list[MetricRow] = [
+        (run_id, kind, name, float(value))
+        for kind, values in (
+            ("timing_ms", metrics.timings_ms),
+            ("count", metrics.counts),
+            ("occupancy", metrics.occupancy),
+            ("memory_bytes", metrics.memory_bytes),
+        )
+        for name, value in values.items()
+    ]
+    byte_hashes = byte_hashes or {}
+    perceptual_hashes = perceptual_hashes or {}
+    member_rows: list[MemberRow] = []
+    for group in [
+        *result.groups_exact,
+        *result.groups_very_similar,
+        *result.groups_possibly_similar,
+    ]:
+        for position, item in enumerate(group.items):
+            hashes = perceptual_hashes.get(item.id)
+            member_rows.append(
+                (
+                    run_id,
+                    group.group_id,
+                    group.category,
+                    position,
+                    item.id,
+                    byte_hashes.get(item.id),
+                    None if hashes is None else _signed64(hashes.dhash),
+                    None if hashes is None or hashes.phash is None else _signed64(hashes.phash),
+                )
+            )
+    return RunRows(run=run, metrics=metric_rows, members=member_rows)
+
+
+class RunDatabase(Protocol):
+    def write(self, batch: Sequence[RunRows]) -> None: ...
+
+    def get_run(self, run_id: str) -> StoredRun | None: ...
+
+    def runs_between(self, start: datetime, end: datetime, *, limit: int) -> list[StoredRun]: ...
+
+
+class PostgresRunDatabase:
+    """Run tables in PostgreSQL. Writes go through one connection owned by the writer thread."""
+
+    def __init__(self, connect: Callable[[], Any]) -> None:
+        self._connect = connect
+        self._writer: Any = None
+        self._schema_ready = False
+
+    def write(self, batch: Sequence[RunRows]) -> None:
+        """Write ``batch`` in one transaction, replacing any earlier copy of the same runs.
+
+        Deleting the runs first (children go with them by cascade) makes retried and duplicate
+        runs idempotent, so one repeat cannot fail the ``COPY`` for the whole batch.
+        """
+        # The last copy of a run submitted twice in one batch wins.
+        batch = list({rows.run[0]: rows for rows in batch}.values())
+        if self._writer is None or self._writer.closed:
+            self._writer = self._open()
+        try:
+            with self._writer.transaction(), self._writer.cursor() as cursor:
+                cursor.execute(
+                    "DELETE FROM scan_runs WHERE run_id = ANY(%s)",
+                    ([rows.run[0] for rows in batch],),
+                )
+                cursor.executemany(
+                    f"INSERT INTO scan_runs ({_RUN_COLUMNS})"
+                    " VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
+                    [rows.run for rows in batch],
+                )
+                _copy(cursor, "scan_run_metrics", _METRIC_COLUMNS, batch, "metrics")
+                _copy(cursor, "scan_run_group_members", _MEMBER_COLUMNS, batch, "members")
+        except Exception:
+            self._writer.close()
+            raise
+
+    def get_run(self, run_id: str) -> StoredRun | None:
+        with self._open() as connection:
+            row = connection.execute(
+                f"SELECT {_RUN_COLUMNS} FROM scan_runs WHERE run_id = %s", (run_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            metrics: dict[str, dict[str, float]] = {}
+            for kind, name, value in connection.execute(
+                "SELECT kind, name, value FROM scan_run_metrics WHERE run_id = %s", (run_id,)
+            ):
+                metrics.setdefault(kind, {})[name] = value
+            members = [
+                StoredMember(
+                    group_id, category, item_id, sha256, _unsigned64(dhash), _unsigned64(phash)
+                )
+                for group_id, category, item_id, sha256, dhash, phash in connection.execute(
+                    "SELECT group_id, category, item_id, sha256, dhash, phash"
+                    " FROM scan_run_group_members WHERE run_id = %s"
+                    " ORDER BY group_id, position",
+                    (run_id,),
+                )
+            ]
+        return replace(_stored_run(row), metrics=metrics, members=members)
+
+    def runs_between(self, start: datetime, end: datetime, *, limit: int) -> list[StoredRun]:
+        with self._open() as connection:
+            rows = connection.execute(
+                f"SELECT {_RUN_COLUMNS} FROM scan_runs"
+                " WHERE created_at >= %s AND created_at < %s"
+                " ORDER BY created_at DESC LIMIT %s",
+                (start, end, limit),
+            ).fetchall()
+        return [_stored_run(row) for row in rows]
+
+    def _open(self) -> Any:
+        connection = self._connect()
+        if not self._schema_ready:
+            with connection.transaction():
+                connection.execute(SCHEMA)
+            self._schema_ready = True
+        return connection
+
+
+class RunStore:
+    """Durable run history, written off the request path in batched transactions.
+
+    ``submit`` only queues the run's rows. A background thread collects up to ``batch_size``
+    runs, waiting at most ``flush_interval_seconds`` after the first, and writes them in one
+    transaction. When ``max_pending`` runs are already queued, new ones are dropped and logged.
+    """
+
+    def __init__(
+        self,
+        database: RunDatabase,
+        *,
+        batch_size: int = 50,
+        flush_interval_seconds: float = 1.0,
+        max_pending: int = 1000,
+    ) -> None:
+        self._database = database
+        self._batch_size = max(batch_size, 1)
+        self._flush_interval_seconds = flush_interval_seconds
+        self._pending: queue.Queue[RunRows | None] = queue.Queue(maxsize=max(max_pending, 1))
+        self._lock = threading.Lock()
+        self._writer: threading.Thread | None = None
+        self.written_runs = 0
+        self.dropped_runs = 0
+
+    def submit(
+        self,
+        result: ScanResult,
+        *,
+        byte_hashes: Mapping[str, str] | None = None,
+        perceptual_hashes: Mapping[str, PerceptualHashes] | None = None,
+    ) -> bool:
+        rows = run_rows(
+            result,
+            created_at=datetime.now(UTC),
+            byte_hashes=byte_hashes,
+            perceptual_hashes=perceptual_hashes,
+        )
+        try:
+            self._pending.put_nowait(rows)
+        except queue.Full:
+            with self._lock:
+                self.dropped_runs += 1
+            logger.warning("Run store backlog is full; dropping run %s", result.run_id)
+            return False
+        self._ensure_writer()
+        return True
+
+    def get_run(self, run_id: str) -> StoredRun | None:
+        return self._database.get_run(run_id)
+
+    def runs_between(self, start: datetime, end: datetime, *, limit: int = 100) -> list[StoredRun]:
+        return self._database.runs_between(start, end, limit=limit)
+
+    def close(self, timeout: float | None = None) -> None:
+        """Write everything queued so far and stop the writer thread."""
+        with self._lock:
+            writer = self._writer
+            self._writer = None
+        if writer is None:
+            return
+        self._pending.put(None)
+        writer.join(timeout)
+
+    def _ensure_writer(self) -> None:
+        with self._lock:
+            if self._writer is not None:
+                return
+            self._writer = threading.Thread(
+                target=self._run_writer, name="run-store-writer", daemon=True
+            )
+            self._writer.start()
+
+    def _run_writer(self) -> None:
+        stopping = False
+        while not stopping:
+            first = self._pending.get()
+            if first is None:
+                return
+            batch = [first]
+            while len(batch) < self._batch_size:
+                try:
+                    rows = self._pending.get(timeout=self._flush_interval_seconds)
+                except queue.Empty:
+                    break
+                if rows is None:
+                    stopping = True
+                    break
+                batch.append(rows)
+            self._write(batch)
+
+    def _write(self, batch: list[RunRows]) -> None:
+        try:
+            self._database.write(batch)
+        except Exception as exc:
+            with self._lock:
+                self.dropped_runs += len(batch)
+            logger.warning("Run store write of %d runs failed: %s", len(batch), exc)
+            return
+        with self._lock:
+            self.written_runs += len(batch)
+
+
+@lru_cache
+def get_run_store() -> RunStore:
+    """Process-wide run store; raises when psycopg (the ``postgres`` extra) is missing."""
+    settings = get_settings()
+    try:
+        psycopg = importlib.import_module("psycopg")
+    except ImportError as exc:
+        raise RuntimeError(
+            "SCAN_RUN_STORE_ENABLED is set but psycopg is not installed;"
+            " install photoprune-api[postgres]"
+        ) from exc
+    return RunStore(
+        PostgresRunDatabase(lambda: psycopg.connect(settings.database_url)),
+        batch_size=settings.scan_run_store_batch_size,
+        flush_interval_seconds=settings.scan_run_store_flush_interval_seconds,
+        max_pending=settings.scan_run_store_max_pending,
+    )
+
+
+def _copy(cursor: Any, table: str, columns: str, batch: Sequence[RunRows], attribute: str) -> None:
+    with cursor.copy(f"COPY {table} ({columns}) FROM STDIN") as copy:
+        for rows in batch:
+            for row in getattr(rows, attribute):
+                copy.write_row(row)
+
+
+def _stored_run(row: Sequence[Any]) -> StoredRun:
+    run_id, created_at, input_count, complete, stop_reason, *costs = row
+    total, download, hashing, comparison, avoided = costs
+    return StoredRun(
+        run_id=run_id,
+        created_at=created_at,
+        input_count=input_count,
+        complete=complete,
+        stop_reason=stop_reason,
+        cost_estimate=CostEstimate(
+            totalCost=total,
+            downloadCost=download,
+            hashCost=hashing,
+            comparisonCost=comparison,
+            avoidedCost=avoided,
+        ),
+    )
+
+
+def _signed64(value: int) -> int:
+    # Hashes are unsigned 64-bit; bigint is signed.
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _unsigned64(value: int | None) -> int | None:
+    return None if value is None else value & ((1 << 64) - 1)
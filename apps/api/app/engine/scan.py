@@ -6,46 +6,210 @@ from collections.abc import Iterable
 from uuid import uuid4
 
 from app.core.config import Settings
-from app.engine.candidates import build_candidate_sets
-from app.engine.downloads import DownloadManager
-from app.engine.grouping import SimilarityThresholds, group_exact_duplicates, group_near_duplicates
-from app.engine.hashing import HashingService
+from app.engine.artifacts import RegroupArtifact, RunArtifactStore
+from app.engine.budget import (
+    ScanBudget,
+    fit_within_budget,
+    plan_candidate_sets,
+    predict_exact_stage_cost,
+    predict_prefilter_cost,
+    select_within_budget,
+)
+from app.engine.cancellation import CancellationToken, ScanCancelled
+from app.engine.candidates import (
+    build_candidate_sets,
+    build_exact_candidate_sets,
+    refine_by_location,
+)
+from app.engine.cascade import LazyPerceptualHasher
+from app.engine.cost_model import CostModelStore, run_observations
+from app.engine.decoding import get_decode_budget
+from app.engine.downloads import DownloadManager, get_download_flight
+from app.engine.exact import prefilter_exact_candidates
+from app.engine.grouping import (
+    PairDistance,
+    SimilarityThresholds,
+    group_exact_duplicates,
+    group_near_duplicates,
+    verification_counts,
+    verification_policy,
+)
+from app.engine.hashing import HashingService, get_hash_flight
+from app.engine.memory import MemoryTracker
 from app.engine.models import PhotoItem
-from app.engine.schemas import CostEstimate, ScanResult, StageMetrics
+from app.engine.pipeline import ScanPipeline
+from app.engine.run_store import RunStore
+from app.engine.schemas import (
+    CostEstimate,
+    GroupResult,
+    ScanCoverage,
+    ScanResult,
+    StageMetrics,
+)
+from app.engine.spill import SpilledScanInput
+
+_STAGE_ORDER = (
+    "candidate_narrowing",
+    "exact_candidate_narrowing",
+    "exact_prefilter",
+    "scheduling",
+    "hashing_pipeline",
+    "exact_grouping",
+    "near_grouping",
+)
 
 
 def run_scan(
     items: Iterable[PhotoItem],
     settings: Settings,
     download_manager: DownloadManager | None = None,
+    budget: ScanBudget | None = None,
+    artifact_store: RunArtifactStore | None = None,
+    cancellation: CancellationToken | None = None,
+    hashing_service: HashingService | None = None,
+    cost_model_store: CostModelStore | None = None,
+    run_store: RunStore | None = None,
 ) -> ScanResult:
     run_id = uuid4().hex
+    budget = budget or ScanBudget()
     photo_items = list(items)
-    download_manager = download_manager or DownloadManager(
-        allowed_hosts=settings.scan_allowed_download_hosts
-    )
-    hashing_service = HashingService(download_manager)
+    if download_manager is None and hashing_service is not None:
+        download_manager = hashing_service.download_manager
+    download_manager, token = _bind_cancellation(download_manager, cancellation, settings)
+    completed_stages: list[str] = []
+    if hashing_service is None:
+        hashing_service = _hashing_service(download_manager, settings)
+    memory = MemoryTracker(settings.scan_memory_tracking)
+    memory.start()
     timings: dict[str, float] = {}
     counts: dict[str, int] = {"selected_images": len(photo_items)}
 
     start = time.perf_counter()
-    candidate_sets = build_candidate_sets(photo_items)
+    memory.begin()
+    candidate_sets = refine_by_location(
+        build_candidate_sets(photo_items, dihedral=settings.scan_dihedral_invariant),
+        settings.scan_geohash_precision,
+    )
     timings["candidate_narrowing_ms"] = _elapsed_ms(start)
+    memory.end("candidate_narrowing")
+    _complete_stage(completed_stages, "candidate_narrowing", token)
     counts["candidate_sets"] = len(candidate_sets)
-    counts["candidate_items"] = sum(len(group) for group in candidate_sets)
+    # Location neighbourhoods overlap, so count each item once.
+    counts["candidate_items"] = len({item.id for group in candidate_sets for item in group})
 
     start = time.perf_counter()
-    byte_hashes: dict[str, str] = {}
-    for item in photo_items:
-        if item.download_url is None:
-            continue
-        byte_hashes[item.id] = hashing_service.get_byte_hash(item)
-    timings["byte_hashing_ms"] = _elapsed_ms(start)
+    memory.begin()
+    downloadable_items = [item for item in photo_items if item.download_url is not None]
+    exact_candidate_sets = build_exact_candidate_sets(
+        downloadable_items,
+        match_filename_stem=settings.scan_exact_match_filename_stem,
+    )
+    byte_hash_items = [item for group in exact_candidate_sets for item in group]
+    timings["exact_candidate_narrowing_ms"] = _elapsed_ms(start)
+    memory.end("exact_candidate_narrowing")
+    _complete_stage(completed_stages, "exact_candidate_narrowing", token)
+    counts["exact_candidate_sets"] = len(exact_candidate_sets)
+    counts["exact_skipped_by_metadata"] = len(downloadable_items) - len(byte_hash_items)
+
+    start = time.perf_counter()
+    memory.begin()
+    # The exact stage is charged first: prefilter requests for every admitted set, then a full
+    # download and SHA-256 for each survivor. Whatever is left bounds the near-duplicate sets.
+    remaining_cost = budget.max_cost
+    exact_sets_skipped_by_budget = 0
+    if budget.deadline_passed():
+        exact_sets_skipped_by_budget = len(exact_candidate_sets)
+        exact_candidate_sets = []
+    if settings.scan_exact_prefilter_enabled and exact_candidate_sets:
+        exact_candidate_sets, spent, skipped_sets = fit_within_budget(
+            exact_candidate_sets,
+            remaining_cost,
+            lambda group: predict_prefilter_cost(group, settings),
+        )
+        exact_sets_skipped_by_budget += skipped_sets
+        remaining_cost = None if remaining_cost is None else remaining_cost - spent
+        try:
+            prefilter = prefilter_exact_candidates(
+                [item for group in exact_candidate_sets for item in group],
+                hashing_service,
+                partial_window=settings.scan_exact_partial_hash_bytes,
+                workers=settings.scan_download_concurrency,
+            )
+            survivors = {item.id for item in prefilter.candidates}
+            exact_candidate_sets = [
+                [item for item in group if item.id in survivors] for group in exact_candidate_sets
+            ]
+            counts["exact_skipped_by_size"] = prefilter.skipped_by_size
+            counts["exact_skipped_by_partial_hash"] = prefilter.skipped_by_partial
+        except ScanCancelled:
+            exact_candidate_sets = []
+    exact_candidate_sets, spent, skipped_sets = fit_within_budget(
+        [group for group in exact_candidate_sets if group],
+        remaining_cost,
+        lambda group: predict_exact_stage_cost(group, settings),
+    )
+    exact_sets_skipped_by_budget += skipped_sets
+    remaining_cost = None if remaining_cost is None else remaining_cost - spent
+    byte_hash_items = [item for group in exact_candidate_sets for item in group]
+    timings["exact_prefilter_ms"] = _elapsed_ms(start)
+    memory.end("exact_prefilter")
+    _complete_stage(completed_stages, "exact_prefilter", token)
+    counts["partial_hashes"] = hashing_service.partial_hash_count
+    counts["exact_candidate_sets_skipped_by_budget"] = exact_sets_skipped_by_budget
+
+    start = time.perf_counter()
+    memory.begin()
+    scheduled_sets = candidate_sets
+    sets_skipped_by_budget = 0
+    if budget.is_bounded:
+        admitted, skipped = select_within_budget(
+            plan_candidate_sets(candidate_sets, settings),
+            remaining_cost,
+        )
+        scheduled_sets = [plan.items for plan in admitted]
+        sets_skipped_by_budget = len(skipped)
+    timings["scheduling_ms"] = _elapsed_ms(start)
+    memory.end("scheduling")
+    _complete_stage(completed_stages, "scheduling", token)
+    counts["candidate_sets_skipped_by_budget"] = sets_skipped_by_budget
+
+    thresholds = _similarity_thresholds(settings)
+    verification = verification_policy(settings)
+
+    memory.begin()
+    # A bounded scan keeps the plan's yield-per-cost order: with the deadline or budget
+    # running out, the most promising sets must go first, not the largest files.
+    pipeline = _build_pipeline(
+        download_manager,
+        hashing_service,
+        settings,
+        thresholds,
+        schedule_policy="input" if budget.is_bounded else None,
+    )
+    pipeline_result = pipeline.run(
+        byte_hash_items,
+        scheduled_sets,
+        should_stop=lambda: token.cancelled or budget.deadline_passed(),
+    )
+    byte_hashes = pipeline_result.byte_hashes
+    timings["hashing_pipeline_ms"] = pipeline_result.wall_ms
+    memory.end("hashing_pipeline")
+    if not pipeline_result.halted:
+        _complete_stage(completed_stages, "hashing_pipeline", token)
+    for stage, busy_ms in pipeline_result.busy_ms.items():
+        timings[f"{stage}_busy_ms"] = busy_ms
+    for stage, makespan_ms in pipeline_result.makespan_ms.items():
+        timings[f"{stage}_makespan_ms"] = makespan_ms
     counts["byte_hashes"] = hashing_service.byte_hash_count
+    for queue_name, depth in pipeline_result.peak_queue_depth.items():
+        counts[f"{queue_name}_queue_peak"] = depth
 
     start = time.perf_counter()
+    memory.begin()
     groups_exact = group_exact_duplicates(photo_items, byte_hashes)
     timings["exact_grouping_ms"] = _elapsed_ms(start)
+    memory.end("exact_grouping")
+    _complete_stage(completed_stages, "exact_grouping", token)
 
     exact_hash_counts: dict[str, int] = defaultdict(int)
     for digest in byte_hashes.values():
@@ -54,67 +218,398 @@ def run_scan(
         item_id for item_id, digest in byte_hashes.items() if exact_hash_counts[digest] >= 2
     }
 
+    processed_sets = [
+        group
+        for index, group in enumerate(scheduled_sets)
+        if index in pipeline_result.completed_sets
+        or sum(1 for item in group if item.download_url is not None) < 2
+    ]
     hashable_candidate_sets = [
         [
             item
             for item in group
             if item.download_url is not None and item.id not in exact_duplicate_ids
         ]
-        for group in candidate_sets
+        for group in processed_sets
     ]
     hashable_candidate_sets = [group for group in hashable_candidate_sets if len(group) >= 2]
 
     start = time.perf_counter()
-    perceptual_hashes = {
-        item.id: hashing_service.get_perceptual_hashes(item)
-        for group in hashable_candidate_sets
-        for item in group
-    }
-    thresholds = SimilarityThresholds(
-        dhash_very=settings.scan_dhash_threshold_very,
-        dhash_possible=settings.scan_dhash_threshold_possible,
-        phash_very=settings.scan_phash_threshold_very,
-        phash_possible=settings.scan_phash_threshold_possible,
-    )
+    memory.begin()
+    try:
+        perceptual_hashes = {
+            item.id: pipeline_result.perceptual_hashes.get(item.id)
+            or hashing_service.get_perceptual_hashes(item)
+            for group in hashable_candidate_sets
+            for item in group
+        }
+    except ScanCancelled:
+        perceptual_hashes = dict(pipeline_result.perceptual_hashes)
+        hashable_candidate_sets = [
+            group
+            for group in hashable_candidate_sets
+            if all(item.id in perceptual_hashes for item in group)
+        ]
+    distances: list[PairDistance] = []
     groups_very, groups_possible, comparisons = group_near_duplicates(
         hashable_candidate_sets,
         perceptual_hashes,
         thresholds,
+        distances_out=distances,
+        cancellation=token,
+        thumbnails=hashing_service.thumbnails,
+        verification=verification,
     )
-    timings["perceptual_hashing_ms"] = _elapsed_ms(start)
+    if verification is not None:
+        counts.update(verification_counts(distances, thresholds, verification))
+    timings["near_grouping_ms"] = _elapsed_ms(start)
+    memory.end("near_grouping")
+    _complete_stage(completed_stages, "near_grouping", token)
     counts["perceptual_hashes"] = hashing_service.perceptual_hash_count
+    counts["phash_skipped"] = hashing_service.deferred_phash_count
+    # pHashes still deferred here are never needed; their pixels would outlive the scan.
+    hashing_service.release_phash_inputs()
+    counts["reduced_decodes"] = hashing_service.reduced_decode_count
+    counts["preview_decodes"] = hashing_service.preview_decode_count
+    counts["coalesced_hashes"] = hashing_service.coalesced_hash_count
+    timings["decode_wait_ms"] = hashing_service.decode_wait_seconds * 1000
     counts["comparisons_executed"] = comparisons
     counts["downloads_performed"] = download_manager.download_count
+    counts["size_probes"] = download_manager.size_probe_count
+    counts["range_requests"] = download_manager.range_request_count
+    counts["coalesced_downloads"] = download_manager.coalesced_download_count
+    byte_hash_skipped = [item for item in downloadable_items if item.id not in byte_hashes]
+    counts["exact_byte_hashes_avoided"] = len(byte_hash_skipped)
+    counts["exact_downloads_avoided"] = sum(
+        1 for item in byte_hash_skipped if not download_manager.has_bytes(item)
+    )
+
+    if artifact_store is not None and not token.cancelled:
+        artifact_store.save_regroup(
+            run_id,
+            RegroupArtifact(
+                items=list(
+                    {item.id: item for group in hashable_candidate_sets for item in group}.values()
+                ),
+                hashes=perceptual_hashes,
+                distances=distances,
+            ),
+        )
+
+    memory.record("download_cache_bytes", download_manager.cached_bytes)
+    memory.record("decoded_pixel_bytes", hashing_service.decoded_pixel_bytes)
+    memory.record("decoded_pixel_bytes_peak", hashing_service.decoded_pixel_bytes_peak)
 
     stage_metrics = StageMetrics(
         timingsMs=timings,
         counts=counts,
+        occupancy=pipeline_result.occupancy,
+        memoryBytes=memory.finish(),
     )
     cost_estimate = _estimate_costs(settings, counts)
-    return ScanResult(
+    stop_reason = None
+    if token.cancelled:
+        stop_reason = token.reason
+    elif pipeline_result.halted:
+        stop_reason = "deadline"
+    elif sets_skipped_by_budget or exact_sets_skipped_by_budget:
+        stop_reason = "max_cost"
+    coverage = ScanCoverage(
+        candidateSetsTotal=len(candidate_sets),
+        candidateSetsProcessed=len(processed_sets),
+        candidateItemsTotal=counts["candidate_items"],
+        candidateItemsProcessed=len({item.id for group in processed_sets for item in group}),
+        exactCandidatesTotal=len(byte_hash_items),
+        exactCandidatesHashed=len(byte_hashes),
+        complete=stop_reason is None,
+        stopReason=stop_reason,
+        completedStages=completed_stages,
+    )
+    result = ScanResult(
         runId=run_id,
         inputCount=len(photo_items),
         stageMetrics=stage_metrics,
         costEstimate=cost_estimate,
+        coverage=coverage,
         groupsExact=groups_exact,
         groupsVerySimilar=groups_very,
         groupsPossiblySimilar=groups_possible,
     )
+    if artifact_store is not None:
+        artifact_store.save_result(result)
+    if run_store is not None:
+        run_store.submit(result, byte_hashes=byte_hashes, perceptual_hashes=perceptual_hashes)
+    if cost_model_store is not None and not token.cancelled:
+        cost_model_store.submit(
+            run_observations(
+                photo_items,
+                download_seconds=download_manager.download_seconds,
+                perceptual_seconds=hashing_service.perceptual_seconds,
+                timings_ms=timings,
+                counts=counts,
+                probe_workers=settings.scan_download_concurrency,
+            )
+        )
+    return result
+
+
+def run_external_scan(
+    spilled: SpilledScanInput,
+    settings: Settings,
+    download_manager: DownloadManager | None = None,
+    cancellation: CancellationToken | None = None,
+    artifact_store: RunArtifactStore | None = None,
+    run_store: RunStore | None = None,
+) -> ScanResult:
+    """Scan spilled input one bucket at a time, evicting downloaded bytes after each bucket."""
+    run_id = uuid4().hex
+    download_manager, token = _bind_cancellation(download_manager, cancellation, settings)
+    completed_stages: list[str] = []
+    memory = MemoryTracker(settings.scan_memory_tracking)
+    memory.start()
+    thresholds = _similarity_thresholds(settings)
+    verification = verification_policy(settings)
+    timings: dict[str, float] = {}
+    counts: dict[str, int] = defaultdict(int)
+    counts["selected_images"] = spilled.item_count
+    counts["spill_runs"] = spilled.run_count
+
+    start = time.perf_counter()
+    memory.begin()
+    groups_exact: list[GroupResult] = []
+    exact_duplicate_ids: set[str] = set()
+    exact_candidates_total = 0
+    exact_candidates_hashed = 0
+    for bucket in spilled.exact.buckets():
+        if token.cancelled:
+            break
+        if len(bucket) < 2:
+            continue
+        counts["exact_candidate_sets"] += 1
+        hashing_service = _hashing_service(download_manager, settings)
+        byte_hash_items = bucket
+        if settings.scan_exact_prefilter_enabled:
+            try:
+                prefilter = prefilter_exact_candidates(
+                    bucket,
+                    hashing_service,
+                    partial_window=settings.scan_exact_partial_hash_bytes,
+                    workers=settings.scan_download_concurrency,
+                )
+            except ScanCancelled:
+                break
+            byte_hash_items = prefilter.candidates
+            counts["exact_skipped_by_size"] += prefilter.skipped_by_size
+            counts["exact_skipped_by_partial_hash"] += prefilter.skipped_by_partial
+        exact_candidates_total += len(byte_hash_items)
+        if byte_hash_items:
+            pipeline = _build_pipeline(download_manager, hashing_service, settings, thresholds)
+            byte_hashes = pipeline.run(
+                byte_hash_items, [], should_stop=lambda: token.cancelled
+            ).byte_hashes
+            exact_candidates_hashed += len(byte_hashes)
+            groups = group_exact_duplicates(byte_hash_items, byte_hashes)
+            groups_exact.extend(groups)
+            exact_duplicate_ids.update(item.id for group in groups for item in group.items)
+        _add_hashing_counts(counts, hashing_service)
+        download_manager.evict(bucket)
+    timings["exact_buckets_ms"] = _elapsed_ms(start)
+    memory.end("exact_buckets")
+    if not token.cancelled:
+        completed_stages.append("exact_buckets")
+
+    start = time.perf_counter()
+    memory.begin()
+    groups_very: list[GroupResult] = []
+    groups_possible: list[GroupResult] = []
+    for bucket in spilled.candidates.buckets():
+        if token.cancelled:
+            break
+        counts["largest_bucket_items"] = max(counts["largest_bucket_items"], len(bucket))
+        if len(bucket) < 2:
+            continue
+        counts["candidate_sets"] += 1
+        counts["candidate_items"] += len(bucket)
+        members = [
+            item
+            for item in bucket
+            if item.download_url is not None and item.id not in exact_duplicate_ids
+        ]
+        if len(members) < 2:
+            continue
+        neighbourhoods = refine_by_location([members], settings.scan_geohash_precision)
+        hashing_service = _hashing_service(download_manager, settings)
+        pipeline = _build_pipeline(download_manager, hashing_service, settings, thresholds)
+        perceptual_hashes = pipeline.run(
+            [], neighbourhoods, should_stop=lambda: token.cancelled
+        ).perceptual_hashes
+        bucket_distances: list[PairDistance] = []
+        very, possible, comparisons = group_near_duplicates(
+            neighbourhoods,
+            perceptual_hashes,
+            thresholds,
+            distances_out=bucket_distances,
+            cancellation=token,
+            thumbnails=hashing_service.thumbnails,
+            verification=verification,
+        )
+        if verification is not None:
+            for name, value in verification_counts(
+                bucket_distances, thresholds, verification
+            ).items():
+                counts[name] += value
+        groups_very.extend(very)
+        groups_possible.extend(possible)
+        counts["comparisons_executed"] += comparisons
+        _add_hashing_counts(counts, hashing_service)
+        download_manager.evict(bucket)
+    timings["near_buckets_ms"] = _elapsed_ms(start)
+    memory.end("near_buckets")
+    if completed_stages and not token.cancelled:
+        completed_stages.append("near_buckets")
+    counts["downloads_performed"] = download_manager.download_count
+    counts["size_probes"] = download_manager.size_probe_count
+    counts["range_requests"] = download_manager.range_request_count
+    counts["coalesced_downloads"] = download_manager.coalesced_download_count
+
+    stage_metrics = StageMetrics(
+        timingsMs=timings,
+        counts=dict(counts),
+        memoryBytes=memory.finish(),
+    )
+    coverage = ScanCoverage(
+        candidateSetsTotal=counts["candidate_sets"],
+        candidateSetsProcessed=counts["candidate_sets"],
+        candidateItemsTotal=counts["candidate_items"],
+        candidateItemsProcessed=counts["candidate_items"],
+        exactCandidatesTotal=exact_candidates_total,
+        exactCandidatesHashed=exact_candidates_hashed,
+        complete=not token.cancelled,
+        stopReason=token.reason,
+        completedStages=completed_stages,
+    )
+    result = ScanResult(
+        runId=run_id,
+        inputCount=spilled.item_count,
+        stageMetrics=stage_metrics,
+        costEstimate=_estimate_costs(settings, counts),
+        coverage=coverage,
+        groupsExact=groups_exact,
+        groupsVerySimilar=groups_very,
+        groupsPossiblySimilar=groups_possible,
+    )
+    if artifact_store is not None:
+        artifact_store.save_result(result)
+    if run_store is not None:
+        run_store.submit(result)
+    return result
+
+
+def _bind_cancellation(
+    download_manager: DownloadManager | None,
+    cancellation: CancellationToken | None,
+    settings: Settings,
+) -> tuple[DownloadManager, CancellationToken]:
+    if download_manager is None:
+        download_manager = DownloadManager(
+            allowed_hosts=settings.download_allowlist,
+            cancellation=cancellation,
+            flight=get_download_flight() if settings.scan_coalesce_enabled else None,
+        )
+    if cancellation is None:
+        return download_manager, download_manager.cancellation
+    if cancellation is not download_manager.cancellation:
+        cancellation.propagate_to(download_manager.cancellation)
+    return download_manager, cancellation
+
+
+def _complete_stage(completed: list[str], stage: str, token: CancellationToken) -> None:
+    # A stage only counts as completed if every earlier stage did too.
+    if not token.cancelled and tuple(completed) == _STAGE_ORDER[: _STAGE_ORDER.index(stage)]:
+        completed.append(stage)
+
+
+def _similarity_thresholds(settings: Settings) -> SimilarityThresholds:
+    return SimilarityThresholds(
+        dhash_very=settings.scan_dhash_threshold_very,
+        dhash_possible=settings.scan_dhash_threshold_possible,
+        phash_very=settings.scan_phash_threshold_very,
+        phash_possible=settings.scan_phash_threshold_possible,
+    )
+
+
+def _build_pipeline(
+    download_manager: DownloadManager,
+    hashing_service: HashingService,
+    settings: Settings,
+    thresholds: SimilarityThresholds,
+    *,
+    schedule_policy: str | None = None,
+) -> ScanPipeline:
+    set_hasher = (
+        LazyPerceptualHasher(
+            hashing_service,
+            thresholds,
+            dhash_cutoff=settings.scan_lazy_phash_dhash_cutoff,
+        )
+        if settings.scan_lazy_phash
+        else None
+    )
+    return ScanPipeline(
+        download_manager,
+        hashing_service,
+        download_workers=settings.scan_download_concurrency,
+        hash_workers=settings.scan_hash_concurrency,
+        queue_size=settings.scan_pipeline_queue_size,
+        set_hasher=set_hasher,
+        schedule_policy=schedule_policy or settings.scan_schedule_policy,
+    )
+
+
+def _hashing_service(download_manager: DownloadManager, settings: Settings) -> HashingService:
+    return HashingService(
+        download_manager,
+        decode_budget=get_decode_budget(),
+        max_decode_pixels=settings.scan_decode_max_pixels,
+        dihedral=settings.scan_dihedral_invariant,
+        flight=get_hash_flight() if settings.scan_coalesce_enabled else None,
+        keep_thumbnails=settings.scan_verify_enabled,
+    )
+
+
+def _add_hashing_counts(counts: dict[str, int], hashing_service: HashingService) -> None:
+    counts["byte_hashes"] += hashing_service.byte_hash_count
+    counts["partial_hashes"] += hashing_service.partial_hash_count
+    counts["perceptual_hashes"] += hashing_service.perceptual_hash_count
+    counts["phash_skipped"] += hashing_service.deferred_phash_count
+    counts["reduced_decodes"] += hashing_service.reduced_decode_count
+    counts["preview_decodes"] += hashing_service.preview_decode_count
+    counts["coalesced_hashes"] += hashing_service.coalesced_hash_count
 
 
 def _estimate_costs(settings: Settings, counts: dict[str, int]) -> CostEstimate:
-    download_cost = counts.get("downloads_performed", 0) * settings.scan_cost_per_download
+    download_cost = (
+        counts.get("downloads_performed", 0) * settings.scan_cost_per_download
+        + (counts.get("size_probes", 0) + counts.get("range_requests", 0))
+        * settings.scan_cost_per_partial_request
+    )
     hash_cost = (
         counts.get("byte_hashes", 0) * settings.scan_cost_per_byte_hash
+        + counts.get("partial_hashes", 0) * settings.scan_cost_per_partial_hash
         + counts.get("perceptual_hashes", 0) * settings.scan_cost_per_perceptual_hash
     )
     comparison_cost = counts.get("comparisons_executed", 0) * settings.scan_cost_per_comparison
     total_cost = download_cost + hash_cost + comparison_cost
+    avoided_cost = (
+        counts.get("exact_downloads_avoided", 0) * settings.scan_cost_per_download
+        + counts.get("exact_byte_hashes_avoided", 0) * settings.scan_cost_per_byte_hash
+    )
     return CostEstimate(
         totalCost=round(total_cost, 6),
         downloadCost=round(download_cost, 6),
         hashCost=round(hash_cost, 6),
         comparisonCost=round(comparison_cost, 6),
+        avoidedCost=round(avoided_cost, 6),
     )
 
 
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+from collections.abc import Callable, Mapping, Sequence
+
+from app.engine.models import PhotoItem
+from app.engine.previews import HEIF_MIME_TYPES, RAW_MIME_TYPES
+
+SCHEDULE_POLICIES = ("input", "largest_first", "largest_sets_first")
+
+# Rough encoded bytes per pixel, used when no content length is known yet.
+_BYTES_PER_PIXEL = {
+    "image/jpeg": 0.35,
+    "image/webp": 0.25,
+    "image/png": 1.5,
+    "image/gif": 0.5,
+    "image/bmp": 3.0,
+    "image/tiff": 3.0,
+    **{mime: 0.2 for mime in HEIF_MIME_TYPES},
+    **{mime: 1.5 for mime in RAW_MIME_TYPES},
+}
+_DEFAULT_BYTES_PER_PIXEL = 0.5
+_DEFAULT_PIXELS = 12_000_000
+# Videos are fetched in full; their frame size says little about the file size.
+_VIDEO_BYTES_PER_PIXEL = 20.0
+
+ContentLength = Callable[[PhotoItem], int | None]
+
+
+def expected_bytes(item: PhotoItem, content_length: int | None = None) -> float:
+    """Known content length, else an estimate from ``width``×``height`` and mime type."""
+    if content_length is not None:
+        return float(content_length)
+    pixels = item.width * item.height if item.width and item.height else _DEFAULT_PIXELS
+    mime = (item.mime_type or "").lower()
+    if mime.startswith("video/"):
+        return pixels * _VIDEO_BYTES_PER_PIXEL
+    return pixels * _BYTES_PER_PIXEL.get(mime, _DEFAULT_BYTES_PER_PIXEL)
+
+
+def order_items(
+    items: Sequence[PhotoItem],
+    policy: str,
+    *,
+    content_length: ContentLength,
+    set_sizes: Mapping[str, int] | None = None,
+) -> list[PhotoItem]:
+    """Order work for a stage; ties keep input order.
+
+    ``largest_first`` is longest-processing-time-first scheduling: starting the costliest
+    items early keeps one large file from being the last thing every worker waits on.
+    ``largest_sets_first`` serves members of the largest candidate sets first (by
+    ``set_sizes``), then falls back to expected cost.
+    """
+    if policy not in SCHEDULE_POLICIES:
+        raise ValueError(f"Unknown schedule policy {policy!r}")
+    if policy == "input":
+        return list(items)
+    costs = {item.id: expected_bytes(item, content_length(item)) for item in items}
+    sizes = set_sizes or {}
+    if policy == "largest_sets_first":
+        return sorted(items, key=lambda item: (-sizes.get(item.id, 0), -costs[item.id]))
+    return sorted(items, key=lambda item: -costs[item.id])
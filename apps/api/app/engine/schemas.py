@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import Any
+from typing import Any, Literal
 
 from pydantic import BaseModel, ConfigDict, Field, model_validator
 
@@ -27,6 +27,11 @@ class ScanRequest(BaseModel):
     photo_items: list[PhotoItemPayload] | None = Field(default=None, alias="photoItems")
     picker_payload: dict[str, Any] | None = Field(default=None, alias="pickerPayload")
     consent_confirmed: bool = Field(default=False, alias="consentConfirmed")
+    max_cost: float | None = Field(default=None, alias="maxCost", gt=0)
+    deadline_seconds: float | None = Field(default=None, alias="deadlineSeconds", gt=0)
+    include_groups: bool = Field(default=True, alias="includeGroups")
+    # Requires the X-Admin-Token header; profiled scans bypass the result cache.
+    profile: Literal["sampling", "deterministic"] | None = None
 
     @model_validator(mode="after")
     def validate_payload(self) -> ScanRequest:
@@ -67,6 +72,8 @@ class GroupResult(BaseModel):
 class StageMetrics(BaseModel):
     timings_ms: dict[str, float] = Field(alias="timingsMs")
     counts: dict[str, int]
+    occupancy: dict[str, float] = Field(default_factory=dict)
+    memory_bytes: dict[str, int] = Field(default_factory=dict, alias="memoryBytes")
 
 
 class CostEstimate(BaseModel):
@@ -74,6 +81,40 @@ class CostEstimate(BaseModel):
     download_cost: float = Field(alias="downloadCost")
     hash_cost: float = Field(alias="hashCost")
     comparison_cost: float = Field(alias="comparisonCost")
+    avoided_cost: float = Field(default=0.0, alias="avoidedCost")
+
+
+class OperationEstimate(BaseModel):
+    operation: str
+    count: int
+    seconds: float
+    cost: float
+    # Recorded samples behind the learned time; 0 means the built-in prior was used.
+    observations: int
+
+
+class ScanEstimate(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    input_count: int = Field(alias="inputCount")
+    predicted_duration_seconds: float = Field(alias="predictedDurationSeconds")
+    predicted_cost: float = Field(alias="predictedCost")
+    consent_required: bool = Field(alias="consentRequired")
+    operations: list[OperationEstimate]
+
+
+class ScanCoverage(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    candidate_sets_total: int = Field(alias="candidateSetsTotal")
+    candidate_sets_processed: int = Field(alias="candidateSetsProcessed")
+    candidate_items_total: int = Field(alias="candidateItemsTotal")
+    candidate_items_processed: int = Field(alias="candidateItemsProcessed")
+    exact_candidates_total: int = Field(alias="exactCandidatesTotal")
+    exact_candidates_hashed: int = Field(alias="exactCandidatesHashed")
+    complete: bool
+    stop_reason: str | None = Field(default=None, alias="stopReason")
+    completed_stages: list[str] = Field(default_factory=list, alias="completedStages")
 
 
 class ScanResult(BaseModel):
@@ -83,6 +124,51 @@ class ScanResult(BaseModel):
     input_count: int = Field(alias="inputCount")
     stage_metrics: StageMetrics = Field(alias="stageMetrics")
     cost_estimate: CostEstimate = Field(alias="costEstimate")
+    coverage: ScanCoverage | None = None
     groups_exact: list[GroupResult] = Field(alias="groupsExact")
     groups_very_similar: list[GroupResult] = Field(alias="groupsVerySimilar")
     groups_possibly_similar: list[GroupResult] = Field(alias="groupsPossiblySimilar")
+
+
+class ScanSummary(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    run_id: str = Field(alias="runId")
+    input_count: int = Field(alias="inputCount")
+    stage_metrics: StageMetrics = Field(alias="stageMetrics")
+    cost_estimate: CostEstimate = Field(alias="costEstimate")
+    coverage: ScanCoverage | None = None
+    group_counts: dict[str, int] = Field(alias="groupCounts")
+
+
+class GroupPage(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    run_id: str = Field(alias="runId")
+    category: str | None = None
+    total: int
+    groups: list[GroupResult]
+    next_cursor: str | None = Field(default=None, alias="nextCursor")
+
+
+class RegroupRequest(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    dhash_threshold_very: int | None = Field(default=None, alias="dhashThresholdVery", ge=0, le=64)
+    dhash_threshold_possible: int | None = Field(
+        default=None, alias="dhashThresholdPossible", ge=0, le=64
+    )
+    phash_threshold_very: int | None = Field(default=None, alias="phashThresholdVery", ge=0, le=64)
+    phash_threshold_possible: int | None = Field(
+        default=None, alias="phashThresholdPossible", ge=0, le=64
+    )
+
+
+class RegroupResult(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    run_id: str = Field(alias="runId")
+    pairs_evaluated: int = Field(alias="pairsEvaluated")
+    regroup_ms: float = Field(alias="regroupMs")
+    groups_very_similar: list[GroupResult] = Field(alias="groupsVerySimilar")
+    groups_possibly_similar: list[GroupResult] = Field(alias="groupsPossiblySimilar")
@@ -0,0 +1,237 @@
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import hashlib
+import logging
+import threading
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any, Generic, Protocol, TypeVar
+from uuid import uuid4
+
+from app.core.config import Settings
+from app.engine.cancellation import CancellationToken, ScanCancelled
+from app.engine.redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+ResultType = TypeVar("ResultType")
+
+_WAIT_SLICE_SECONDS = 0.05
+
+
+class Flight(Protocol[ResultType]):
+    def do_shared(
+        self,
+        key: str,
+        func: Callable[[], ResultType],
+        *,
+        cancellation: CancellationToken | None = None,
+    ) -> tuple[ResultType, bool]: ...
+
+
+class _Call(Generic[ResultType]):
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: ResultType | None = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight(Generic[ResultType]):
+    """Collapses concurrent calls for the same key into one execution."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: dict[str, _Call[ResultType]] = {}
+        self.shared_count = 0
+
+    def do(self, key: str, func: Callable[[], ResultType]) -> ResultType:
+        return self.do_shared(key, func)[0]
+
+    def do_shared(
+        self,
+        key: str,
+        func: Callable[[], ResultType],
+        *,
+        cancellation: CancellationToken | None = None,
+    ) -> tuple[ResultType, bool]:
+        """Run or join the call for ``key``; the flag is true when another caller ran it.
+
+        A waiting caller stops waiting when its own ``cancellation`` fires. If the running
+        call was cancelled by its caller's token, waiters retry instead of inheriting that.
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if call is None:
+                    call = _Call()
+                    self._calls[key] = call
+                else:
+                    self.shared_count += 1
+            if leader:
+                break
+            while not call.done.wait(_WAIT_SLICE_SECONDS if cancellation else None):
+                if cancellation is not None:
+                    cancellation.raise_if_cancelled()
+            if isinstance(call.error, ScanCancelled):
+                continue
+            if call.error is not None:
+                raise call.error
+            return call.result, True  # type: ignore[return-value]
+        try:
+            call.result = func()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+
+class AsyncSingleFlight(Generic[ResultType]):
+    """``SingleFlight`` for coroutines: callers joining a running call await its result on
+    their event loop instead of blocking a worker thread."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: dict[str, concurrent.futures.Future[ResultType]] = {}
+
+    async def do_shared(
+        self, key: str, func: Callable[[], Awaitable[ResultType]]
+    ) -> tuple[ResultType, bool]:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if call is None:
+                call = concurrent.futures.Future()
+                self._calls[key] = call
+        if not leader:
+            # Shielded so a joiner giving up never cancels the leader's shared future.
+            return await asyncio.shield(asyncio.wrap_future(call)), True
+        try:
+            result = await func()
+        except BaseException as exc:
+            call.set_exception(exc)
+            raise
+        else:
+            call.set_result(result)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return result, False
+
+
+class RedisFlight(Generic[ResultType]):
+    """Single-flight across processes: the holder of a Redis lock computes, others read its result.
+
+    Calls within one process are collapsed locally first. Keys are stored as digests, and
+    results only live for ``lock_ttl_seconds``. Redis errors fall back to computing locally.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        *,
+        namespace: str,
+        encode: Callable[[ResultType], bytes],
+        decode: Callable[[bytes], ResultType],
+        lock_ttl_seconds: int,
+    ) -> None:
+        self._client = client
+        self._namespace = namespace
+        self._encode = encode
+        self._decode = decode
+        self._lock_ttl_ms = lock_ttl_seconds * 1000
+        self._local: SingleFlight[tuple[ResultType, bool]] = SingleFlight()
+
+    def do_shared(
+        self,
+        key: str,
+        func: Callable[[], ResultType],
+        *,
+        cancellation: CancellationToken | None = None,
+    ) -> tuple[ResultType, bool]:
+        (result, remote_shared), shared = self._local.do_shared(
+            key, lambda: self._across_processes(key, func, cancellation), cancellation=cancellation
+        )
+        return result, shared or remote_shared
+
+    def _across_processes(
+        self,
+        key: str,
+        func: Callable[[], ResultType],
+        cancellation: CancellationToken | None,
+    ) -> tuple[ResultType, bool]:
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        prefix = f"photoprune:flight:{self._namespace}:{digest}"
+        lock_key, result_key = f"{prefix}:lock", f"{prefix}:result"
+        token = uuid4().hex
+        try:
+            cached = self._client.get(result_key)
+            if cached is not None:
+                return self._decode(cached), True
+            acquired = self._client.set(lock_key, token, nx=True, px=self._lock_ttl_ms)
+            if not acquired:
+                waited = self._wait_for_result(lock_key, result_key, cancellation)
+                if waited is not None:
+                    return waited, True
+        except ScanCancelled:
+            raise
+        except Exception as exc:  # pragma: no cover - depends on a live Redis
+            logger.warning("Redis single-flight unavailable; computing locally: %s", exc)
+            return func(), False
+        result = func()
+        if acquired:
+            self._publish(lock_key, result_key, token, result)
+        return result, False
+
+    def _wait_for_result(
+        self, lock_key: str, result_key: str, cancellation: CancellationToken | None
+    ) -> ResultType | None:
+        # Polls until the holder publishes, or its lock is released or expires without a result.
+        deadline = time.monotonic() + self._lock_ttl_ms / 1000
+        while time.monotonic() < deadline:
+            if cancellation is not None:
+                cancellation.raise_if_cancelled()
+            cached = self._client.get(result_key)
+            if cached is not None:
+                return self._decode(cached)
+            if self._client.get(lock_key) is None:
+                return None
+            time.sleep(_WAIT_SLICE_SECONDS)
+        return None
+
+    def _publish(self, lock_key: str, result_key: str, token: str, result: ResultType) -> None:
+        try:
+            self._client.set(result_key, self._encode(result), px=self._lock_ttl_ms)
+            # Best effort: only release the lock if it has not expired and been taken over.
+            if self._client.get(lock_key) in (token, token.encode("ascii")):
+                self._client.delete(lock_key)
+        except Exception as exc:  # pragma: no cover - depends on a live Redis
+            logger.warning("Redis single-flight publish failed: %s", exc)
+
+
+def build_flight(
+    settings: Settings,
+    *,
+    namespace: str,
+    encode: Callable[[ResultType], bytes],
+    decode: Callable[[bytes], ResultType],
+) -> Flight[ResultType]:
+    """A process-local flight, or a Redis-locked one when ``SCAN_COALESCE_BACKEND=redis``."""
+    if settings.scan_coalesce_backend == "memory":
+        return SingleFlight()
+    client = redis_client(settings, fallback="coalescing within this process only", required=True)
+    if client is None:
+        return SingleFlight()
+    return RedisFlight(
+        client,
+        namespace=namespace,
+        encode=encode,
+        decode=decode,
+        lock_ttl_seconds=settings.scan_coalesce_lock_ttl_seconds,
+    )
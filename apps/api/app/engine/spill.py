@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import json
+import tempfile
+from collections.abc import Callable, Iterator
+from datetime import datetime
+from pathlib import Path
+from types import TracebackType
+from typing import Any
+
+from app.engine.candidates import candidate_bucket_key, exact_bucket_key
+from app.engine.models import GPSLocation, PhotoItem
+
+BucketKey = Callable[[PhotoItem], str]
+_Record = tuple[str, float, str, dict[str, Any]]
+
+
+class BucketSpill:
+    """Groups items by bucket key using sorted runs on disk instead of one in-memory dict.
+
+    Items are buffered up to ``run_items`` at a time, sorted by (bucket, create time, id)
+    and written as an NDJSON run file. ``buckets()`` k-way merges the runs and yields one
+    bucket at a time, so only a single bucket is ever materialized.
+    """
+
+    def __init__(self, key: BucketKey, directory: Path, *, run_items: int) -> None:
+        self._key = key
+        self._directory = directory
+        self._run_items = max(run_items, 1)
+        self._buffer: list[_Record] = []
+        self._runs: list[Path] = []
+        self.item_count = 0
+
+    @property
+    def run_count(self) -> int:
+        return len(self._runs)
+
+    def add(self, item: PhotoItem) -> None:
+        self._buffer.append(
+            (self._key(item), item.create_time.timestamp(), item.id, _encode_item(item))
+        )
+        self.item_count += 1
+        if len(self._buffer) >= self._run_items:
+            self._flush()
+
+    def buckets(self) -> Iterator[list[PhotoItem]]:
+        self._flush()
+        runs = [_read_run(path) for path in self._runs]
+        merged = heapq.merge(*runs, key=lambda record: record[:3])
+        for _, records in itertools.groupby(merged, key=lambda record: record[0]):
+            yield [_decode_item(record[3]) for record in records]
+
+    def _flush(self) -> None:
+        if not self._buffer:
+            return
+        self._buffer.sort(key=lambda record: record[:3])
+        path = self._directory / f"run-{id(self)}-{len(self._runs):05d}.ndjson"
+        with path.open("w", encoding="utf-8") as handle:
+            for record in self._buffer:
+                handle.write(json.dumps(record, separators=(",", ":")))
+                handle.write("\n")
+        self._runs.append(path)
+        self._buffer = []
+
+
+class SpilledScanInput:
+    """Scan input spilled to disk as candidate (near-duplicate) and exact-duplicate buckets.
+
+    Spill files include download URLs and live only until ``close()``.
+    """
+
+    def __init__(
+        self,
+        *,
+        run_items: int,
+        match_filename_stem: bool = False,
+        dihedral: bool = False,
+        directory: str | None = None,
+    ) -> None:
+        self._tempdir = tempfile.TemporaryDirectory(prefix="photoprune-spill-", dir=directory)
+        root = Path(self._tempdir.name)
+        self.candidates = BucketSpill(
+            lambda item: candidate_bucket_key(item, dihedral=dihedral), root, run_items=run_items
+        )
+        self.exact = BucketSpill(
+            lambda item: repr(exact_bucket_key(item, match_filename_stem=match_filename_stem)),
+            root,
+            run_items=run_items,
+        )
+
+    @property
+    def item_count(self) -> int:
+        return self.candidates.item_count
+
+    @property
+    def run_count(self) -> int:
+        return self.candidates.run_count + self.exact.run_count
+
+    def add(self, item: PhotoItem) -> None:
+        self.candidates.add(item)
+        if item.download_url is not None:
+            self.exact.add(item)
+
+    def close(self) -> None:
+        self._tempdir.cleanup()
+
+    def __enter__(self) -> SpilledScanInput:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
+
+
+def _read_run(path: Path) -> Iterator[_Record]:
+    with path.open(encoding="utf-8") as handle:
+        for line in handle:
+            key, timestamp, item_id, payload = json.loads(line)
+            yield key, timestamp, item_id, payload
+
+
+def _encode_item(item: PhotoItem) -> dict[str, Any]:
+    return {
+        "id": item.id,
+        "createTime": item.create_time.isoformat(),
+        "filename": item.filename,
+        "mimeType": item.mime_type,
+        "width": item.width,
+        "height": item.height,
+        "gps": None if item.gps is None else [item.gps.latitude, item.gps.longitude],
+        "downloadUrl": item.download_url,
+        "deepLink": item.deep_link,
+    }
+
+
+def _decode_item(payload: dict[str, Any]) -> PhotoItem:
+    gps = payload["gps"]
+    return PhotoItem(
+        id=payload["id"],
+        create_time=datetime.fromisoformat(payload["createTime"]),
+        filename=payload["filename"],
+        mime_type=payload["mimeType"],
+        width=payload["width"],
+        height=payload["height"],
+        gps=None if gps is None else GPSLocation(latitude=gps[0], longitude=gps[1]),
+        download_url=payload["downloadUrl"],
+        deep_link=payload["deepLink"],
+    )
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import math
+from operator import mul
+
+VERIFY_METRICS = ("ssim", "ncc")
+THUMBNAIL_SIZE = 64
+_BLOCK = 8
+_BLOCK_PIXELS = _BLOCK * _BLOCK
+# Standard SSIM stabilisers for 8-bit input.
+_C1 = (0.01 * 255) ** 2
+_C2 = (0.03 * 255) ** 2
+
+
+class _Prepared:
+    """Per-thumbnail sums reused by every pair the thumbnail takes part in."""
+
+    def __init__(self, pixels: bytes) -> None:
+        self.pixels = pixels
+        squares = list(map(mul, pixels, pixels))
+        self.total = sum(pixels)
+        self.total_squares = sum(squares)
+        self.block_sums = _block_sums(list(pixels))
+        self.block_squares = _block_sums(squares)
+
+
+class ThumbnailScorer:
+    """Pixel similarity of two ``THUMBNAIL_SIZE``² grayscale thumbnails, in [-1, 1].
+
+    ``ssim`` is the mean structural similarity over 8×8 blocks; ``ncc`` is the global
+    normalized cross-correlation. Per-thumbnail sums are computed once, so a pair costs one
+    pass of products over its pixels. With ``dihedral``, the best score over the right-hand
+    thumbnail's eight rotations/flips is used, matching dihedral-invariant hashing.
+    """
+
+    def __init__(self, metric: str, *, dihedral: bool = False) -> None:
+        if metric not in VERIFY_METRICS:
+            raise ValueError(f"Unknown verification metric {metric!r}")
+        self._metric = metric
+        self._dihedral = dihedral
+        self._prepared: dict[bytes, _Prepared] = {}
+        self._variants: dict[bytes, list[bytes]] = {}
+
+    def score(self, left: bytes, right: bytes) -> float:
+        first = self._prepare(left)
+        variants = [right]
+        if self._dihedral:
+            if right not in self._variants:
+                self._variants[right] = _dihedral_variants(right)
+            variants = self._variants[right]
+        return max(self._score(first, self._prepare(variant)) for variant in variants)
+
+    def _score(self, left: _Prepared, right: _Prepared) -> float:
+        products = list(map(mul, left.pixels, right.pixels))
+        if self._metric == "ncc":
+            return _ncc(left, right, sum(products))
+        return _ssim(left, right, _block_sums(products))
+
+    def _prepare(self, pixels: bytes) -> _Prepared:
+        prepared = self._prepared.get(pixels)
+        if prepared is None:
+            prepared = self._prepared[pixels] = _Prepared(pixels)
+        return prepared
+
+
+def _ncc(left: _Prepared, right: _Prepared, product_total: int) -> float:
+    count = len(left.pixels)
+    covariance = product_total / count - (left.total / count) * (right.total / count)
+    left_variance = left.total_squares / count - (left.total / count) ** 2
+    right_variance = right.total_squares / count - (right.total / count) ** 2
+    if left_variance <= 0 or right_variance <= 0:
+        # Flat thumbnails carry no structure; only two equally flat ones match.
+        return 1.0 if left_variance <= 0 and right_variance <= 0 else 0.0
+    return covariance / math.sqrt(left_variance * right_variance)
+
+
+def _ssim(left: _Prepared, right: _Prepared, product_sums: list[int]) -> float:
+    total = 0.0
+    for index, product_sum in enumerate(product_sums):
+        left_mean = left.block_sums[index] / _BLOCK_PIXELS
+        right_mean = right.block_sums[index] / _BLOCK_PIXELS
+        left_variance = left.block_squares[index] / _BLOCK_PIXELS - left_mean**2
+        right_variance = right.block_squares[index] / _BLOCK_PIXELS - right_mean**2
+        covariance = product_sum / _BLOCK_PIXELS - left_mean * right_mean
+        total += ((2 * left_mean * right_mean + _C1) * (2 * covariance + _C2)) / (
+            (left_mean**2 + right_mean**2 + _C1) * (left_variance + right_variance + _C2)
+        )
+    return total / len(product_sums)
+
+
+def _block_sums(values: list[int]) -> list[int]:
+    blocks_per_row = THUMBNAIL_SIZE // _BLOCK
+    sums = [0] * (blocks_per_row * blocks_per_row)
+    for row in range(THUMBNAIL_SIZE):
+        offset = row * THUMBNAIL_SIZE
+        base = (row // _BLOCK) * blocks_per_row
+        for block in range(blocks_per_row):
+            start = offset + block * _BLOCK
+            sums[base + block] += sum(values[start : start + _BLOCK])
+    return sums
+
+
+def _dihedral_variants(pixels: bytes) -> list[bytes]:
+    side = THUMBNAIL_SIZE
+    rows = [pixels[row * side : (row + 1) * side] for row in range(side)]
+    columns = [bytes(column) for column in zip(*rows, strict=True)]
+    variants: list[bytes] = []
+    for grid in (rows, columns):
+        for flip_rows in (False, True):
+            for flip_cols in (False, True):
+                ordered = grid[::-1] if flip_rows else grid
+                variants.append(b"".join(row[::-1] if flip_cols else row for row in ordered))
+    return variants
@@ -1,14 +1,54 @@
+import logging
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 
 from app.api.routes import router
 from app.core.config import get_settings
 
+logger = logging.getLogger(__name__)
+
+_RUN_STORE_DRAIN_SECONDS = 10.0
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    settings = get_settings()
+    run_store = None
+    if settings.scan_run_store_enabled:
+        # Fails startup when the store cannot work, rather than silently persisting nothing.
+        from app.engine.run_store import get_run_store
+
+        run_store = get_run_store()
+    if settings.scan_memory_tracking == "traced":
+        from app.engine.memory import start_tracing
+
+        start_tracing()
+    if settings.scan_warm_up:
+        # Preload the scan engine before the server accepts requests (and reports ready).
+        from app.engine.warmup import warm_up
+
+        timings = await run_in_threadpool(warm_up, settings)
+        app.state.warm_up_seconds = timings
+        logger.info(
+            "Warm-up finished: %s", {step: round(value, 3) for step, value in timings.items()}
+        )
+    yield
+    if run_store is not None:
+        # Write runs still queued for the database before the process exits.
+        await run_in_threadpool(run_store.close, _RUN_STORE_DRAIN_SECONDS)
+
 
 def create_app() -> FastAPI:
     settings = get_settings()
 
-    app = FastAPI(title=settings.app_name)
+    app = FastAPI(
+        title=settings.app_name,
+        lifespan=lifespan,
+    )
 
     app.add_middleware(
         CORSMiddleware,
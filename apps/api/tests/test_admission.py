@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.api import routes
+from app.engine import cache, scan
+from app.engine.admission import AdmissionController, AdmissionRejected
+from app.engine.cache import MemoryCacheBackend, ScanResultCache
+from app.main import app
+
+_SCAN_BODY = {
+    "photoItems": [{"id": "p1", "createTime": "2024-01-01T00:00:00Z"}],
+    "consentConfirmed": True,
+}
+
+
+def _hold_slot(controller: AdmissionController, seconds: float) -> threading.Thread:
+    async def hold() -> None:
+        async with controller.admit("addr:elsewhere"):
+            await asyncio.sleep(seconds)
+
+    thread = threading.Thread(target=asyncio.run, args=(hold(),))
+    thread.start()
+    while not controller.running:
+        time.sleep(0.005)
+    return thread
+
+
+def test_queued_scans_are_granted_round_robin_across_users():
+    controller = AdmissionController(
+        max_concurrent=1, max_per_user=1, max_queue=10, max_wait_seconds=5
+    )
+    order: list[str] = []
+
+    async def scan(user: str, label: str) -> None:
+        async with controller.admit(user):
+            order.append(label)
+            await asyncio.sleep(0.01)
+
+    async def scenario() -> None:
+        tasks = []
+        for user, label in [("a", "a1"), ("a", "a2"), ("a", "a3"), ("b", "b1")]:
+            tasks.append(asyncio.create_task(scan(user, label)))
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+
+    assert order == ["a1", "a2", "b1", "a3"]
+    assert controller.running == 0 and controller.queued == 0
+
+
+def test_full_queue_and_expired_wait_are_rejected_with_estimate():
+    controller = AdmissionController(
+        max_concurrent=1, max_per_user=1, max_queue=1, max_wait_seconds=0.05
+    )
+
+    async def scenario() -> list[AdmissionRejected]:
+        rejections: list[AdmissionRejected] = []
+
+        async def queued() -> None:
+            try:
+                async with controller.admit("b"):
+                    pass
+            except AdmissionRejected as exc:
+                rejections.append(exc)
+
+        async with controller.admit("a"):
+            waiting = asyncio.create_task(queued())
+            await asyncio.sleep(0)
+            with pytest.raises(AdmissionRejected) as full:
+                async with controller.admit("c"):
+                    pass
+            rejections.append(full.value)
+            await waiting
+        return rejections
+
+    rejections = asyncio.run(scenario())
+
+    assert [exc.reason for exc in rejections] == ["queue_full", "timeout"]
+    assert all(exc.retry_after_seconds >= 1 for exc in rejections)
+    assert controller.rejected_count == 2
+    assert controller.queued == 0 and controller.running == 0
+
+
+def test_scan_endpoint_returns_429_when_queue_is_full(monkeypatch):
+    controller = AdmissionController(
+        max_concurrent=1, max_per_user=1, max_queue=0, max_wait_seconds=1
+    )
+    monkeypatch.setattr(routes, "get_admission_controller", lambda: controller)
+    client = TestClient(app)
+    body = json.dumps({"id": "p1", "createTime": "2024-01-01T00:00:00Z"}) + "\n"
+
+    admitted = client.post("/api/scan/stream", content=body)
+
+    async def while_busy() -> tuple[int, str | None]:
+        async with controller.admit("addr:elsewhere"):
+            response = client.post("/api/scan/stream", content=body)
+        return response.status_code, response.headers.get("Retry-After")
+
+    status_code, retry_after = asyncio.run(while_busy())
+
+    assert admitted.status_code == 200
+    assert admitted.json()["stageMetrics"]["counts"]["admission_queue_depth"] == 0
+    assert "admission_wait_ms" in admitted.json()["stageMetrics"]["timingsMs"]
+    assert status_code == 429
+    assert retry_after is not None and int(retry_after) >= 1
+
+
+def test_identical_concurrent_scans_share_one_admission_slot(monkeypatch):
+    controller = AdmissionController(
+        max_concurrent=1, max_per_user=1, max_queue=0, max_wait_seconds=1
+    )
+    monkeypatch.setattr(routes, "get_admission_controller", lambda: controller)
+    result_cache = ScanResultCache(MemoryCacheBackend(max_bytes=1_000_000), ttl_seconds=60)
+    monkeypatch.setattr(cache, "get_scan_cache", lambda: result_cache)
+    started = threading.Event()
+    release = threading.Event()
+    run_scan = scan.run_scan
+
+    def slow_run_scan(*args, **kwargs):
+        started.set()
+        release.wait(5)
+        return run_scan(*args, **kwargs)
+
+    monkeypatch.setattr(scan, "run_scan", slow_run_scan)
+    client = TestClient(app)
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        leader = pool.submit(client.post, "/api/scan", json=_SCAN_BODY)
+        assert started.wait(5)
+        follower = pool.submit(client.post, "/api/scan", json=_SCAN_BODY)
+        time.sleep(0.2)
+        release.set()
+        responses = [leader.result(), follower.result()]
+
+    assert [response.status_code for response in responses] == [200, 200]
+    assert "admission_queue_depth" in responses[0].json()["stageMetrics"]["counts"]
+    assert "admission_queue_depth" not in responses[1].json()["stageMetrics"]["counts"]
+    assert controller.rejected_count == 0
+    assert result_cache.misses == 1
+
+
+def test_queued_scan_still_gets_its_full_deadline(monkeypatch):
+    controller = AdmissionController(
+        max_concurrent=1, max_per_user=1, max_queue=1, max_wait_seconds=5
+    )
+    monkeypatch.setattr(routes, "get_admission_controller", lambda: controller)
+    result_cache = ScanResultCache(MemoryCacheBackend(max_bytes=1_000_000), ttl_seconds=60)
+    monkeypatch.setattr(cache, "get_scan_cache", lambda: result_cache)
+    at_start: list[tuple[float | None, bool]] = []
+    run_scan = scan.run_scan
+
+    def recording_run_scan(*args, **kwargs):
+        at_start.append(
+            (kwargs["cancellation"].remaining_seconds(), kwargs["budget"].deadline_passed())
+        )
+        return run_scan(*args, **kwargs)
+
+    monkeypatch.setattr(scan, "run_scan", recording_run_scan)
+    busy = _hold_slot(controller, 0.6)
+
+    response = TestClient(app).post("/api/scan", json={**_SCAN_BODY, "deadlineSeconds": 0.5})
+    busy.join()
+
+    payload = response.json()
+    assert response.status_code == 200
+    assert payload["stageMetrics"]["timingsMs"]["admission_wait_ms"] >= 500
+    remaining, budget_expired = at_start[0]
+    assert remaining is not None and remaining > 0.4
+    assert budget_expired is False
+    assert payload["coverage"] is None or payload["coverage"]["stopReason"] != "deadline"
+
+
+def test_user_id_header_does_not_split_the_per_caller_cap():
+    request = routes.Request(
+        {
+            "type": "http",
+            "headers": [(b"x-user-id", b"someone-else")],
+            "client": ("203.0.113.7", 1234),
+        }
+    )
+
+    assert routes._client_identity(request) == "addr:203.0.113.7"
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+from dataclasses import replace
+from datetime import UTC, datetime
+
+from fastapi.testclient import TestClient
+
+from app.api import routes
+from app.engine.artifacts import (
+    GROUPS_PER_CHUNK,
+    RegroupArtifact,
+    RunArtifactStore,
+    get_artifact_store,
+)
+from app.engine.cache import MemoryCacheBackend
+from app.engine.grouping import PairDistance, SimilarityThresholds, group_exact_duplicates
+from app.engine.hashing import PerceptualHashes
+from app.engine.models import GPSLocation, PhotoItem
+from app.engine.schemas import CostEstimate, ScanResult, StageMetrics
+from app.main import app
+
+
+def test_artifact_round_trip_drops_download_urls():
+    store = RunArtifactStore(MemoryCacheBackend(max_bytes=1_000_000), ttl_seconds=60)
+    artifact = _artifact()
+
+    store.save_regroup("run-1", artifact)
+    loaded = store.load_regroup("run-1")
+
+    assert loaded is not None
+    assert [item.id for item in loaded.items] == ["a", "b", "c"]
+    assert loaded.items[0].gps == GPSLocation(latitude=1.5, longitude=2.5)
+    assert all(item.download_url is None for item in loaded.items)
+    assert loaded.hashes == artifact.hashes
+    assert loaded.distances == artifact.distances
+    assert store.load_regroup("missing") is None
+
+
+def test_regroup_applies_new_thresholds_without_rehashing():
+    store = RunArtifactStore(MemoryCacheBackend(max_bytes=1_000_000), ttl_seconds=60)
+    store.save_regroup("run-1", _artifact())
+
+    strict = store.regroup("run-1", SimilarityThresholds(2, 4, 2, 4))
+    loose = store.regroup("run-1", SimilarityThresholds(8, 20, 8, 20))
+
+    assert strict is not None and loose is not None
+    assert [[item.id for item in group.items] for group in strict[0]] == [["a", "b"]]
+    assert strict[1] == []
+    assert [[item.id for item in group.items] for group in loose[0]] == [["a", "b", "c"]]
+
+
+def test_regroup_endpoint_uses_stored_artifact():
+    get_artifact_store().save_regroup("run-endpoint", _artifact())
+    client = TestClient(app)
+
+    response = client.post(
+        "/api/scans/run-endpoint/regroup",
+        json={"dhashThresholdVery": 2, "phashThresholdVery": 2},
+    )
+    missing = client.post("/api/scans/unknown/regroup", json={})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["pairsEvaluated"] == 3
+    assert [item["id"] for item in body["groupsVerySimilar"][0]["items"]] == ["a", "b"]
+    assert body["groupsPossiblySimilar"] == []
+    assert missing.status_code == 404
+
+
+def test_group_pages_walk_categories_in_stored_order():
+    store = RunArtifactStore(MemoryCacheBackend(max_bytes=1_000_000), ttl_seconds=60)
+    result = _scan_result("run-pages", exact=3, very=2)
+    store.save_result(result)
+
+    first = store.page_groups("run-pages", None, 0, 2)
+    second = store.page_groups("run-pages", None, 2, 2)
+    very_only = store.page_groups("run-pages", "VERY_SIMILAR", 1, 5)
+    summary = store.load_summary("run-pages")
+
+    assert first is not None and second is not None and very_only is not None
+    assert [group.category for group in first[0] + second[0]] == [
+        "EXACT",
+        "EXACT",
+        "EXACT",
+        "VERY_SIMILAR",
+    ]
+    assert first[1] == second[1] == 5
+    assert very_only[0] == result.groups_very_similar[1:]
+    assert summary is not None
+    assert summary.group_counts == {"EXACT": 3, "VERY_SIMILAR": 2, "POSSIBLY_SIMILAR": 0}
+    assert store.page_groups("missing", None, 0, 2) is None
+
+
+def test_pages_read_only_the_chunks_they_span(monkeypatch):
+    store = RunArtifactStore(MemoryCacheBackend(max_bytes=10_000_000), ttl_seconds=60)
+    result = _scan_result("run-chunks", exact=GROUPS_PER_CHUNK * 2 + 5, very=0)
+    store.save_result(result)
+    read: list[int] = []
+    load_chunk = store.load_group_chunk
+
+    def recording(run_id: str, category: str, chunk: int):
+        read.append(chunk)
+        return load_chunk(run_id, category, chunk)
+
+    monkeypatch.setattr(store, "load_group_chunk", recording)
+
+    page = store.page_groups("run-chunks", "EXACT", GROUPS_PER_CHUNK - 1, 2)
+
+    assert page is not None
+    assert page[0] == result.groups_exact[GROUPS_PER_CHUNK - 1 : GROUPS_PER_CHUNK + 1]
+    assert read == [0, 1]
+
+
+def test_evicted_group_chunk_is_reported_as_expired(monkeypatch):
+    backend = MemoryCacheBackend(max_bytes=1_000_000)
+    store = RunArtifactStore(backend, ttl_seconds=60)
+    store.save_result(_scan_result("run-evicted", exact=2, very=1))
+    backend._evict("photoprune:run:run-evicted:groups:very_similar:0")
+    monkeypatch.setattr(routes, "_artifact_store", lambda: store)
+
+    assert store.page_groups("run-evicted", "EXACT", 0, 5) is not None
+    assert store.page_groups("run-evicted", None, 0, 5) is None
+    response = TestClient(app).get("/api/scans/run-evicted/groups")
+    assert response.status_code == 404
+
+
+def test_group_and_summary_endpoints_paginate_with_cursor():
+    get_artifact_store().save_result(_scan_result("run-cursor", exact=3, very=0))
+    client = TestClient(app)
+
+    first = client.get("/api/scans/run-cursor/groups", params={"limit": 2}).json()
+    second = client.get(
+        "/api/scans/run-cursor/groups", params={"limit": 2, "cursor": first["nextCursor"]}
+    ).json()
+    summary = client.get("/api/scans/run-cursor/summary")
+
+    assert first["total"] == 3 and len(first["groups"]) == 2
+    assert len(second["groups"]) == 1 and second["nextCursor"] is None
+    assert summary.status_code == 200
+    assert "groupsExact" not in summary.json()
+    assert summary.json()["groupCounts"]["EXACT"] == 3
+    bad_cursor = client.get("/api/scans/run-cursor/groups", params={"cursor": "nope"})
+    bad_category = client.get("/api/scans/run-cursor/groups", params={"category": "blurry"})
+    assert bad_cursor.status_code == bad_category.status_code == 400
+    assert client.get("/api/scans/unknown/summary").status_code == 404
+
+
+def _scan_result(run_id: str, *, exact: int, very: int) -> ScanResult:
+    def groups(prefix: str, count: int) -> list[PhotoItem]:
+        return [_photo_item(f"{prefix}-{index}-{side}") for index in range(count) for side in "ab"]
+
+    exact_items = groups("exact", exact)
+    very_items = groups("very", very)
+    byte_hashes = {item.id: item.id.rsplit("-", 1)[0] for item in exact_items + very_items}
+    very_groups = [
+        group.model_copy(update={"category": "VERY_SIMILAR"})
+        for group in group_exact_duplicates(very_items, byte_hashes)
+    ]
+    return ScanResult(
+        runId=run_id,
+        inputCount=len(exact_items) + len(very_items),
+        stageMetrics=StageMetrics(timingsMs={}, counts={}),
+        costEstimate=CostEstimate(totalCost=0, downloadCost=0, hashCost=0, comparisonCost=0),
+        groupsExact=group_exact_duplicates(exact_items, byte_hashes),
+        groupsVerySimilar=very_groups,
+        groupsPossiblySimilar=[],
+    )
+
+
+def _artifact() -> RegroupArtifact:
+    items = [_photo_item("a"), _photo_item("b"), _photo_item("c")]
+    items[0] = replace(items[0], gps=GPSLocation(latitude=1.5, longitude=2.5))
+    return RegroupArtifact(
+        items=items,
+        hashes={item.id: PerceptualHashes(dhash=0, phash=0) for item in items},
+        distances=[
+            PairDistance(left="a", right="b", dhash=1, phash=1),
+            PairDistance(left="a", right="c", dhash=7, phash=9),
+            PairDistance(left="b", right="c", dhash=15, phash=15),
+        ],
+    )
+
+
+def _photo_item(item_id: str) -> PhotoItem:
+    return PhotoItem(
+        id=item_id,
+        create_time=datetime(2024, 1, 1, tzinfo=UTC),
+        filename=f"{item_id}.jpg",
+        mime_type="image/jpeg",
+        width=100,
+        height=100,
+        gps=None,
+        download_url=f"https://photos.google.com/{item_id}",
+        deep_link=None,
+    )
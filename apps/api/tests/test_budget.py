@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+from dataclasses import replace
+from datetime import UTC, datetime, timedelta
+
+from app.core.config import Settings
+from app.engine import scan
+from app.engine.budget import (
+    ScanBudget,
+    plan_candidate_sets,
+    predict_candidate_set_cost,
+    predict_prefilter_cost,
+    select_within_budget,
+)
+from app.engine.downloads import DownloadManager
+from app.engine.hashing import HashingService, PerceptualHashes
+from app.engine.models import PhotoItem
+
+
+def test_plan_prefers_bursts_over_spread_out_sets():
+    base = datetime(2024, 1, 1, tzinfo=UTC)
+    spread = [_photo_item(f"spread{i}", base + timedelta(hours=i)) for i in range(3)]
+    burst = [_photo_item(f"burst{i}", base + timedelta(seconds=i)) for i in range(3)]
+
+    plans = plan_candidate_sets([spread, burst], Settings())
+
+    assert [plan.items for plan in plans] == [burst, spread]
+    assert plans[0].predicted_cost == predict_candidate_set_cost(burst, Settings())
+
+
+def test_select_within_budget_skips_sets_that_do_not_fit():
+    base = datetime(2024, 1, 1, tzinfo=UTC)
+    small = [_photo_item(f"s{i}", base) for i in range(2)]
+    large = [_photo_item(f"l{i}", base) for i in range(10)]
+    plans = plan_candidate_sets([small, large], Settings())
+    small_cost = predict_candidate_set_cost(small, Settings())
+
+    admitted, skipped = select_within_budget(plans, small_cost)
+
+    assert [plan.items for plan in admitted] == [small]
+    assert [plan.items for plan in skipped] == [large]
+
+
+def test_run_scan_reports_partial_coverage_when_budget_runs_out(monkeypatch):
+    base = datetime(2024, 1, 1, tzinfo=UTC)
+    burst = [_photo_item(f"burst{i}", base + timedelta(seconds=i)) for i in range(2)]
+    spread = [_photo_item(f"spread{i}", base + timedelta(hours=i)) for i in range(2)]
+    downloader = DownloadManager(fetcher=lambda item: item.id.encode())
+    monkeypatch.setattr(scan, "build_candidate_sets", lambda _items, **_kwargs: [spread, burst])
+    monkeypatch.setattr(
+        HashingService,
+        "get_perceptual_hashes",
+        lambda _self, _item: PerceptualHashes(dhash=0, phash=0),
+    )
+    # All four share dimensions, so the exact prefilter is charged first; their partial hashes
+    # differ, so no full download or SHA-256 is.
+    budget = ScanBudget(
+        max_cost=predict_prefilter_cost(burst + spread, Settings())
+        + predict_candidate_set_cost(burst, Settings())
+    )
+
+    result = scan.run_scan(burst + spread, Settings(), download_manager=downloader, budget=budget)
+
+    assert result.coverage is not None
+    assert not result.coverage.complete
+    assert result.coverage.stop_reason == "max_cost"
+    assert result.coverage.candidate_sets_processed == 1
+    assert [item.id for item in result.groups_very_similar[0].items] == ["burst0", "burst1"]
+
+
+def test_budgeted_scan_downloads_sets_in_plan_order_not_by_size(monkeypatch):
+    base = datetime(2024, 1, 1, tzinfo=UTC)
+    burst = [
+        replace(_photo_item(f"burst{i}", base + timedelta(seconds=i)), width=100 + i)
+        for i in range(2)
+    ]
+    spread = [
+        replace(_photo_item(f"spread{i}", base + timedelta(hours=i)), width=4000 + i, height=3000)
+        for i in range(2)
+    ]
+    fetched: list[str] = []
+
+    def fetcher(item: PhotoItem) -> bytes:
+        fetched.append(item.id)
+        return item.id.encode()
+
+    monkeypatch.setattr(scan, "build_candidate_sets", lambda _items, **_kwargs: [spread, burst])
+    monkeypatch.setattr(
+        HashingService,
+        "get_perceptual_hashes",
+        lambda _self, _item: PerceptualHashes(dhash=0, phash=0),
+    )
+    settings = Settings(scan_download_concurrency=1, scan_schedule_policy="largest_first")
+
+    scan.run_scan(
+        spread + burst,
+        settings,
+        download_manager=DownloadManager(fetcher=fetcher),
+        budget=ScanBudget(max_cost=1_000.0),
+    )
+
+    assert fetched == ["burst0", "burst1", "spread0", "spread1"]
+
+
+def test_run_scan_stops_downloading_after_deadline():
+    items = [_photo_item(f"item{i}", datetime(2024, 1, 1, tzinfo=UTC)) for i in range(3)]
+    downloader = DownloadManager(fetcher=lambda item: item.id.encode())
+
+    result = scan.run_scan(
+        items,
+        Settings(),
+        download_manager=downloader,
+        budget=ScanBudget(deadline_seconds=1e-9),
+    )
+
+    assert result.coverage is not None
+    assert result.coverage.stop_reason == "deadline"
+    assert downloader.download_count == 0
+
+
+def test_exact_stage_stops_before_full_downloads_the_budget_cannot_cover():
+    items = [_photo_item(f"copy{i}", datetime(2024, 1, 1, tzinfo=UTC)) for i in range(2)]
+    content = bytes(range(256))
+    downloader = DownloadManager(
+        fetcher=lambda _item: content,
+        size_fetcher=lambda _item: len(content),
+        range_fetcher=lambda _item, start, length: content[start : start + length],
+    )
+    settings = Settings(scan_exact_partial_hash_bytes=16)
+    budget = ScanBudget(max_cost=predict_prefilter_cost(items, settings))
+
+    result = scan.run_scan(items, settings, download_manager=downloader, budget=budget)
+
+    assert result.coverage is not None
+    assert result.coverage.stop_reason == "max_cost"
+    assert result.stage_metrics.counts["exact_candidate_sets_skipped_by_budget"] == 1
+    assert downloader.download_count == 0
+    assert result.groups_exact == []
+    assert result.cost_estimate.total_cost <= budget.max_cost
+
+
+def _photo_item(item_id: str, create_time: datetime) -> PhotoItem:
+    return PhotoItem(
+        id=item_id,
+        create_time=create_time,
+        filename=f"{item_id}.jpg",
+        mime_type="image/jpeg",
+        width=100,
+        height=100,
+        gps=None,
+        download_url=f"https://photos.google.com/{item_id}",
+        deep_link=None,
+    )
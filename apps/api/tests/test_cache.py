@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from dataclasses import replace
+from datetime import UTC, datetime
+
+from app.core.config import Settings
+from app.engine import redis_client
+from app.engine.cache import (
+    MemoryCacheBackend,
+    ScanResultCache,
+    build_cache_backend,
+    scan_cache_key,
+)
+from app.engine.models import PhotoItem
+from app.engine.schemas import CostEstimate, ScanResult, StageMetrics
+
+
+def test_memory_backend_evicts_least_recently_used_entries_by_size():
+    backend = MemoryCacheBackend(max_bytes=10)
+    backend.set("a", b"12345", ttl_seconds=60)
+    backend.set("b", b"12345", ttl_seconds=60)
+    assert backend.get("a") == b"12345"
+
+    backend.set("c", b"12345", ttl_seconds=60)
+
+    assert backend.get("a") == b"12345"
+    assert backend.get("b") is None
+    assert backend.size_bytes == 10
+
+
+def test_memory_backend_expires_entries():
+    backend = MemoryCacheBackend(max_bytes=100)
+    backend.set("a", b"value", ttl_seconds=0)
+
+    assert backend.get("a") is None
+    assert backend.size_bytes == 0
+
+
+def test_scan_cache_key_ignores_order_and_download_urls():
+    items = [_photo_item("a"), _photo_item("b")]
+    refreshed = [replace(item, download_url=f"{item.download_url}?v=2") for item in items]
+
+    assert scan_cache_key(items, Settings()) == scan_cache_key(refreshed[::-1], Settings())
+    assert scan_cache_key(items, Settings()) != scan_cache_key(
+        items, Settings(scan_dhash_threshold_very=1)
+    )
+
+
+def test_concurrent_identical_requests_share_one_computation():
+    cache = ScanResultCache(MemoryCacheBackend(max_bytes=1_000_000), ttl_seconds=60)
+    calls: list[int] = []
+    results: list[ScanResult] = []
+
+    def compute() -> ScanResult:
+        calls.append(1)
+        time.sleep(0.05)
+        return _scan_result("run-1")
+
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_compute("key", compute)))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert {result.run_id for result in results} == {"run-1"}
+    assert cache.get_or_compute("key", compute).run_id == "run-1"
+    assert len(calls) == 1
+
+
+def _scan_result(run_id: str) -> ScanResult:
+    return ScanResult(
+        runId=run_id,
+        inputCount=0,
+        stageMetrics=StageMetrics(timingsMs={}, counts={}),
+        costEstimate=CostEstimate(totalCost=0, downloadCost=0, hashCost=0, comparisonCost=0),
+        groupsExact=[],
+        groupsVerySimilar=[],
+        groupsPossiblySimilar=[],
+    )
+
+
+def _photo_item(item_id: str) -> PhotoItem:
+    return PhotoItem(
+        id=item_id,
+        create_time=datetime(2024, 1, 1, tzinfo=UTC),
+        filename=f"{item_id}.jpg",
+        mime_type="image/jpeg",
+        width=100,
+        height=100,
+        gps=None,
+        download_url=f"https://photos.google.com/{item_id}",
+        deep_link=None,
+    )
+
+
+def test_missing_redis_package_is_a_warning_when_redis_url_is_configured(monkeypatch, caplog):
+    def missing(name: str) -> object:
+        raise ImportError(name)
+
+    monkeypatch.setattr(redis_client.importlib, "import_module", missing)
+
+    with caplog.at_level(logging.INFO, logger=redis_client.__name__):
+        configured = build_cache_backend(Settings(redis_url="redis://cache:6379/0"))
+        default = build_cache_backend(Settings())
+
+    assert isinstance(configured, MemoryCacheBackend)
+    assert isinstance(default, MemoryCacheBackend)
+    assert [record.levelno for record in caplog.records] == [logging.WARNING, logging.INFO]
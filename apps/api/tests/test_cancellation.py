@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import threading
+import time
+from datetime import UTC, datetime
+
+import pytest
+
+from app.core.config import Settings
+from app.engine.cancellation import CancellationToken, ScanCancelled, SharedCancellation
+from app.engine.downloads import DownloadManager
+from app.engine.hashing import HashingService, PerceptualHashes
+from app.engine.models import PhotoItem
+from app.engine.scan import run_scan
+from tools.loadtest.fake_photos import StandInConfig, start_stand_in
+
+
+def test_deadline_cancels_token_and_fires_callbacks():
+    token = CancellationToken(deadline_seconds=0.01)
+    downstream = CancellationToken()
+    token.propagate_to(downstream)
+    fired: list[str] = []
+
+    with token.on_cancel(lambda: fired.append("closed")):
+        time.sleep(0.02)
+        assert token.cancelled
+
+    assert token.reason == "deadline"
+    assert downstream.reason == "deadline"
+    assert fired == ["closed"]
+    with pytest.raises(ScanCancelled):
+        token.raise_if_cancelled()
+
+
+def test_shared_cancellation_waits_for_every_holder_to_disconnect():
+    shared = SharedCancellation()
+    with shared.hold("scan") as first, shared.hold("scan") as second:
+        assert first.token is second.token
+        first.abandon()
+        assert not first.token.cancelled
+        second.abandon()
+        assert first.token.reason == "disconnected"
+    with shared.hold("scan") as fresh:
+        assert not fresh.token.cancelled
+
+
+def test_cancel_aborts_in_flight_download():
+    server = start_stand_in(StandInConfig(bandwidth_bytes_per_second=20_000))
+    try:
+        token = CancellationToken()
+        manager = DownloadManager(allowed_hosts=[server.origin], cancellation=token)
+        errors: list[BaseException] = []
+
+        def download() -> None:
+            try:
+                manager.get_bytes(_photo_item("slow", server.media_url("scene", "0")))
+            except BaseException as exc:
+                errors.append(exc)
+
+        worker = threading.Thread(target=download)
+        worker.start()
+        time.sleep(0.2)
+        token.cancel()
+        worker.join(timeout=2)
+
+        assert not worker.is_alive()
+        assert len(errors) == 1 and isinstance(errors[0], ScanCancelled)
+        assert manager.download_count == 0
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_cancelled_scan_returns_partial_result(monkeypatch):
+    token = CancellationToken()
+    items = [
+        _photo_item(f"item-{index}", f"https://photos.google.com/{index}") for index in range(6)
+    ]
+
+    def fetcher(item: PhotoItem) -> bytes:
+        if item.id == "item-1":
+            token.cancel()
+        return item.id.encode()
+
+    def fake_perceptual_hashes(self: HashingService, item: PhotoItem) -> PerceptualHashes:
+        return PerceptualHashes(dhash=0, phash=0)
+
+    monkeypatch.setattr(HashingService, "get_perceptual_hashes", fake_perceptual_hashes)
+    settings = Settings(scan_download_concurrency=1, scan_exact_prefilter_enabled=False)
+    downloader = DownloadManager(fetcher=fetcher)
+
+    result = run_scan(items, settings, download_manager=downloader, cancellation=token)
+
+    assert result.coverage is not None
+    assert not result.coverage.complete
+    assert result.coverage.stop_reason == "cancelled"
+    assert result.coverage.completed_stages == [
+        "candidate_narrowing",
+        "exact_candidate_narrowing",
+        "exact_prefilter",
+        "scheduling",
+    ]
+    assert downloader.download_count == 2
+    assert result.groups_very_similar == []
+
+
+def _photo_item(item_id: str, download_url: str) -> PhotoItem:
+    return PhotoItem(
+        id=item_id,
+        create_time=datetime(2024, 1, 1, tzinfo=UTC),
+        filename=f"{item_id}.jpg",
+        mime_type="image/jpeg",
+        width=100,
+        height=100,
+        gps=None,
+        download_url=download_url,
+        deep_link=None,
+    )
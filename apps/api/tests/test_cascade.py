@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+from datetime import UTC, datetime
+from io import BytesIO
+
+from PIL import Image
+
+from app.core.config import Settings
+from app.engine.cascade import LazyPerceptualHasher
+from app.engine.downloads import DownloadManager
+from app.engine.grouping import SimilarityThresholds, group_near_duplicates
+from app.engine.hashing import HashingService, PerceptualHashes
+from app.engine.models import PhotoItem
+from app.engine.scan import run_scan
+
+_THRESHOLDS = SimilarityThresholds(dhash_very=5, dhash_possible=10, phash_very=6, phash_possible=12)
+
+# a/b are settled by dHash, a/d and b/d are inconclusive, c is far from everyone, and e is
+# far from everyone in dHash but matches a and b by pHash.
+_FULL_HASHES = {
+    "a": PerceptualHashes(dhash=0, phash=0),
+    "b": PerceptualHashes(dhash=0b1, phash=0b1),
+    "c": PerceptualHashes(dhash=(1 << 64) - 1, phash=(1 << 64) - 1),
+    "d": PerceptualHashes(dhash=0xFF, phash=0b11),
+    "e": PerceptualHashes(dhash=(1 << 30) - 1, phash=0b111),
+}
+
+
+def test_lazy_hasher_computes_phash_only_for_inconclusive_pairs(monkeypatch):
+    completed = _patch_hashing(monkeypatch)
+    hasher = LazyPerceptualHasher(HashingService(DownloadManager()), _THRESHOLDS, dhash_cutoff=20)
+
+    hashes = hasher([_photo_item(item_id) for item_id in "abcd"])
+
+    assert completed == ["a", "b", "d"]
+    assert hashes["c"].phash is None
+    assert hashes["d"].phash == 0b11
+
+
+def test_lazy_hasher_matches_eager_grouping_within_cutoff(monkeypatch):
+    _patch_hashing(monkeypatch)
+    items = [_photo_item(item_id) for item_id in "abcd"]
+    hasher = LazyPerceptualHasher(HashingService(DownloadManager()), _THRESHOLDS, dhash_cutoff=20)
+
+    lazy = group_near_duplicates([items], hasher(items), _THRESHOLDS)
+    eager = group_near_duplicates([items], dict(_FULL_HASHES), _THRESHOLDS)
+
+    assert lazy == eager
+    assert {item.id for item in lazy[0][0].items} == {"a", "b", "d"}
+
+
+def test_lazy_hasher_keeps_pairs_matched_by_phash_alone_unless_cut_off(monkeypatch):
+    _patch_hashing(monkeypatch)
+    items = [_photo_item(item_id) for item_id in "abe"]
+    service = HashingService(DownloadManager())
+
+    lazy = group_near_duplicates(
+        [items], LazyPerceptualHasher(service, _THRESHOLDS)(items), _THRESHOLDS
+    )
+    cut_off = LazyPerceptualHasher(service, _THRESHOLDS, dhash_cutoff=20)(items)
+
+    assert lazy == group_near_duplicates([items], dict(_FULL_HASHES), _THRESHOLDS)
+    assert {item.id for item in lazy[0][0].items} == {"a", "b", "e"}
+    assert cut_off["e"].phash is None
+
+
+def test_complete_phash_reuses_dhash_decode():
+    fetches: list[str] = []
+
+    def fetcher(item: PhotoItem) -> bytes:
+        fetches.append(item.id)
+        return _gradient_png()
+
+    item = _photo_item("a")
+    service = HashingService(DownloadManager(fetcher=fetcher))
+
+    partial = service.get_dhash(item)
+    assert partial.phash is None
+    assert service.deferred_phash_count == 1
+
+    completed = service.complete_phash(item)
+    assert service.deferred_phash_count == 0
+    assert service.perceptual_hash_count == 1
+    assert fetches == ["a"]
+
+    eager = HashingService(DownloadManager(fetcher=fetcher)).get_perceptual_hashes(item)
+    assert completed == eager
+
+
+def test_scan_releases_phash_inputs_it_never_needed():
+    images = {"a": _gradient_png(), "b": _gradient_png(mirrored=True)}
+    service = HashingService(DownloadManager(fetcher=lambda item: images[item.id]))
+
+    result = run_scan(
+        [_photo_item("a"), _photo_item("b")],
+        Settings(scan_lazy_phash=True, scan_lazy_phash_dhash_cutoff=20),
+        hashing_service=service,
+    )
+
+    assert result.stage_metrics.counts["phash_skipped"] == 2
+    assert service._phash_inputs == {}
+
+
+def _patch_hashing(monkeypatch) -> list[str]:
+    completed: list[str] = []
+
+    def fake_dhash(self: HashingService, item: PhotoItem) -> PerceptualHashes:
+        return _FULL_HASHES[item.id]._replace(phash=None)
+
+    def fake_complete(self: HashingService, item: PhotoItem) -> PerceptualHashes:
+        completed.append(item.id)
+        return _FULL_HASHES[item.id]
+
+    monkeypatch.setattr(HashingService, "get_dhash", fake_dhash)
+    monkeypatch.setattr(HashingService, "complete_phash", fake_complete)
+    return completed
+
+
+def _gradient_png(*, mirrored: bool = False) -> bytes:
+    image = Image.new("L", (48, 32))
+    image.putdata([(x * 5 + y * 3) % 256 for y in range(32) for x in range(48)])
+    if mirrored:
+        image = image.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _photo_item(item_id: str) -> PhotoItem:
+    return PhotoItem(
+        id=item_id,
+        create_time=datetime(2024, 1, 1, tzinfo=UTC),
+        filename=f"{item_id}.jpg",
+        mime_type="image/jpeg",
+        width=100,
+        height=100,
+        gps=None,
+        download_url=f"https://photos.google.com/{item_id}",
+        deep_link=None,
+    )
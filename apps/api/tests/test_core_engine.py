@@ -1,9 +1,13 @@
 from __future__ import annotations
 
+from dataclasses import replace
 from datetime import UTC, datetime, timedelta
+from io import BytesIO
+
+from PIL import Image
 
 from app.core.config import Settings
-from app.engine.candidates import build_candidate_sets
+from app.engine.candidates import build_candidate_sets, build_exact_candidate_sets
 from app.engine.downloads import DownloadManager
 from app.engine.grouping import (
     SimilarityThresholds,
@@ -13,6 +17,7 @@ from app.engine.grouping import (
 )
 from app.engine.hashing import HashingService, PerceptualHashes
 from app.engine.models import PhotoItem
+from app.engine.scan import run_scan
 
 
 def test_candidate_narrowing_is_deterministic():
@@ -31,6 +36,66 @@ def test_candidate_narrowing_is_deterministic():
     ]
 
 
+def test_exact_candidate_sets_drop_items_with_unique_metadata():
+    base_time = datetime(2024, 1, 1, tzinfo=UTC)
+    items = [
+        _photo_item("a", base_time, 4000, 3000),
+        _photo_item("b", base_time, 4000, 3000),
+        _photo_item("c", base_time, 1000, 2000),
+    ]
+    items[1] = replace(items[1], filename="A (1).JPG")
+
+    by_stem = build_exact_candidate_sets(items, match_filename_stem=True)
+    without_stem = build_exact_candidate_sets(
+        [replace(item, filename=None) for item in items[:2]] + [items[2]]
+    )
+
+    assert [[item.id for item in group] for group in by_stem] == [["a", "b"]]
+    assert [[item.id for item in group] for group in without_stem] == [["a", "b"]]
+
+
+def test_renamed_byte_identical_copy_is_an_exact_duplicate():
+    image_bytes = _make_image_bytes()
+    created = datetime(2024, 1, 1, tzinfo=UTC)
+    items = [
+        replace(_photo_item(item_id, created, 120, 80), filename=filename)
+        for item_id, filename in (("a", "a.jpg"), ("copy", "a copy.jpg"), ("dup", "a_dup.jpg"))
+    ]
+
+    result = run_scan(
+        items, Settings(), download_manager=DownloadManager(fetcher=lambda _: image_bytes)
+    )
+
+    assert [[item.id for item in group.items] for group in result.groups_exact] == [
+        ["a", "copy", "dup"]
+    ]
+
+
+def test_dihedral_scan_groups_a_copy_rotated_by_90_degrees():
+    original = Image.new("L", (96, 64), 40)
+    original.paste(220, (0, 0, 30, 20))
+    original.paste(130, (60, 30, 96, 64))
+    images = {
+        "original": _png_bytes(original),
+        "rotated": _png_bytes(original.transpose(Image.Transpose.ROTATE_90)),
+    }
+    created = datetime(2024, 1, 1, tzinfo=UTC)
+    items = [
+        replace(_photo_item("original", created, 96, 64), download_url="memory://original"),
+        replace(_photo_item("rotated", created, 64, 96), download_url="memory://rotated"),
+    ]
+
+    def scan(settings: Settings) -> list[list[str]]:
+        result = run_scan(
+            items, settings, download_manager=DownloadManager(fetcher=lambda item: images[item.id])
+        )
+        groups = result.groups_very_similar + result.groups_possibly_similar
+        return [sorted(item.id for item in group.items) for group in groups]
+
+    assert scan(Settings()) == []
+    assert scan(Settings(scan_dihedral_invariant=True)) == [["original", "rotated"]]
+
+
 def test_exact_duplicate_grouping():
     image_bytes = _make_image_bytes()
     items = [
@@ -113,3 +178,9 @@ def _photo_item(item_id: str, create_time: datetime, width: int, height: int) ->
 
 def _make_image_bytes() -> bytes:
     return b"fake-image-bytes"
+
+
+def _png_bytes(image: Image.Image) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
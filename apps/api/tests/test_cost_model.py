@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+from datetime import UTC, datetime
+from io import BytesIO
+
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app.api import routes
+from app.core.config import Settings
+from app.engine.cost_model import (
+    PRIOR_SECONDS,
+    CostModel,
+    CostModelStore,
+    FileCostModelBackend,
+    MemoryCostModelBackend,
+    Observation,
+    segment_of,
+)
+from app.engine.downloads import DownloadManager
+from app.engine.models import PhotoItem
+from app.engine.scan import run_scan
+from app.main import app
+
+
+def test_model_falls_back_from_host_to_mime_and_megapixels_to_global():
+    model = CostModel(window=2)
+    photos = _photo_item("a", host="lh3.googleusercontent.com", width=4000, height=3000)
+    other_host = _photo_item("b", host="photos.google.com", width=4000, height=3000)
+    video = _photo_item("c", host="photos.google.com", width=200, height=100, mime="video/mp4")
+    for seconds in (1.0, 3.0, 5.0):
+        model.observe(Observation("download", segment_of(photos), seconds))
+
+    # Two-observation window: mean of the first two, then an EWMA with weight 1/2.
+    assert model.seconds("download", segment_of(photos)) == 3.5
+    assert model.seconds("download", segment_of(other_host)) == 3.5
+    assert model.seconds("download", segment_of(video)) == 3.5
+    assert model.seconds("perceptual_hash", segment_of(photos)) == PRIOR_SECONDS["perceptual_hash"]
+    assert segment_of(photos) == "image/jpeg|12-24MP|lh3.googleusercontent.com"
+
+
+def test_estimate_predicts_from_metadata_using_learned_seconds():
+    store = CostModelStore(MemoryCostModelBackend(), window=100)
+    items = [_photo_item(f"p{index}", host="photos.google.com") for index in range(3)]
+    store.record(Observation("download", segment_of(item), 2.0) for item in items)
+    settings = Settings(
+        scan_download_concurrency=2,
+        scan_hash_concurrency=1,
+        scan_cost_per_worker_second=0.01,
+        scan_exact_match_filename_stem=True,
+    )
+
+    estimate = store.load().estimate(items, settings)
+
+    operations = {operation.operation: operation for operation in estimate.operations}
+    assert operations["download"].count == 3
+    assert operations["download"].seconds == 6.0
+    assert operations["download"].observations == 3
+    assert operations["download"].cost == round(3 * settings.scan_cost_per_download + 0.06, 6)
+    assert operations["comparison"].count == 3
+    assert operations["size_probe"].count == 0
+    assert estimate.predicted_duration_seconds == 3.0
+    assert estimate.consent_required is False
+
+
+def test_estimate_downloads_exact_only_candidates_in_full():
+    store = CostModelStore(MemoryCostModelBackend(), window=100)
+    items = [
+        _photo_item("a", host="photos.google.com"),
+        _photo_item("b", host="photos.google.com", created_day=2),
+    ]
+
+    operations = {
+        operation.operation: operation
+        for operation in store.load().estimate(items, Settings()).operations
+    }
+
+    assert operations["perceptual_hash"].count == 0
+    assert operations["size_probe"].count == 2
+    assert operations["download"].count == 2
+
+
+def test_file_backed_model_survives_a_new_store(tmp_path):
+    path = tmp_path / "models" / "cost-model.bin"
+    item = _photo_item("a", host="photos.google.com")
+    CostModelStore(FileCostModelBackend(path), window=100).record(
+        [Observation("download", segment_of(item), 2.0)]
+    )
+
+    reloaded = CostModelStore(FileCostModelBackend(path), window=100).load()
+
+    assert reloaded.observation_count("download") == 1
+    assert reloaded.seconds("download", segment_of(item)) == 2.0
+
+
+def test_run_scan_records_observations_for_later_estimates():
+    store = CostModelStore(MemoryCostModelBackend(), window=100)
+    items = [_photo_item(f"p{index}", host="photos.google.com") for index in range(2)]
+    images = {item.id: _jpeg_bytes(shade) for item, shade in zip(items, (40, 200), strict=True)}
+    downloader = DownloadManager(fetcher=lambda item: images[item.id])
+
+    run_scan(items, Settings(), download_manager=downloader, cost_model_store=store)
+    store.flush()
+
+    model = store.load()
+    assert model.observation_count("download") == 2
+    assert model.observation_count("perceptual_hash") == 2
+    assert model.observation_count("comparison") == 1
+
+
+def test_failing_cost_model_backend_never_fails_the_scan():
+    class BrokenBackend:
+        def load(self) -> bytes | None:
+            raise ConnectionError("backend unavailable")
+
+        def save(self, raw: bytes) -> None:
+            raise ConnectionError("backend unavailable")
+
+    store = CostModelStore(BrokenBackend(), window=100)
+    items = [_photo_item(f"p{index}", host="photos.google.com") for index in range(2)]
+    images = {item.id: _jpeg_bytes(shade) for item, shade in zip(items, (40, 200), strict=True)}
+    downloader = DownloadManager(fetcher=lambda item: images[item.id])
+
+    result = run_scan(items, Settings(), download_manager=downloader, cost_model_store=store)
+    store.flush()
+
+    assert result.input_count == 2
+
+
+def test_estimate_endpoint_never_downloads(monkeypatch):
+    def no_downloads(*_args: object, **_kwargs: object) -> bytes:
+        raise AssertionError("estimate must not download")
+
+    monkeypatch.setattr("app.engine.downloads._default_fetcher", no_downloads)
+    client = TestClient(app)
+    body = {
+        "photoItems": [
+            {
+                "id": f"p{index}",
+                "createTime": "2024-01-01T00:00:00Z",
+                "mimeType": "image/jpeg",
+                "width": 4000,
+                "height": 3000,
+                "downloadUrl": f"https://photos.google.com/p{index}",
+            }
+            for index in range(4)
+        ]
+    }
+    monkeypatch.setattr(routes, "get_settings", lambda: Settings(scan_consent_threshold=3))
+
+    response = client.post("/api/scan/estimate", json=body)
+
+    payload = response.json()
+    assert response.status_code == 200
+    assert payload["inputCount"] == 4
+    assert payload["consentRequired"] is True
+    assert payload["predictedDurationSeconds"] > 0
+    assert {entry["operation"] for entry in payload["operations"]} == {
+        "size_probe",
+        "download",
+        "perceptual_hash",
+        "comparison",
+    }
+
+
+def _photo_item(
+    item_id: str,
+    *,
+    host: str,
+    width: int = 4000,
+    height: int = 3000,
+    mime: str = "image/jpeg",
+    created_day: int = 1,
+) -> PhotoItem:
+    return PhotoItem(
+        id=item_id,
+        create_time=datetime(2024, 1, created_day, tzinfo=UTC),
+        filename=f"{item_id}.jpg",
+        mime_type=mime,
+        width=width,
+        height=height,
+        gps=None,
+        download_url=f"https://{host}/{item_id}",
+        deep_link=None,
+    )
+
+
+def _jpeg_bytes(shade: int) -> bytes:
+    output = BytesIO()
+    Image.new("RGB", (40, 30), (shade, shade, shade)).save(output, format="JPEG")
+    return output.getvalue()
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import threading
+import time
+from datetime import UTC, datetime
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from app.engine.cancellation import CancellationToken, ScanCancelled
+from app.engine.decoding import PixelBudget, read_header
+from app.engine.downloads import DownloadManager
+from app.engine.hashing import HashingService, hamming_distance
+from app.engine.models import PhotoItem
+
+
+def test_reservation_over_budget_waits_for_release():
+    budget = PixelBudget(100)
+    acquired = threading.Event()
+
+    def second() -> None:
+        with budget.reserve(60):
+            acquired.set()
+
+    with budget.reserve(60):
+        worker = threading.Thread(target=second)
+        worker.start()
+        time.sleep(0.1)
+        assert not acquired.is_set()
+    worker.join(timeout=2)
+
+    assert acquired.is_set()
+    assert budget.peak_bytes == 60
+    assert budget.wait_count == 1
+    assert budget.in_use == 0
+
+
+def test_waiting_reservation_honours_cancellation():
+    budget = PixelBudget(100)
+    token = CancellationToken(deadline_seconds=0.05)
+
+    with budget.reserve(100), pytest.raises(ScanCancelled):
+        with budget.reserve(1, token):
+            pass
+
+
+def test_oversize_jpeg_takes_reduced_decode_path():
+    data = _gradient_jpeg(800, 600)
+    item = _photo_item(data)
+    header = read_header(data)
+    full = HashingService(DownloadManager(fetcher=lambda _: data))
+    budget = PixelBudget(1 << 30)
+    reduced = HashingService(
+        DownloadManager(fetcher=lambda _: data),
+        decode_budget=budget,
+        max_decode_pixels=100_000,
+    )
+
+    full_hashes = full.get_perceptual_hashes(item)
+    reduced_hashes = reduced.get_perceptual_hashes(item)
+
+    assert header is not None and header.pixels == 480_000
+    assert reduced.reduced_decode_count == 1
+    assert full.reduced_decode_count == 0
+    assert reduced.decoded_pixel_bytes == 400 * 300 * 2
+    assert budget.peak_bytes == 400 * 300 * 2
+    assert hamming_distance(full_hashes.dhash, reduced_hashes.dhash) <= 4
+
+
+def _gradient_jpeg(width: int, height: int) -> bytes:
+    image = Image.new("RGB", (width, height))
+    image.putdata(
+        [
+            ((x * 255) // width, (y * 255) // height, 128)
+            for y in range(height)
+            for x in range(width)
+        ]
+    )
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def _photo_item(data: bytes) -> PhotoItem:
+    return PhotoItem(
+        id="large",
+        create_time=datetime(2024, 1, 1, tzinfo=UTC),
+        filename="large.jpg",
+        mime_type="image/jpeg",
+        width=None,
+        height=None,
+        gps=None,
+        download_url="https://photos.google.com/large",
+        deep_link=None,
+    )
@@ -1,8 +1,15 @@
+from __future__ import annotations
+
+import urllib.error
+import urllib.request
 from datetime import UTC, datetime
+from email.message import Message
+from io import BytesIO
 
 import pytest
 
 from app.engine import downloads
+from app.engine.cancellation import CancellationToken
 from app.engine.models import PhotoItem
 
 
@@ -50,7 +57,9 @@ def test_download_manager_uses_default_fetcher_and_caches(monkeypatch: pytest.Mo
         headers: dict[str, str],
         timeout_seconds: float,
         allowed_hosts: list[str],
+        cancellation: CancellationToken,
     ) -> bytes:
+        assert not cancellation.cancelled
         calls.append((headers["X-Test"], timeout_seconds, allowed_hosts, item.id))
         return b"payload"
 
@@ -76,3 +85,83 @@ def test_download_manager_uses_default_fetcher_and_caches(monkeypatch: pytest.Mo
     assert manager.get_bytes(item) == b"payload"
     assert manager.download_count == 1
     assert calls == [("ok", 12.5, ["photos.google.com"], "photo-1")]
+
+
+def test_refused_head_and_range_requests_leave_the_item_to_the_full_hash(
+    monkeypatch: pytest.MonkeyPatch,
+):
+    def refusing_urlopen(request: urllib.request.Request, timeout: float):
+        raise urllib.error.HTTPError(request.full_url, 405, "Method Not Allowed", Message(), None)
+
+    monkeypatch.setattr(downloads, "_reject_private_addresses", lambda _: None)
+    monkeypatch.setattr(downloads.urllib.request, "urlopen", refusing_urlopen)
+    manager = downloads.DownloadManager(allowed_hosts=["photos.google.com"])
+
+    assert manager.get_content_length(_photo_item()) is None
+    assert manager.get_byte_range(_photo_item(), 0, 4) is None
+    assert manager.download_count == 0
+
+
+def test_timed_out_head_and_range_requests_leave_the_item_to_the_full_hash(
+    monkeypatch: pytest.MonkeyPatch,
+):
+    def timing_out_urlopen(request: urllib.request.Request, timeout: float):
+        raise TimeoutError("The read operation timed out")
+
+    monkeypatch.setattr(downloads, "_reject_private_addresses", lambda _: None)
+    monkeypatch.setattr(downloads.urllib.request, "urlopen", timing_out_urlopen)
+    manager = downloads.DownloadManager(allowed_hosts=["photos.google.com"])
+
+    assert manager.get_content_length(_photo_item()) is None
+    assert manager.get_byte_range(_photo_item(), 0, 4) is None
+    assert manager.download_count == 0
+
+
+def test_range_request_answered_with_the_whole_body_is_kept(monkeypatch: pytest.MonkeyPatch):
+    requests: list[str | None] = []
+
+    def ignoring_range_urlopen(request: urllib.request.Request, timeout: float):
+        requests.append(request.get_header("Range"))
+        return _Response(b"0123456789", status=200)
+
+    monkeypatch.setattr(downloads, "_reject_private_addresses", lambda _: None)
+    monkeypatch.setattr(downloads.urllib.request, "urlopen", ignoring_range_urlopen)
+    manager = downloads.DownloadManager(allowed_hosts=["photos.google.com"])
+
+    assert manager.get_byte_range(_photo_item(), 2, 3) == b"234"
+    assert manager.get_byte_range(_photo_item(), 6, 4) == b"6789"
+    assert manager.get_bytes(_photo_item()) == b"0123456789"
+    assert requests == ["bytes=2-4"]
+    assert manager.download_count == 1
+
+
+class _Response:
+    def __init__(self, body: bytes, *, status: int) -> None:
+        self.status = status
+        self._body = BytesIO(body)
+
+    def read(self, size: int) -> bytes:
+        return self._body.read(size)
+
+    def close(self) -> None:
+        self._body.close()
+
+    def __enter__(self) -> _Response:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+
+def _photo_item() -> PhotoItem:
+    return PhotoItem(
+        id="photo-1",
+        create_time=datetime(2024, 1, 1, tzinfo=UTC),
+        filename="photo.jpg",
+        mime_type="image/jpeg",
+        width=100,
+        height=100,
+        gps=None,
+        download_url="https://photos.google.com/photo-1",
+        deep_link=None,
+    )
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+from datetime import UTC, datetime
+
+from app.engine.downloads import DownloadManager
+from app.engine.exact import prefilter_exact_candidates
+from app.engine.hashing import HashingService
+from app.engine.models import PhotoItem
+
+_WINDOW = 4
+
+
+def test_prefilter_only_fully_fetches_items_with_colliding_size_and_partial_hash():
+    contents = {
+        "dup1": b"HEAD-middle-A-TAIL",
+        "dup2": b"HEAD-middle-A-TAIL",
+        "same-ends": b"HEAD-middle-B-TAIL",
+        "other-size": b"HEAD-much-longer-body-TAIL",
+        "singleton": b"tiny",
+    }
+    fetched: list[str] = []
+
+    def fetcher(item: PhotoItem) -> bytes:
+        fetched.append(item.id)
+        return contents[item.id]
+
+    downloader = DownloadManager(
+        fetcher=fetcher,
+        size_fetcher=lambda item: len(contents[item.id]),
+        range_fetcher=lambda item, start, length: contents[item.id][start : start + length],
+    )
+    hashing = HashingService(downloader)
+    items = [_photo_item(item_id) for item_id in contents]
+
+    result = prefilter_exact_candidates(items, hashing, partial_window=_WINDOW)
+
+    assert [item.id for item in result.candidates] == ["dup1", "dup2", "same-ends"]
+    assert result.skipped_by_size == 2
+    assert result.skipped_by_partial == 0
+    assert fetched == []
+    assert downloader.size_probe_count == 5
+    assert downloader.range_request_count == 6
+
+
+def test_prefilter_drops_size_collisions_with_different_partial_hashes():
+    contents = {"a": b"AAAA-same-size-AAAA", "b": b"BBBB-same-size-BBBB"}
+    downloader = DownloadManager(fetcher=lambda item: contents[item.id])
+    hashing = HashingService(downloader)
+
+    result = prefilter_exact_candidates(
+        [_photo_item("a"), _photo_item("b")],
+        hashing,
+        partial_window=_WINDOW,
+        workers=2,
+    )
+
+    assert result.candidates == []
+    assert result.skipped_by_partial == 2
+
+
+def test_prefilter_keeps_items_with_unknown_size():
+    downloader = DownloadManager(
+        fetcher=lambda item: b"payload",
+        size_fetcher=lambda item: None,
+    )
+    hashing = HashingService(downloader)
+    items = [_photo_item("a"), _photo_item("b")]
+
+    result = prefilter_exact_candidates(items, hashing, partial_window=_WINDOW)
+
+    assert result.candidates == items
+    assert hashing.partial_hash_count == 0
+
+
+def _photo_item(item_id: str) -> PhotoItem:
+    return PhotoItem(
+        id=item_id,
+        create_time=datetime(2024, 1, 1, tzinfo=UTC),
+        filename=f"{item_id}.jpg",
+        mime_type="image/jpeg",
+        width=100,
+        height=100,
+        gps=None,
+        download_url=f"https://photos.google.com/{item_id}",
+        deep_link=None,
+    )
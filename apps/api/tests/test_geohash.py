@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+from datetime import UTC, datetime
+
+from app.engine import geohash
+from app.engine.candidates import refine_by_location
+from app.engine.grouping import SimilarityThresholds, group_near_duplicates
+from app.engine.hashing import PerceptualHashes
+from app.engine.models import GPSLocation, PhotoItem
+
+
+def test_encode_and_neighbours_match_reference_cells():
+    assert geohash.encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    assert sorted(geohash.neighbours("u4pruyd")) == sorted(
+        ["u4pruy3", "u4pruy6", "u4pruy7", "u4pruy9", "u4pruye", "u4pruyc", "u4pruyf", "u4pruyg"]
+    )
+    assert len(geohash.neighbours("b")) == 5
+
+
+def test_refine_by_location_splits_cities_and_keeps_edge_pairs():
+    # 52.5200/13.4140 and 52.5200/13.4146 straddle a precision-6 cell edge.
+    items = [
+        _photo_item("berlin-1", 52.5200, 13.4140),
+        _photo_item("berlin-2", 52.5200, 13.4146),
+        _photo_item("paris-1", 48.8566, 2.3522),
+        _photo_item("paris-2", 48.8567, 2.3523),
+        _photo_item("unlocated", None, None),
+    ]
+    assert geohash.encode(52.52, 13.4140, 6) != geohash.encode(52.52, 13.4146, 6)
+
+    refined = refine_by_location([items], precision=6)
+
+    assert sorted(sorted(item.id for item in group) for group in refined) == [
+        ["berlin-1", "berlin-2", "unlocated"],
+        ["paris-1", "paris-2", "unlocated"],
+    ]
+    assert refine_by_location([items], precision=0) == [items]
+
+
+def test_overlapping_neighbourhoods_compare_each_pair_once():
+    items = [
+        _photo_item("a", 52.5200, 13.4140),
+        _photo_item("b", 52.5200, 13.4146),
+        _photo_item("c", 52.5200, 13.4256),
+    ]
+    refined = refine_by_location([items], precision=6)
+    hashes = {item.id: PerceptualHashes(dhash=0, phash=0) for item in items}
+
+    very, _, comparisons = group_near_duplicates(
+        refined, hashes, SimilarityThresholds(5, 10, 6, 12)
+    )
+
+    assert len(refined) == 3
+    assert comparisons == 3
+    assert [sorted(item.id for item in group.items) for group in very] == [["a", "b", "c"]]
+
+
+def _photo_item(item_id: str, latitude: float | None, longitude: float | None) -> PhotoItem:
+    return PhotoItem(
+        id=item_id,
+        create_time=datetime(2024, 1, 1, tzinfo=UTC),
+        filename=f"{item_id}.jpg",
+        mime_type="image/jpeg",
+        width=100,
+        height=100,
+        gps=(
+            None
+            if latitude is None or longitude is None
+            else GPSLocation(latitude=latitude, longitude=longitude)
+        ),
+        download_url=f"https://photos.google.com/{item_id}",
+        deep_link=None,
+    )
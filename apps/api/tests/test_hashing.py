@@ -1,5 +1,9 @@
 from __future__ import annotations
 
+import random
+
+from PIL import Image
+
 from app.engine import hashing
 
 
@@ -30,6 +34,51 @@ def test_hamming_distance_counts_bits():
     assert hashing.hamming_distance(0b1010, 0b0011) == 2
 
 
+def test_dihedral_phashes_match_hashing_each_transformed_input():
+    rng = random.Random(7)
+    grid = [[rng.randrange(256) for _ in range(32)] for _ in range(32)]
+
+    variants = hashing.dihedral_phashes([value for row in grid for value in row])
+
+    expected = [
+        hashing.phash_from_pixels([value for row in block for value in row])
+        for block in hashing._dihedral_blocks(grid)
+    ]
+    assert list(variants) == expected
+    assert len(set(variants)) == 8
+
+
+def test_dihedral_mode_matches_rotated_and_mirrored_copies():
+    image = _asymmetric_image()
+    copies = [
+        image.transpose(Image.Transpose.ROTATE_90),
+        image.transpose(Image.Transpose.FLIP_LEFT_RIGHT),
+        image.transpose(Image.Transpose.TRANSVERSE),
+    ]
+    original = hashing.perceptual_hashes_from_image(image, dihedral=True)
+
+    for copy in copies:
+        plain = hashing.perceptual_hashes_from_image(image.copy(), dihedral=False)
+        rotated = hashing.perceptual_hashes_from_image(copy, dihedral=True)
+        plain_rotated = hashing.perceptual_hashes_from_image(copy, dihedral=False)
+        phash = hashing.phash_distance(original, rotated)
+        plain_phash = hashing.phash_distance(plain, plain_rotated)
+        assert hashing.dhash_distance(original, rotated) <= 2
+        assert phash is not None and phash <= 2
+        assert plain_phash is not None and plain_phash > 12
+
+
+def _asymmetric_image() -> Image.Image:
+    image = Image.new("L", (96, 64), 40)
+    for x in range(96):
+        for y in range(64):
+            if x < 30 and y < 20:
+                image.putpixel((x, y), 230)
+            elif x > 60 and y > 30:
+                image.putpixel((x, y), 140 + (x + y) % 40)
+    return image
+
+
 class _FakeImage:
     def __init__(self, fill: int) -> None:
         self._fill = fill
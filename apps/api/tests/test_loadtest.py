@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import os
+import urllib.error
+import urllib.request
+from collections.abc import Iterator
+from datetime import UTC, datetime
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from app.core.config import Settings
+from app.engine.downloads import DownloadManager, validate_download_url
+from app.engine.models import PhotoItem
+from app.engine.scan import run_scan
+from tools.loadtest import fake_photos
+from tools.loadtest.driver import build_photo_items, latency_percentiles, peak_rss_bytes
+from tools.loadtest.fake_photos import FakePhotosServer, StandInConfig, start_stand_in
+
+
+@pytest.fixture
+def stand_in() -> Iterator[FakePhotosServer]:
+    server = start_stand_in(StandInConfig(default_width=64, default_height=48))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_stand_in_serves_deterministic_images_with_ranges(stand_in: FakePhotosServer):
+    url = stand_in.media_url("scene", "0")
+    first = urllib.request.urlopen(url).read()
+    copy = urllib.request.urlopen(stand_in.media_url("scene", "copy")).read()
+    head = urllib.request.urlopen(urllib.request.Request(url, method="HEAD"))
+    ranged = urllib.request.urlopen(urllib.request.Request(url, headers={"Range": "bytes=0-9"}))
+
+    assert first == copy
+    assert first != urllib.request.urlopen(stand_in.media_url("scene", "1")).read()
+    assert int(head.headers["Content-Length"]) == len(first)
+    assert ranged.status == 206
+    assert ranged.read() == first[:10]
+
+
+def test_stand_in_clamps_requested_sizes(stand_in: FakePhotosServer, monkeypatch):
+    monkeypatch.setattr(fake_photos, "MAX_DIMENSION", 32)
+    url = stand_in.media_url("scene", "0")
+
+    huge = urllib.request.urlopen(f"{url}?w=1000000&h=0").read()
+    with pytest.raises(urllib.error.HTTPError) as excinfo:
+        urllib.request.urlopen(f"{url}?w=big&h=big")
+
+    assert Image.open(BytesIO(huge)).size == (32, 1)
+    assert excinfo.value.code == 400
+
+
+def test_stand_in_injects_throttling_errors():
+    server = start_stand_in(StandInConfig(error_rate_429=1.0))
+    try:
+        with pytest.raises(urllib.error.HTTPError) as excinfo:
+            urllib.request.urlopen(server.media_url("scene", "0"))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert excinfo.value.code == 429
+    assert excinfo.value.headers["Retry-After"] == "1"
+
+
+def test_test_origin_is_allowlisted_outside_prod_only(stand_in: FakePhotosServer):
+    local = Settings(scan_download_test_origin=stand_in.origin)
+    prod = Settings(scan_download_test_origin=stand_in.origin, environment="prod")
+
+    validate_download_url(stand_in.media_url("scene", "0"), local.download_allowlist)
+    with pytest.raises(ValueError):
+        validate_download_url(stand_in.media_url("scene", "0"), prod.download_allowlist)
+
+
+def test_run_scan_against_stand_in_finds_exact_duplicates(stand_in: FakePhotosServer):
+    settings = Settings(scan_download_test_origin=stand_in.origin)
+    items = [
+        _photo_item("a", stand_in.media_url("scene", "0")),
+        _photo_item("b", stand_in.media_url("scene", "copy")),
+    ]
+    downloader = DownloadManager(allowed_hosts=settings.download_allowlist)
+
+    result = run_scan(items, settings, download_manager=downloader)
+
+    assert [[item.id for item in group.items] for group in result.groups_exact] == [["a", "b"]]
+    assert result.stage_metrics.counts["size_probes"] == 2
+
+
+def test_driver_builds_selections_with_repeated_scenes():
+    items = build_photo_items("http://127.0.0.1:1", 0, 10, duplicate_ratio=0.3)
+
+    urls = [item["downloadUrl"] for item in items]
+    assert len(items) == 10
+    assert len(set(urls)) == 10
+    assert len({url.rsplit("/", 1)[0] for url in urls}) == 7
+
+
+def test_latency_percentiles():
+    stats = latency_percentiles([float(value) for value in range(1, 101)])
+
+    assert stats["p50"] == 50.0
+    assert stats["p99"] == 99.0
+    assert stats["max"] == 100.0
+    assert latency_percentiles([]) == {}
+
+
+def test_peak_rss_is_only_reported_for_the_api_process():
+    assert peak_rss_bytes(None) is None
+    if Path(f"/proc/{os.getpid()}/status").exists():
+        assert (peak_rss_bytes(os.getpid()) or 0) > 0
+
+
+def _photo_item(item_id: str, url: str) -> PhotoItem:
+    return PhotoItem(
+        id=item_id,
+        create_time=datetime(2024, 1, 1, tzinfo=UTC),
+        filename="IMG_0001.jpg",
+        mime_type="image/jpeg",
+        width=64,
+        height=48,
+        gps=None,
+        download_url=url,
+        deep_link=None,
+    )
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from PIL import Image
+
+from app.core.config import Settings
+from app.engine import local
+from app.engine.__main__ import main
+from app.engine.hashing import HashingService
+from app.engine.local import (
+    LocalFileManager,
+    PooledHashingService,
+    describe_file,
+    discover_files,
+    read_manifest,
+    scan_local,
+)
+
+
+def test_local_file_manager_reads_ranges_and_sizes_without_caching(tmp_path: Path):
+    path = _write_image(tmp_path / "a.png", 10)
+    item = describe_file(str(path))
+    manager = LocalFileManager()
+
+    assert item is not None and item.width == 64 and item.mime_type == "image/png"
+    assert manager.get_content_length(item) == path.stat().st_size
+    assert manager.get_byte_range(item, 1, 3) == b"PNG"
+    assert manager.get_bytes(item) == path.read_bytes()
+    assert manager.cached_bytes == 0
+    assert describe_file(str(_write_bytes(tmp_path / "empty.jpg", b""))) is None
+
+
+def test_local_byte_hash_streams_the_file_without_reading_it_whole(tmp_path: Path, monkeypatch):
+    path = _write_image(tmp_path / "a.png", 10)
+    item = describe_file(str(path))
+    assert item is not None
+
+    def read_whole_file(_item):
+        raise AssertionError("byte hash read the whole file into memory")
+
+    monkeypatch.setattr(local, "read_file", read_whole_file)
+    service = HashingService(LocalFileManager())
+
+    assert service.get_byte_hash(item) == hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def test_pooled_lazy_dhash_decodes_in_the_pool_by_path(tmp_path: Path, monkeypatch):
+    path = _write_image(tmp_path / "a.png", 10)
+    item = describe_file(str(path))
+    assert item is not None
+
+    def read_whole_file(_item):
+        raise AssertionError("dHash read the whole file in-process")
+
+    monkeypatch.setattr(local, "read_file", read_whole_file)
+    with ThreadPoolExecutor(1) as pool:
+        service = PooledHashingService(LocalFileManager(), pool)
+        dhash = service.get_dhash(item)
+        deferred = service.deferred_phash_count
+        completed = service.complete_phash(item)
+
+    expected = local.hash_file(str(path), mime_type=item.mime_type)[0]
+    assert dhash.phash is None and dhash.dhash == expected.dhash
+    assert completed.phash == expected.phash
+    assert deferred == 1 and service.deferred_phash_count == 0
+
+
+def test_scan_local_groups_copies_across_worker_processes(tmp_path: Path):
+    _write_image(tmp_path / "IMG_1.png", 10)
+    shutil.copy(tmp_path / "IMG_1.png", tmp_path / "IMG_1 (1).png")
+    _write_image(tmp_path / "IMG_2.png", 40)
+    _write_bytes(tmp_path / "notes.txt", b"not an image")
+    _write_bytes(tmp_path / "broken.jpg", b"not a jpeg")
+
+    scan = scan_local(discover_files(tmp_path), Settings(), workers=2)
+
+    exact = [[Path(item.id).name for item in group.items] for group in scan.result.groups_exact]
+    assert len(scan.items) == 3
+    assert exact == [["IMG_1.png", "IMG_1 (1).png"]]
+    assert len(scan.byte_hashes) == 2
+    assert scan.result.stage_metrics.counts["downloads_performed"] == 0
+
+
+def test_cli_writes_ndjson_for_a_manifest(tmp_path: Path):
+    images = tmp_path / "images"
+    images.mkdir()
+    _write_image(images / "a.png", 10)
+    _write_image(images / "b.png", 12)
+    manifest = _write_bytes(
+        tmp_path / "manifest.txt", b"# selection\nimages/a.png\n\nimages/b.png\n"
+    )
+    output = tmp_path / "out.ndjson"
+
+    main([str(manifest), "--format", "ndjson", "--workers", "1", "--output", str(output)])
+
+    lines = [json.loads(line) for line in output.read_text().splitlines()]
+    assert read_manifest(manifest) == [images / "a.png", images / "b.png"]
+    assert lines[0]["inputCount"] == 2
+    assert [Path(line["path"]).name for line in lines[1:]] == ["a.png", "b.png"]
+    assert all(len(line["dhash"]) == 16 for line in lines[1:])
+
+
+def _write_image(path: Path, stripe: int) -> Path:
+    image = Image.new("RGB", (64, 48), (30, 60, 90))
+    for x in range(64):
+        for y in range(stripe % 48, min(stripe % 48 + 6, 48)):
+            image.putpixel((x, y), (250, 250, 250))
+    image.save(path)
+    return path
+
+
+def _write_bytes(path: Path, data: bytes) -> Path:
+    path.write_bytes(data)
+    return path
@@ -0,0 +1,22 @@
+from __future__ import annotations
+
+import re
+import tomllib
+from pathlib import Path
+
+API_ROOT = Path(__file__).resolve().parents[1]
+
+
+def test_both_lock_files_pin_the_optional_extras_alike():
+    pyproject = tomllib.loads((API_ROOT / "pyproject.toml").read_text())
+    uv_lock = tomllib.loads((API_ROOT / "uv.lock").read_text())
+    lines = (API_ROOT / "requirements.lock").read_text().splitlines()
+
+    optional = pyproject["project"]["optional-dependencies"]
+    extras = set(re.findall(r"--extra (\S+)", lines[1]))
+    pins = dict(re.findall(r"^([a-z0-9][a-z0-9._-]*)==(\S+)$", "\n".join(lines), re.M))
+    locked = {package["name"]: package["version"] for package in uv_lock["package"]}
+    names = {re.match(r"[A-Za-z0-9._-]+", spec)[0] for specs in optional.values() for spec in specs}
+
+    assert extras == set(optional)
+    assert {name: pins.get(name) for name in names} == {name: locked[name] for name in names}
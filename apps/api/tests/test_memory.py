@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import tracemalloc
+from collections.abc import Iterator
+from datetime import UTC, datetime
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from app.core.config import Settings
+from app.engine.downloads import DownloadManager
+from app.engine.hashing import HashingService
+from app.engine.memory import MemoryTracker
+from app.engine.models import PhotoItem
+from app.engine.scan import run_scan
+
+
+@pytest.fixture
+def process_tracing() -> Iterator[None]:
+    # Scans never stop tracemalloc; tests do, so it does not slow the rest of the suite.
+    yield
+    tracemalloc.stop()
+
+
+def test_traced_tracking_records_traced_delta_and_rss_per_stage(process_tracing):
+    tracker = MemoryTracker("traced")
+    tracker.start()
+
+    tracker.begin()
+    payload = bytearray(4 * 1024 * 1024)
+    tracker.end("allocate")
+    values = tracker.finish()
+
+    assert len(payload) > 0
+    assert values["allocate_traced_delta"] >= 4 * 1024 * 1024
+    assert values["traced_process_peak"] >= 4 * 1024 * 1024
+    assert "allocate_rss_delta" in values
+    assert values["rss_peak"] > 0
+
+
+def test_a_finishing_scan_leaves_tracing_on_for_concurrent_scans(process_tracing):
+    first = MemoryTracker("traced")
+    second = MemoryTracker("traced")
+    first.start()
+    second.start()
+    second.begin()
+    payload = bytearray(1024 * 1024)
+
+    first.begin()
+    first.end("stage")
+    first.finish()
+    second.end("stage")
+
+    assert len(payload) > 0
+    assert tracemalloc.is_tracing()
+    assert second.finish()["stage_traced_delta"] >= 1024 * 1024
+
+
+def test_tracking_off_records_nothing():
+    tracker = MemoryTracker("off")
+    tracker.start()
+    tracker.begin()
+    tracker.end("stage")
+    tracker.record("download_cache_bytes", 10)
+
+    assert tracker.finish() == {}
+
+
+def test_rss_mode_never_starts_tracemalloc():
+    tracker = MemoryTracker("rss")
+    tracker.start()
+    tracker.begin()
+    tracker.end("stage")
+    values = tracker.finish()
+
+    assert "stage_rss_delta" in values
+    assert "stage_traced_delta" not in values
+    assert not tracemalloc.is_tracing()
+
+
+def test_run_scan_reports_cache_and_decoded_pixel_bytes(monkeypatch, process_tracing):
+    from app.engine import hashing
+
+    monkeypatch.setattr(hashing, "phash_from_image", lambda _image: 0)
+    image_bytes = _png_bytes(40, 30)
+    items = [_photo_item("a", 0), _photo_item("b", 1)]
+    contents = {"a": image_bytes, "b": _png_bytes(40, 30, fill=90)}
+    downloader = DownloadManager(fetcher=lambda item: contents[item.id])
+
+    result = run_scan(items, Settings(scan_memory_tracking="traced"), download_manager=downloader)
+
+    memory = result.stage_metrics.memory_bytes
+    assert memory["download_cache_bytes"] == sum(len(data) for data in contents.values())
+    assert memory["decoded_pixel_bytes"] == 2 * 40 * 30 * 4
+    assert memory["decoded_pixel_bytes_peak"] == 40 * 30 * 4
+    assert "hashing_pipeline_traced_delta" in memory
+    assert "memoryBytes" in result.stage_metrics.model_dump(by_alias=True)
+
+
+def test_hashing_service_decodes_each_image_once(monkeypatch):
+    from app.engine import hashing
+
+    calls: list[int] = []
+    original = hashing._decode
+
+    def counting_decode(data: bytes) -> tuple[Image.Image, int]:
+        calls.append(1)
+        return original(data)
+
+    monkeypatch.setattr(hashing, "_decode", counting_decode)
+    downloader = DownloadManager(fetcher=lambda item: _png_bytes(16, 16))
+    HashingService(downloader).get_perceptual_hashes(_photo_item("a", 0))
+
+    assert len(calls) == 1
+
+
+def _png_bytes(width: int, height: int, fill: int = 30) -> bytes:
+    output = BytesIO()
+    Image.new("RGB", (width, height), (fill, fill * 2 % 256, 200)).save(output, format="PNG")
+    return output.getvalue()
+
+
+def _photo_item(item_id: str, second: int) -> PhotoItem:
+    return PhotoItem(
+        id=item_id,
+        create_time=datetime(2024, 1, 1, 0, 0, second, tzinfo=UTC),
+        filename=f"{item_id}.png",
+        mime_type="image/png",
+        width=40,
+        height=30,
+        gps=None,
+        download_url=f"https://photos.google.com/{item_id}",
+        deep_link=None,
+    )
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import threading
+from datetime import UTC, datetime
+
+import pytest
+
+from app.engine.downloads import DownloadManager
+from app.engine.hashing import HashingService, PerceptualHashes
+from app.engine.models import PhotoItem
+from app.engine.pipeline import ScanPipeline
+
+
+def test_pipeline_hashes_candidate_set_before_slow_download_finishes(monkeypatch):
+    release_slow = threading.Event()
+    set_hashed = threading.Event()
+
+    def fetcher(item: PhotoItem) -> bytes:
+        if item.id == "slow":
+            assert release_slow.wait(timeout=5)
+        return item.id.encode()
+
+    def fake_perceptual_hashes(self: HashingService, item: PhotoItem) -> PerceptualHashes:
+        if item.id == "b":
+            set_hashed.set()
+            release_slow.set()
+        return PerceptualHashes(dhash=0, phash=0)
+
+    monkeypatch.setattr(HashingService, "get_perceptual_hashes", fake_perceptual_hashes)
+    items = [_photo_item("slow"), _photo_item("a"), _photo_item("b")]
+    downloader = DownloadManager(fetcher=fetcher)
+    pipeline = ScanPipeline(downloader, HashingService(downloader), download_workers=2)
+
+    result = pipeline.run(items, [[items[1], items[2]]])
+
+    assert set_hashed.is_set()
+    assert set(result.byte_hashes) == {"slow", "a", "b"}
+    assert set(result.perceptual_hashes) == {"a", "b"}
+    assert set(result.occupancy) == {"download", "byte_hash", "perceptual_hash"}
+    assert all(0.0 <= value <= 1.0 for value in result.occupancy.values())
+
+
+def test_pipeline_skips_perceptual_hash_for_known_exact_duplicates(monkeypatch):
+    hashed: list[str] = []
+
+    def fake_perceptual_hashes(self: HashingService, item: PhotoItem) -> PerceptualHashes:
+        hashed.append(item.id)
+        return PerceptualHashes(dhash=0, phash=0)
+
+    monkeypatch.setattr(HashingService, "get_perceptual_hashes", fake_perceptual_hashes)
+    items = [_photo_item("a"), _photo_item("b"), _photo_item("c")]
+    downloader = DownloadManager(fetcher=lambda item: b"same" if item.id != "c" else b"other")
+    pipeline = ScanPipeline(downloader, HashingService(downloader), download_workers=1)
+
+    result = pipeline.run(items, [items])
+
+    assert result.byte_hashes["a"] == result.byte_hashes["b"]
+    assert "c" in hashed
+    assert not {"a", "b"} <= set(hashed)
+
+
+def test_pipeline_propagates_worker_errors():
+    def fetcher(item: PhotoItem) -> bytes:
+        raise ValueError(f"cannot fetch {item.id}")
+
+    items = [_photo_item("a"), _photo_item("b")]
+    downloader = DownloadManager(fetcher=fetcher)
+    pipeline = ScanPipeline(downloader, HashingService(downloader), queue_size=1)
+
+    with pytest.raises(ValueError):
+        pipeline.run(items, [items])
+
+
+def test_largest_first_starts_the_biggest_download_first_and_reports_makespan():
+    started: list[str] = []
+
+    def fetcher(item: PhotoItem) -> bytes:
+        started.append(item.id)
+        return item.id.encode()
+
+    items = [
+        _photo_item("small"),
+        _photo_item("panorama", width=12000),
+        _photo_item("medium", width=400),
+    ]
+    downloader = DownloadManager(fetcher=fetcher)
+    pipeline = ScanPipeline(
+        downloader,
+        HashingService(downloader),
+        download_workers=1,
+        schedule_policy="largest_first",
+    )
+
+    result = pipeline.run(items, [])
+
+    assert started == ["panorama", "medium", "small"]
+    assert set(result.makespan_ms) == {"download", "byte_hash"}
+    assert result.makespan_ms["download"] >= result.busy_ms["download"] - 1
+
+
+def test_largest_sets_first_serves_members_of_bigger_sets_first(monkeypatch):
+    hashed: list[str] = []
+
+    def fake_perceptual_hashes(self: HashingService, item: PhotoItem) -> PerceptualHashes:
+        hashed.append(item.id)
+        return PerceptualHashes(dhash=0, phash=0)
+
+    monkeypatch.setattr(HashingService, "get_perceptual_hashes", fake_perceptual_hashes)
+    pair = [_photo_item("p1", width=9000), _photo_item("p2", width=9000)]
+    triple = [_photo_item("t1"), _photo_item("t2"), _photo_item("t3")]
+    started: list[str] = []
+    downloader = DownloadManager(fetcher=lambda item: started.append(item.id) or b"x")
+    pipeline = ScanPipeline(
+        downloader,
+        HashingService(downloader),
+        download_workers=1,
+        hash_workers=1,
+        schedule_policy="largest_sets_first",
+    )
+
+    pipeline.run([], [pair, triple])
+
+    assert started[:3] == ["t1", "t2", "t3"]
+    assert hashed[:3] == ["t1", "t2", "t3"]
+
+
+def _photo_item(item_id: str, *, width: int = 100) -> PhotoItem:
+    return PhotoItem(
+        id=item_id,
+        create_time=datetime(2024, 1, 1, tzinfo=UTC),
+        filename=f"{item_id}.jpg",
+        mime_type="image/jpeg",
+        width=width,
+        height=100,
+        gps=None,
+        download_url=f"https://photos.google.com/{item_id}",
+        deep_link=None,
+    )
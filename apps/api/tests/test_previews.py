@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import struct
+from datetime import UTC, datetime
+from io import BytesIO
+
+from PIL import Image
+
+from app.engine import hashing
+from app.engine.downloads import DownloadManager
+from app.engine.hashing import HashingService
+from app.engine.models import PhotoItem
+from app.engine.previews import extract_preview
+
+
+def test_raw_preview_is_largest_dct_jpeg_with_container_orientation():
+    thumbnail = _jpeg(40, 30)
+    preview = _jpeg(160, 120)
+    lossless = b"\xff\xd8\xff\xc3\x00\x02" + b"\x00" * 32
+    raw = _tiff(
+        [
+            [(274, 3, [6]), (513, 4, ["thumbnail"]), (514, 4, [len(thumbnail)])],
+            [(259, 3, [6]), (273, 4, ["preview"]), (279, 4, [len(preview)])],
+            [(259, 3, [7]), (273, 4, ["lossless"]), (279, 4, [len(lossless)])],
+        ],
+        {"thumbnail": thumbnail, "preview": preview, "lossless": lossless},
+    )
+
+    found = extract_preview(raw, "image/x-adobe-dng")
+
+    assert found is not None
+    assert found.data == preview
+    assert found.orientation == 6
+    assert extract_preview(raw, "image/jpeg") is None
+    assert extract_preview(raw[:40], "image/x-adobe-dng") is None
+
+
+def test_heif_jpeg_item_is_found_by_mime_type_or_brand():
+    preview = _jpeg(64, 48)
+    heif = _heif(preview)
+
+    assert extract_preview(heif, "image/heic") == extract_preview(heif, None)
+    found = extract_preview(heif, "image/heic")
+    assert found is not None and found.data == preview
+    assert extract_preview(_heif(b"not a jpeg"), "image/heic") is None
+
+
+def test_hashing_service_hashes_the_rotated_preview_of_a_raw_file(monkeypatch):
+    upright = _asymmetric_image()
+    stored = upright.transpose(Image.Transpose.ROTATE_90)
+    preview = _jpeg_of(stored)
+    raw = _tiff(
+        [[(274, 3, [6]), (513, 4, ["preview"]), (514, 4, [len(preview)])]],
+        {"preview": preview},
+    )
+    full_decodes: list[bytes] = []
+    monkeypatch.setattr(hashing, "_decode", lambda data: full_decodes.append(data))
+    service = HashingService(DownloadManager(fetcher=lambda _item: raw))
+
+    hashes = service.get_perceptual_hashes(_item("raw", "image/x-adobe-dng"))
+
+    expected = hashing.perceptual_hashes_from_image(
+        Image.open(BytesIO(preview)).convert("L").transpose(Image.Transpose.ROTATE_270)
+    )
+    assert full_decodes == []
+    assert service.preview_decode_count == 1
+    assert hashing.hamming_distance(hashes.dhash, expected.dhash) <= 2
+
+
+def _item(item_id: str, mime_type: str) -> PhotoItem:
+    return PhotoItem(
+        id=item_id,
+        create_time=datetime(2024, 1, 1, tzinfo=UTC),
+        filename=f"{item_id}.dng",
+        mime_type=mime_type,
+        width=None,
+        height=None,
+        gps=None,
+        download_url=f"https://photos.google.com/{item_id}",
+        deep_link=None,
+    )
+
+
+def _asymmetric_image() -> Image.Image:
+    image = Image.new("RGB", (96, 64), (20, 20, 20))
+    for x in range(48):
+        for y in range(24):
+            image.putpixel((x, y), (240, 240, 240))
+    return image
+
+
+def _jpeg(width: int, height: int) -> bytes:
+    return _jpeg_of(Image.new("RGB", (width, height), (90, 120, 150)))
+
+
+def _jpeg_of(image: Image.Image) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def _tiff(ifds: list[list[tuple[int, int, list[int | str]]]], blobs: dict[str, bytes]) -> bytes:
+    """Little-endian TIFF whose IFDs are chained in order, followed by the named blobs."""
+    ifd_offsets = [8]
+    for entries in ifds:
+        ifd_offsets.append(ifd_offsets[-1] + 2 + 12 * len(entries) + 4)
+    blob_offsets: dict[str, int] = {}
+    position = ifd_offsets.pop()
+    for name, blob in blobs.items():
+        blob_offsets[name] = position
+        position += len(blob)
+    body = bytearray(b"II*\x00" + struct.pack("<I", 8))
+    for index, entries in enumerate(ifds):
+        body += struct.pack("<H", len(entries))
+        for tag, kind, values in sorted(entries):
+            value = values[0]
+            resolved = blob_offsets[value] if isinstance(value, str) else value
+            packed = struct.pack("<I", resolved) if kind == 4 else struct.pack("<Hxx", resolved)
+            body += struct.pack("<HHI", tag, kind, 1) + packed
+        next_offset = ifd_offsets[index + 1] if index + 1 < len(ifds) else 0
+        body += struct.pack("<I", next_offset)
+    return bytes(body) + b"".join(blobs.values())
+
+
+def _heif(jpeg: bytes) -> bytes:
+    def box(kind: bytes, payload: bytes) -> bytes:
+        return struct.pack(">I", 8 + len(payload)) + kind + payload
+
+    ftyp = box(b"ftyp", b"heic" + b"\x00\x00\x00\x00" + b"mif1heic")
+    infe = box(b"infe", b"\x02\x00\x00\x00" + struct.pack(">HH", 1, 0) + b"jpeg" + b"\x00")
+    iinf = box(b"iinf", b"\x00\x00\x00\x00" + struct.pack(">H", 1) + infe)
+
+    def meta(offset: int) -> bytes:
+        iloc = box(
+            b"iloc",
+            b"\x00\x00\x00\x00"
+            + bytes([0x44, 0x00])
+            + struct.pack(">HHHHII", 1, 1, 0, 1, offset, len(jpeg)),
+        )
+        return box(b"meta", b"\x00\x00\x00\x00" + iinf + iloc)
+
+    header = ftyp + meta(0)
+    return ftyp + meta(len(header) + 8) + box(b"mdat", jpeg)
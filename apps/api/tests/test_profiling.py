@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import pstats
+import threading
+import time
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+from app.api import routes
+from app.core.config import Settings
+from app.engine.profiling import profile_run
+from app.main import app
+
+
+def test_deterministic_profile_has_pstats_and_worker_thread_stacks(tmp_path: Path):
+    def busy_worker() -> None:
+        deadline = time.monotonic() + 0.1
+        while time.monotonic() < deadline:
+            sum(range(1000))
+
+    def compute() -> int:
+        worker = threading.Thread(target=busy_worker, name="pipeline-worker")
+        worker.start()
+        worker.join()
+        return 42
+
+    result, profile = profile_run(
+        compute, mode="deterministic", interval_seconds=0.005, max_samples=1000
+    )
+    stats_path = tmp_path / "run.pstats"
+    stats_path.write_bytes(profile.pstats or b"")
+
+    assert result == 42
+    assert profile.samples > 0
+    assert any(
+        line.startswith("pipeline-worker;") and "busy_worker" in line
+        for line in profile.collapsed.splitlines()
+    )
+    assert any("compute" in name for _, _, name in pstats.Stats(str(stats_path)).stats)
+
+
+def test_sampling_stops_at_max_samples():
+    _, profile = profile_run(
+        lambda: time.sleep(0.1), mode="sampling", interval_seconds=0.001, max_samples=3
+    )
+
+    assert profile.samples == 3
+    assert profile.pstats is None
+
+
+def test_profiled_scan_requires_admin_token_and_stores_profile(monkeypatch):
+    settings = Settings(admin_token="secret")
+    monkeypatch.setattr(routes, "get_settings", lambda: settings)
+    client = TestClient(app)
+    body = {
+        "photoItems": [{"id": "p1", "createTime": "2024-01-01T00:00:00Z"}],
+        "profile": "sampling",
+    }
+
+    denied = client.post("/api/scan", json=body)
+    response = client.post("/api/scan", json=body, headers={"X-Admin-Token": "secret"})
+    run_id = response.json()["runId"]
+    collapsed = client.get(f"/api/scans/{run_id}/profile", headers={"X-Admin-Token": "secret"})
+    missing_pstats = client.get(
+        f"/api/scans/{run_id}/profile",
+        params={"format": "pstats"},
+        headers={"X-Admin-Token": "secret"},
+    )
+    anonymous = client.get(f"/api/scans/{run_id}/profile")
+
+    assert denied.status_code == 403
+    assert response.status_code == 200
+    assert collapsed.status_code == 200
+    assert collapsed.headers["content-type"].startswith("text/plain")
+    assert missing_pstats.status_code == 404
+    assert anonymous.status_code == 403
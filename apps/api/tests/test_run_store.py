@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import threading
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
+from datetime import UTC, datetime
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from app.core.config import Settings
+from app.engine import run_store
+from app.engine.downloads import DownloadManager
+from app.engine.hashing import PerceptualHashes
+from app.engine.models import PhotoItem
+from app.engine.run_store import (
+    PostgresRunDatabase,
+    RunRows,
+    RunStore,
+    StoredRun,
+    get_run_store,
+    run_rows,
+)
+from app.engine.scan import run_scan
+
+
+def test_run_rows_keep_ids_numbers_and_hashes_only():
+    result = run_scan(_duplicate_items(), Settings(), download_manager=_downloader())
+    member_id = result.groups_exact[0].items[0].id
+
+    rows = run_rows(
+        result,
+        created_at=datetime(2024, 1, 1, tzinfo=UTC),
+        byte_hashes={member_id: "ab" * 32},
+        perceptual_hashes={member_id: PerceptualHashes(dhash=(1 << 64) - 1, phash=None)},
+    )
+
+    assert rows.run[0] == result.run_id
+    assert rows.run[3] is True
+    assert {kind for _, kind, _, _ in rows.metrics} >= {"timing_ms", "count"}
+    member = next(row for row in rows.members if row[4] == member_id)
+    assert member[5:] == ("ab" * 32, -1, None)
+    flattened = repr((rows.run, rows.metrics, rows.members))
+    assert "https://" not in flattened
+    assert ".jpg" not in flattened
+
+
+def test_run_store_writes_submitted_runs_in_batches_off_the_caller_thread():
+    database = _RecordingDatabase()
+    store = RunStore(database, batch_size=2, flush_interval_seconds=5.0)
+    caller = threading.current_thread()
+
+    results = [
+        run_scan(_duplicate_items(), Settings(), download_manager=_downloader(), run_store=store)
+        for _ in range(3)
+    ]
+    store.close(timeout=5)
+
+    assert [len(batch) for batch in database.batches] == [2, 1]
+    assert caller not in database.writer_threads
+    assert [rows.run[0] for batch in database.batches for rows in batch] == [
+        result.run_id for result in results
+    ]
+    members = database.batches[0][0].members
+    assert {row[2] for row in members} == {"EXACT"}
+    assert all(row[5] is not None for row in members)
+    assert store.written_runs == 3
+
+
+def test_failed_writes_are_counted_and_do_not_stop_the_writer():
+    database = _RecordingDatabase(fail_first=True)
+    store = RunStore(database, batch_size=1, flush_interval_seconds=0.01)
+    result = run_scan(_duplicate_items(), Settings(), download_manager=_downloader())
+
+    store.submit(result)
+    store.submit(result)
+    store.close(timeout=5)
+
+    assert (store.dropped_runs, store.written_runs) == (1, 1)
+
+
+def test_postgres_writes_replace_earlier_copies_of_the_same_run():
+    result = run_scan(_duplicate_items(), Settings(), download_manager=_downloader())
+    rows = run_rows(result, created_at=datetime(2024, 1, 1, tzinfo=UTC))
+    connection = _FakeConnection()
+    database = PostgresRunDatabase(lambda: connection)
+
+    database.write([rows, rows])
+    database.write([rows])
+
+    statements = [sql.split(" ")[0] for sql, _ in connection.statements]
+    assert statements == ["CREATE", "DELETE", "INSERT", "DELETE", "INSERT"]
+    assert connection.statements[1][1] == ([result.run_id],)
+    assert connection.statements[2][1] == [rows.run]
+    assert connection.copied["scan_run_metrics"] == rows.metrics * 2
+    assert connection.copied["scan_run_group_members"] == rows.members * 2
+
+
+def test_enabled_run_store_without_psycopg_fails_loudly(monkeypatch):
+    def missing(name: str) -> object:
+        raise ImportError(name)
+
+    monkeypatch.setattr(run_store.importlib, "import_module", missing)
+    get_run_store.cache_clear()
+    try:
+        with pytest.raises(RuntimeError, match="postgres"):
+            get_run_store()
+    finally:
+        get_run_store.cache_clear()
+
+
+class _FakeConnection:
+    """Records the statements and COPY rows ``PostgresRunDatabase.write`` issues."""
+
+    closed = False
+
+    def __init__(self) -> None:
+        self.statements: list[tuple[str, object]] = []
+        self.copied: dict[str, list[tuple[object, ...]]] = {}
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        yield
+
+    @contextmanager
+    def cursor(self) -> Iterator[_FakeConnection]:
+        yield self
+
+    def execute(self, sql: str, params: object = None) -> None:
+        self.statements.append((sql.strip(), params))
+
+    def executemany(self, sql: str, params: object) -> None:
+        self.statements.append((sql.strip(), params))
+
+    @contextmanager
+    def copy(self, sql: str) -> Iterator[_FakeCopy]:
+        yield _FakeCopy(self.copied.setdefault(sql.split()[1], []))
+
+
+class _FakeCopy:
+    def __init__(self, rows: list[tuple[object, ...]]) -> None:
+        self._rows = rows
+
+    def write_row(self, row: tuple[object, ...]) -> None:
+        self._rows.append(row)
+
+
+class _RecordingDatabase:
+    def __init__(self, *, fail_first: bool = False) -> None:
+        self.batches: list[list[RunRows]] = []
+        self.writer_threads: list[threading.Thread] = []
+        self._fail_next = fail_first
+
+    def write(self, batch: Sequence[RunRows]) -> None:
+        self.writer_threads.append(threading.current_thread())
+        if self._fail_next:
+            self._fail_next = False
+            raise ConnectionError("database unavailable")
+        self.batches.append(list(batch))
+
+    def get_run(self, run_id: str) -> StoredRun | None:
+        return None
+
+    def runs_between(self, start: datetime, end: datetime, *, limit: int) -> list[StoredRun]:
+        return []
+
+
+def _downloader() -> DownloadManager:
+    output = BytesIO()
+    Image.new("RGB", (40, 30), (120, 60, 30)).save(output, format="JPEG")
+    data = output.getvalue()
+    return DownloadManager(fetcher=lambda _: data)
+
+
+def _duplicate_items() -> list[PhotoItem]:
+    return [
+        PhotoItem(
+            id=item_id,
+            create_time=datetime(2024, 1, 1, tzinfo=UTC),
+            filename=filename,
+            mime_type="image/jpeg",
+            width=40,
+            height=30,
+            gps=None,
+            download_url=f"https://photos.google.com/{item_id}",
+            deep_link=None,
+        )
+        for item_id, filename in (("one", "beach.jpg"), ("two", "beach (1).jpg"))
+    ]
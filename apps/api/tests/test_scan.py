@@ -16,7 +16,7 @@ def test_run_scan_tracks_counts_and_costs(monkeypatch):
     ]
     downloader = DownloadManager(fetcher=lambda item: item.id.encode())
 
-    def fake_candidate_sets(_items):
+    def fake_candidate_sets(_items, **_kwargs):
         return [_items]
 
     def fake_near_duplicates(*_args, **_kwargs):
@@ -30,13 +30,19 @@ def test_run_scan_tracks_counts_and_costs(monkeypatch):
     monkeypatch.setattr(scan, "group_near_duplicates", fake_near_duplicates)
     monkeypatch.setattr(HashingService, "get_perceptual_hashes", fake_perceptual_hashes)
 
-    result = scan.run_scan(items, Settings(), download_manager=downloader)
+    settings = Settings(scan_exact_match_filename_stem=True)
+
+    result = scan.run_scan(items, settings, download_manager=downloader)
 
     counts = result.stage_metrics.counts
     assert counts["selected_images"] == 2
     assert counts["candidate_sets"] == 1
     assert counts["candidate_items"] == 2
-    assert counts["byte_hashes"] == 2
+    assert counts["exact_skipped_by_metadata"] == 2
+    assert counts["partial_hashes"] == 0
+    assert counts["byte_hashes"] == 0
+    assert counts["exact_byte_hashes_avoided"] == 2
+    assert counts["exact_downloads_avoided"] == 0
     assert counts["perceptual_hashes"] == 2
     assert counts["comparisons_executed"] == 1
     assert counts["downloads_performed"] == 2
@@ -46,15 +52,14 @@ def test_run_scan_tracks_counts_and_costs(monkeypatch):
 
     costs = result.cost_estimate
     expected_download = 2 * Settings().scan_cost_per_download
-    expected_hash = (
-        2 * Settings().scan_cost_per_byte_hash + 2 * Settings().scan_cost_per_perceptual_hash
-    )
+    expected_hash = 2 * Settings().scan_cost_per_perceptual_hash
     expected_comparison = 1 * Settings().scan_cost_per_comparison
     expected_total = expected_download + expected_hash + expected_comparison
     assert costs.download_cost == round(expected_download, 6)
     assert costs.hash_cost == round(expected_hash, 6)
     assert costs.comparison_cost == round(expected_comparison, 6)
     assert costs.total_cost == round(expected_total, 6)
+    assert costs.avoided_cost == round(2 * Settings().scan_cost_per_byte_hash, 6)
 
 
 def _photo_item(item_id: str, download_url: str | None) -> PhotoItem:
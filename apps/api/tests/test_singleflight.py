@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from collections.abc import Callable
+from datetime import UTC, datetime
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from app.engine.cancellation import CancellationToken, ScanCancelled
+from app.engine.downloads import DownloadManager
+from app.engine.hashing import HashingService, PerceptualWork, _decode_work, _encode_work
+from app.engine.models import PhotoItem
+from app.engine.singleflight import AsyncSingleFlight, RedisFlight, SingleFlight
+
+
+def test_async_joiners_await_the_leader_without_threads():
+    flight: AsyncSingleFlight[int] = AsyncSingleFlight()
+    calls: list[int] = []
+
+    async def compute() -> int:
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 7
+
+    async def scenario() -> list[tuple[int, bool]]:
+        return list(await asyncio.gather(*(flight.do_shared("k", compute) for _ in range(3))))
+
+    results = asyncio.run(scenario())
+
+    assert calls == [1]
+    assert sorted(results) == [(7, False), (7, True), (7, True)]
+
+
+def test_concurrent_scans_share_one_download_of_the_same_url():
+    flight: SingleFlight[bytes] = SingleFlight()
+    release = threading.Event()
+    fetched: list[str] = []
+
+    def fetcher(item: PhotoItem) -> bytes:
+        fetched.append(item.id)
+        assert release.wait(timeout=5)
+        return b"shared"
+
+    first = DownloadManager(fetcher=fetcher, flight=flight)
+    second = DownloadManager(fetcher=fetcher, flight=flight)
+    results: list[bytes] = []
+    leader = threading.Thread(target=lambda: results.append(first.get_bytes(_photo_item("a"))))
+    leader.start()
+    _wait_until(lambda: bool(fetched))
+    follower = threading.Thread(target=lambda: results.append(second.get_bytes(_photo_item("b"))))
+    follower.start()
+    _wait_until(lambda: flight.shared_count > 0)
+    release.set()
+    leader.join()
+    follower.join()
+
+    assert results == [b"shared", b"shared"]
+    assert fetched == ["a"]
+    assert (first.download_count, second.download_count) == (1, 0)
+    assert second.coalesced_download_count == 1
+
+
+def test_items_sharing_a_url_in_one_selection_download_once():
+    fetched: list[str] = []
+
+    def fetcher(item: PhotoItem) -> bytes:
+        fetched.append(item.id)
+        return b"bytes"
+
+    manager = DownloadManager(fetcher=fetcher, flight=SingleFlight())
+
+    manager.get_bytes(_photo_item("a"))
+    manager.get_bytes(_photo_item("b"))
+
+    assert fetched == ["a"]
+    assert manager.coalesced_download_count == 1
+
+
+def test_waiter_retries_when_the_leading_scan_is_cancelled():
+    flight: SingleFlight[str] = SingleFlight()
+    leader_started = threading.Event()
+    cancel_leader = threading.Event()
+    outcome: list[str] = []
+
+    def leading() -> str:
+        leader_started.set()
+        assert cancel_leader.wait(timeout=5)
+        raise ScanCancelled("cancelled")
+
+    def run_leader() -> None:
+        with pytest.raises(ScanCancelled):
+            flight.do_shared("key", leading)
+
+    leader = threading.Thread(target=run_leader)
+    leader.start()
+    assert leader_started.wait(timeout=5)
+    follower = threading.Thread(
+        target=lambda: outcome.append(
+            flight.do_shared("key", lambda: "own", cancellation=CancellationToken())[0]
+        )
+    )
+    follower.start()
+    _wait_until(lambda: flight.shared_count > 0)
+    cancel_leader.set()
+    leader.join()
+    follower.join()
+
+    assert outcome == ["own"]
+
+
+def test_items_sharing_a_url_in_one_selection_are_hashed_once():
+    data = _jpeg_bytes()
+    service = HashingService(DownloadManager(fetcher=lambda _: data), flight=SingleFlight())
+    other = "https://photos.google.com/other"
+
+    service.get_perceptual_hashes(_photo_item("a"))
+    service.get_perceptual_hashes(_photo_item("b"))
+    service.get_dhash(_photo_item("c", url=other))
+    service.get_dhash(_photo_item("d", url=other))
+    finished = service.complete_phash(_photo_item("d", url=other))
+
+    assert service.perceptual_hashes["a"] == service.perceptual_hashes["b"]
+    assert (service.perceptual_hash_count, service.coalesced_hash_count) == (2, 2)
+    assert finished.phash is not None
+    assert service.download_manager.download_count == 2
+
+
+def test_redis_flight_serves_another_replicas_published_result():
+    client = _DictRedis()
+    replicas = [
+        RedisFlight(
+            client,
+            namespace="test",
+            encode=_encode_work,
+            decode=_decode_work,
+            lock_ttl_seconds=5,
+        )
+        for _ in range(2)
+    ]
+    data = _jpeg_bytes()
+    hashes = HashingService(DownloadManager(fetcher=lambda _: data)).get_dhash(_photo_item("a"))
+    computed: list[str] = []
+
+    def compute(name: str) -> PerceptualWork:
+        computed.append(name)
+        return PerceptualWork(hashes, [1, 2, 3], thumbnail=bytes(range(4)))
+
+    first, first_shared = replicas[0].do_shared("https://photos.google.com/a", lambda: compute("0"))
+    second, second_shared = replicas[1].do_shared(
+        "https://photos.google.com/a", lambda: compute("1")
+    )
+
+    assert computed == ["0"]
+    assert (first_shared, second_shared) == (False, True)
+    assert second == first
+    assert not any("photos.google.com" in key for key in client.values)
+
+
+def _wait_until(condition: Callable[[], bool]) -> None:
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+class _DictRedis:
+    """The handful of Redis commands RedisFlight uses, without expiry."""
+
+    def __init__(self) -> None:
+        self.values: dict[str, bytes] = {}
+
+    def get(self, key: str) -> bytes | None:
+        return self.values.get(key)
+
+    def set(self, key: str, value: bytes | str, *, nx: bool = False, px: int = 0) -> bool:
+        if nx and key in self.values:
+            return False
+        self.values[key] = value.encode() if isinstance(value, str) else value
+        return True
+
+    def delete(self, key: str) -> None:
+        self.values.pop(key, None)
+
+
+def _photo_item(item_id: str, url: str = "https://photos.google.com/shared") -> PhotoItem:
+    return PhotoItem(
+        id=item_id,
+        create_time=datetime(2024, 1, 1, tzinfo=UTC),
+        filename=f"{item_id}.jpg",
+        mime_type="image/jpeg",
+        width=40,
+        height=30,
+        gps=None,
+        download_url=url,
+        deep_link=None,
+    )
+
+
+def _jpeg_bytes() -> bytes:
+    output = BytesIO()
+    image = Image.new("RGB", (40, 30), (20, 20, 20))
+    image.paste((220, 220, 220), (0, 0, 20, 15))
+    image.save(output, format="JPEG")
+    return output.getvalue()
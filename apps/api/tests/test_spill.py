@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import json
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+from app.api import routes
+from app.core.config import Settings
+from app.engine import scan
+from app.engine.candidates import build_candidate_sets, candidate_bucket_key
+from app.engine.downloads import DownloadManager
+from app.engine.hashing import HashingService, PerceptualHashes
+from app.engine.models import PhotoItem
+from app.engine.spill import BucketSpill, SpilledScanInput
+from app.main import app
+
+_HASHES = {
+    "a": PerceptualHashes(dhash=0, phash=0),
+    "b": PerceptualHashes(dhash=0, phash=0),
+    "c": PerceptualHashes(dhash=0b111, phash=0b11),
+    "d": PerceptualHashes(dhash=0b1111, phash=0b111),
+    "e": PerceptualHashes(dhash=(1 << 64) - 1, phash=(1 << 64) - 1),
+}
+
+
+def test_bucket_spill_matches_in_memory_candidate_sets(tmp_path: Path):
+    items = [
+        _photo_item(f"item-{index}", day=index % 3, minute=(index * 7) % 11, width=100 + index % 2)
+        for index in range(25)
+    ]
+    spill = BucketSpill(candidate_bucket_key, tmp_path, run_items=4)
+    for item in items:
+        spill.add(item)
+
+    buckets = [bucket for bucket in spill.buckets() if len(bucket) >= 2]
+
+    assert spill.run_count == 7
+    assert buckets == build_candidate_sets(items)
+
+
+def test_external_scan_matches_in_memory_scan_and_evicts_bytes(monkeypatch):
+    monkeypatch.setattr(HashingService, "get_perceptual_hashes", _fake_perceptual_hashes)
+    items = [
+        _photo_item("a", filename="IMG_1.jpg"),
+        _photo_item("b", filename="IMG_1 (1).jpg"),
+        _photo_item("c", minute=1),
+        _photo_item("d", minute=2),
+        _photo_item("e", minute=3),
+        _photo_item("other-day", day=4),
+    ]
+    fetch = {"a": b"same", "b": b"same"}
+
+    def fetcher(item: PhotoItem) -> bytes:
+        return fetch.get(item.id, item.id.encode())
+
+    in_memory = scan.run_scan(items, Settings(), download_manager=DownloadManager(fetcher=fetcher))
+    downloader = DownloadManager(fetcher=fetcher)
+    with SpilledScanInput(run_items=2) as spilled:
+        for item in items:
+            spilled.add(item)
+        external = scan.run_external_scan(spilled, Settings(), download_manager=downloader)
+
+    assert _group_ids(external.groups_exact) == _group_ids(in_memory.groups_exact) == [["a", "b"]]
+    assert _group_ids(external.groups_very_similar) == _group_ids(in_memory.groups_very_similar)
+    assert _group_ids(external.groups_very_similar) == [["c", "d"]]
+    assert external.input_count == 6
+    assert external.stage_metrics.counts["spill_runs"] == 6
+    assert external.coverage is not None and external.coverage.complete
+    assert downloader.cached_bytes == 0
+
+
+def test_stream_endpoint_ingests_ndjson_records():
+    client = TestClient(app)
+    lines = [
+        json.dumps({"id": f"p{index}", "createTime": "2024-01-01T00:00:00Z", "width": 10})
+        for index in range(3)
+    ]
+
+    response = client.post(
+        "/api/scan/stream",
+        content="\n".join(lines) + "\n\n",
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    invalid = client.post("/api/scan/stream", content=lines[0] + "\n{not json}\n")
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["inputCount"] == 3
+    assert body["stageMetrics"]["counts"]["candidate_sets"] == 1
+    assert invalid.status_code == 400
+    assert "line 2" in invalid.json()["detail"]
+
+
+def test_stream_endpoint_rejects_lines_over_the_length_cap(monkeypatch):
+    monkeypatch.setattr(routes, "get_settings", lambda: Settings(scan_stream_max_line_bytes=1024))
+    client = TestClient(app)
+
+    response = client.post("/api/scan/stream", content=b"x" * 4096)
+
+    assert response.status_code == 413
+
+
+def _fake_perceptual_hashes(self: HashingService, item: PhotoItem) -> PerceptualHashes:
+    self.perceptual_hash_count += 1
+    return _HASHES[item.id]
+
+
+def _group_ids(groups) -> list[list[str]]:
+    return [[item.id for item in group.items] for group in groups]
+
+
+def _photo_item(
+    item_id: str,
+    *,
+    day: int = 0,
+    minute: int = 0,
+    width: int = 100,
+    filename: str | None = None,
+) -> PhotoItem:
+    return PhotoItem(
+        id=item_id,
+        create_time=datetime(2024, 1, 1, tzinfo=UTC) + timedelta(days=day, minutes=minute),
+        filename=filename or f"{item_id}.jpg",
+        mime_type="image/jpeg",
+        width=width,
+        height=100,
+        gps=None,
+        download_url=f"https://photos.google.com/{item_id}",
+        deep_link=None,
+    )
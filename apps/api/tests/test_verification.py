@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import random
+from datetime import UTC, datetime
+from io import BytesIO
+
+import pytest
+from PIL import Image, ImageDraw
+
+from app.engine import hashing
+from app.engine.downloads import DownloadManager
+from app.engine.grouping import (
+    PairDistance,
+    SimilarityThresholds,
+    VerificationPolicy,
+    classify_pair_distances,
+    group_near_duplicates,
+    score_borderline_pairs,
+)
+from app.engine.hashing import HashingService, verification_thumbnail
+from app.engine.models import PhotoItem
+from app.engine.verification import ThumbnailScorer
+
+# Every non-identical pair lands in the POSSIBLY_SIMILAR band.
+_ALL_BORDERLINE = SimilarityThresholds(
+    dhash_very=-1, dhash_possible=64, phash_very=-1, phash_possible=64
+)
+_POLICY = VerificationPolicy(metric="ssim", promote_score=0.9, drop_score=0.5)
+
+
+@pytest.mark.parametrize("metric", ["ssim", "ncc"])
+def test_scores_separate_copies_from_unrelated_images(metric):
+    scorer = ThumbnailScorer(metric)
+    original = verification_thumbnail(_scene(seed=1))
+    brighter = verification_thumbnail(_scene(seed=1).point(lambda value: min(value + 12, 255)))
+    unrelated = verification_thumbnail(_scene(seed=2))
+
+    assert scorer.score(original, original) == pytest.approx(1.0)
+    assert scorer.score(original, brighter) > 0.9
+    assert scorer.score(original, unrelated) < 0.5
+
+
+def test_dihedral_scoring_matches_rotated_copies():
+    original = verification_thumbnail(_scene(seed=3))
+    rotated = verification_thumbnail(_scene(seed=3).transpose(Image.Transpose.ROTATE_90))
+
+    assert ThumbnailScorer("ssim").score(original, rotated) < 0.5
+    assert ThumbnailScorer("ssim", dihedral=True).score(original, rotated) > 0.95
+
+
+def test_only_pairs_in_the_borderline_band_are_scored():
+    thresholds = SimilarityThresholds(
+        dhash_very=2, dhash_possible=10, phash_very=2, phash_possible=10
+    )
+    thumbnail = verification_thumbnail(_scene(seed=4))
+    thumbnails = {item_id: thumbnail for item_id in "abcd"}
+    distances = [
+        PairDistance("a", "b", dhash=1, phash=1),
+        PairDistance("a", "c", dhash=8, phash=20),
+        PairDistance("a", "d", dhash=30, phash=30),
+    ]
+
+    scored = score_borderline_pairs(distances, thumbnails, thresholds, _POLICY)
+
+    assert [distance.score is not None for distance in scored] == [False, True, False]
+
+
+def test_scores_promote_keep_or_drop_borderline_edges():
+    items = {item_id: _photo_item(item_id) for item_id in "abcdef"}
+    distances = [
+        PairDistance("a", "b", dhash=8, phash=None, score=0.95),
+        PairDistance("c", "d", dhash=8, phash=None, score=0.7),
+        PairDistance("e", "f", dhash=8, phash=None, score=0.2),
+    ]
+
+    very, possible = classify_pair_distances(
+        distances, items, _ALL_BORDERLINE, verification=_POLICY
+    )
+    unverified_very, unverified_possible = classify_pair_distances(
+        distances, items, _ALL_BORDERLINE
+    )
+
+    assert [[item.id for item in group.items] for group in very] == [["a", "b"]]
+    assert [[item.id for item in group.items] for group in possible] == [["c", "d"]]
+    assert unverified_very == []
+    assert len(unverified_possible) == 3
+
+
+def test_verification_reuses_the_hashing_decode(monkeypatch):
+    decodes: list[int] = []
+    real_decode = hashing._decode
+
+    def counting_decode(data: bytes):
+        decodes.append(len(data))
+        return real_decode(data)
+
+    monkeypatch.setattr(hashing, "_decode", counting_decode)
+    images = {
+        "a": _jpeg(_scene(seed=5)),
+        "b": _jpeg(_scene(seed=5).point(lambda value: max(value - 10, 0))),
+        "c": _jpeg(_scene(seed=6)),
+    }
+    service = HashingService(
+        DownloadManager(fetcher=lambda item: images[item.id]), keep_thumbnails=True
+    )
+    items = [_photo_item(item_id) for item_id in images]
+    hashes = {item.id: service.get_perceptual_hashes(item) for item in items}
+    distances: list[PairDistance] = []
+
+    very, possible, comparisons = group_near_duplicates(
+        [items],
+        hashes,
+        _ALL_BORDERLINE,
+        distances_out=distances,
+        thumbnails=service.thumbnails,
+        verification=_POLICY,
+    )
+
+    assert len(decodes) == 3
+    assert comparisons == 3
+    assert all(distance.score is not None for distance in distances)
+    assert [[item.id for item in group.items] for group in very] == [["a", "b"]]
+    assert possible == []
+
+
+def _scene(*, seed: int) -> Image.Image:
+    rng = random.Random(seed)
+    image = Image.new("L", (160, 120), rng.randrange(40, 90))
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        left, top = rng.randrange(0, 140), rng.randrange(0, 100)
+        right = left + rng.randrange(10, 60)
+        bottom = top + rng.randrange(10, 60)
+        draw.rectangle((left, top, right, bottom), fill=rng.randrange(0, 256))
+    return image
+
+
+def _jpeg(image: Image.Image) -> bytes:
+    output = BytesIO()
+    image.convert("RGB").save(output, format="JPEG", quality=90)
+    return output.getvalue()
+
+
+def _photo_item(item_id: str) -> PhotoItem:
+    return PhotoItem(
+        id=item_id,
+        create_time=datetime(2024, 1, 1, tzinfo=UTC),
+        filename=f"{item_id}.jpg",
+        mime_type="image/jpeg",
+        width=160,
+        height=120,
+        gps=None,
+        download_url=f"https://photos.google.com/{item_id}",
+        deep_link=None,
+    )
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import subprocess
+import sys
+from pathlib import Path
+
+from app.core.config import Settings
+from app.engine.warmup import warm_up
+
+API_ROOT = Path(__file__).resolve().parents[1]
+# Generous for CI; `import app.main` takes well under half of this locally.
+IMPORT_BUDGET_SECONDS = 1.5
+ENGINE_ONLY_MODULES = ("PIL", "app.engine.scan", "app.engine.hashing", "app.engine.downloads")
+
+
+def test_importing_the_app_stays_within_budget_and_defers_the_engine():
+    code = (
+        "import sys, app.main; "
+        f"print(','.join(m for m in {ENGINE_ONLY_MODULES!r} if m in sys.modules))"
+    )
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=API_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    assert completed.stdout.strip() == ""
+    cumulative_us = _cumulative_import_us(completed.stderr, "app.main")
+    assert cumulative_us < IMPORT_BUDGET_SECONDS * 1_000_000
+
+
+def test_warm_up_loads_the_engine_and_runs_the_hash_kernels():
+    timings = warm_up(Settings(scan_dihedral_invariant=True))
+
+    assert set(timings) == {"engine_modules", "pillow_codecs", "hash_kernels"}
+    assert "app.engine.scan" in sys.modules
+    assert "PIL.JpegImagePlugin" in sys.modules
+
+
+def _cumulative_import_us(report: str, module: str) -> int:
+    # Lines read "import time: self [us] | cumulative | imported package".
+    for line in report.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        if name.strip() == module:
+            return int(cumulative)
+    raise AssertionError(f"{module} missing from -X importtime output")
@@ -0,0 +1 @@
+"""Local Google Photos stand-in and load driver for exercising /api/scan."""
@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+from typing import Any
+
+
+@dataclass(frozen=True)
+class LoadReport:
+    scans: int
+    concurrency: int
+    items_per_scan: int
+    succeeded: int
+    failed: int
+    status_counts: dict[str, int]
+    wall_seconds: float
+    scans_per_second: float
+    items_per_second: float
+    latency_ms: dict[str, float]
+    peak_rss_bytes: int | None
+
+
+def build_photo_items(
+    origin: str,
+    scan_index: int,
+    items_per_scan: int,
+    *,
+    duplicate_ratio: float = 0.3,
+    unique_selections: bool = True,
+) -> list[dict[str, Any]]:
+    """Build a selection where roughly ``duplicate_ratio`` of items repeat an earlier scene."""
+    prefix = f"s{scan_index}-" if unique_selections else ""
+    base_time = datetime(2024, 1, 1, tzinfo=UTC)
+    items: list[dict[str, Any]] = []
+    scene_count = max(1, math.ceil(items_per_scan * (1 - duplicate_ratio)))
+    for position in range(items_per_scan):
+        scene = position % scene_count
+        variant = position // scene_count
+        item_id = f"{prefix}p{position}"
+        items.append(
+            {
+                "id": item_id,
+                "createTime": (base_time + timedelta(seconds=scene * 5)).isoformat(),
+                "filename": f"IMG_{scene:04d}.jpg",
+                "mimeType": "image/jpeg",
+                "width": 1024,
+                "height": 768,
+                "downloadUrl": f"{origin}/media/{prefix}scene{scene}/{variant}",
+            }
+        )
+    return items
+
+
+def run_load(
+    api_url: str,
+    origin: str,
+    *,
+    scans: int,
+    concurrency: int,
+    items_per_scan: int,
+    unique_selections: bool = True,
+    api_pid: int | None = None,
+    timeout_seconds: float = 300.0,
+) -> LoadReport:
+    latencies: list[float] = []
+    status_counts: dict[str, int] = {}
+    lock = threading.Lock()
+
+    def fire(scan_index: int) -> None:
+        payload = {
+            "photoItems": build_photo_items(
+                origin,
+                scan_index,
+                items_per_scan,
+                unique_selections=unique_selections,
+            ),
+            "consentConfirmed": True,
+        }
+        request = urllib.request.Request(
+            f"{api_url.rstrip('/')}/api/scan",
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=timeout_seconds) as response:
+                response.read()
+                status = str(response.status)
+        except urllib.error.HTTPError as exc:
+            status = str(exc.code)
+        except (urllib.error.URLError, TimeoutError):
+            status = "error"
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with lock:
+            status_counts[status] = status_counts.get(status, 0) + 1
+            if status == "200":
+                latencies.append(elapsed_ms)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(fire, range(scans)))
+    wall_seconds = time.perf_counter() - start
+    succeeded = status_counts.get("200", 0)
+    return LoadReport(
+        scans=scans,
+        concurrency=concurrency,
+        items_per_scan=items_per_scan,
+        succeeded=succeeded,
+        failed=scans - succeeded,
+        status_counts=status_counts,
+        wall_seconds=round(wall_seconds, 3),
+        scans_per_second=round(succeeded / wall_seconds, 3) if wall_seconds else 0.0,
+        items_per_second=(
+            round(succeeded * items_per_scan / wall_seconds, 3) if wall_seconds else 0.0
+        ),
+        latency_ms=latency_percentiles(latencies),
+        peak_rss_bytes=peak_rss_bytes(api_pid),
+    )
+
+
+def latency_percentiles(samples: list[float]) -> dict[str, float]:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    result = {"min": ordered[0], "max": ordered[-1], "mean": sum(ordered) / len(ordered)}
+    for percentile in (50, 90, 95, 99):
+        rank = max(math.ceil(percentile / 100 * len(ordered)) - 1, 0)
+        result[f"p{percentile}"] = ordered[rank]
+    return {key: round(value, 2) for key, value in result.items()}
+
+
+def peak_rss_bytes(pid: int | None) -> int | None:
+    """Peak RSS of the API process ``pid`` (Linux ``VmHWM``); ``None`` without a pid.
+
+    The driver never reports its own RSS: the load generator's footprint says nothing about
+    how large the API pod needs to be.
+    """
+    if pid is None:
+        return None
+    status_path = Path(f"/proc/{pid}/status")
+    if not status_path.exists():
+        return None
+    for line in status_path.read_text().splitlines():
+        if line.startswith("VmHWM:"):
+            return int(line.split()[1]) * 1024
+    return None
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Fire concurrent scans at the PhotoPrune API.")
+    parser.add_argument("--api-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--origin", default="http://127.0.0.1:8765", help="stand-in origin")
+    parser.add_argument("--scans", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--items", type=int, default=50)
+    parser.add_argument(
+        "--api-pid", type=int, default=None, help="API pid whose peak RSS to report"
+    )
+    parser.add_argument(
+        "--repeat-selection",
+        action="store_true",
+        help="send the same selection every time (exercises the result cache)",
+    )
+    args = parser.parse_args(argv)
+    report = run_load(
+        args.api_url,
+        args.origin,
+        scans=args.scans,
+        concurrency=args.concurrency,
+        items_per_scan=args.items,
+        unique_selections=not args.repeat_selection,
+        api_pid=args.api_pid,
+    )
+    print(json.dumps(asdict(report), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs, urlparse
+
+# Paths look like Google Photos base URLs: /media/<group>/<variant>[=w<W>-h<H>].
+_PATH = re.compile(r"^/media/(?P<group>[\w.-]+)/(?P<variant>[\w.-]+)(?:=(?P<params>[\w-]*))?$")
+_SIZE_PARAM = re.compile(r"^(?:w(?P<w>\d+))?-?(?:h(?P<h>\d+))?$")
+_CHUNK_BYTES = 16 * 1024
+# Bounds any requested size, so a client cannot make the server render huge images.
+MAX_DIMENSION = 4096
+
+
+@dataclass(frozen=True)
+class StandInConfig:
+    latency_ms: float = 0.0
+    bandwidth_bytes_per_second: float | None = None
+    error_rate_429: float = 0.0
+    error_rate_503: float = 0.0
+    default_width: int = 1024
+    default_height: int = 768
+    seed: int = 0
+
+
+class FakePhotosServer(ThreadingHTTPServer):
+    """Serves deterministic synthetic photos for load tests.
+
+    Every ``/media/<group>/<variant>`` URL decodes to the same scene for a given group.
+    Variant ``0`` and ``copy`` return byte-identical files; other variants add a small,
+    deterministic perturbation so they land in the near-duplicate tiers.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], config: StandInConfig) -> None:
+        super().__init__(address, _Handler)
+        self.config = config
+        self._random = random.Random(config.seed)
+        self._random_lock = threading.Lock()
+        self.requests_served = 0
+
+    @property
+    def origin(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host!s}:{port}"
+
+    def media_url(self, group: str, variant: str, width: int | None = None) -> str:
+        suffix = "" if width is None else f"=w{width}"
+        return f"{self.origin}/media/{group}/{variant}{suffix}"
+
+    def roll(self) -> float:
+        with self._random_lock:
+            self.requests_served += 1
+            return self._random.random()
+
+
+def start_stand_in(
+    config: StandInConfig | None = None,
+    host: str = "127.0.0.1",
+    port: int = 0,
+) -> FakePhotosServer:
+    server = FakePhotosServer((host, port), config or StandInConfig())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def render_photo(group: str, variant: str, width: int, height: int) -> bytes:
+    return _render_photo(group, "0" if variant == "copy" else variant, width, height)
+
+
+@lru_cache(maxsize=256)
+def _render_photo(group: str, variant: str, width: int, height: int) -> bytes:
+    from PIL import Image, ImageDraw
+
+    scene = random.Random(int(hashlib.sha256(group.encode()).hexdigest()[:16], 16))
+    image = Image.new("RGB", (width, height), _color(scene))
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x0, y0 = scene.randrange(width), scene.randrange(height)
+        x1 = min(width, x0 + scene.randrange(width // 8 + 1, width // 2 + 2))
+        y1 = min(height, y0 + scene.randrange(height // 8 + 1, height // 2 + 2))
+        draw.rectangle((x0, y0, x1, y1), fill=_color(scene))
+    if variant != "0":
+        jitter = random.Random(f"{group}:{variant}")
+        for _ in range(3):
+            x, y = jitter.randrange(width), jitter.randrange(height)
+            radius = max(width // 64, 2)
+            draw.ellipse((x, y, x + radius, y + radius), fill=_color(jitter))
+    output = BytesIO()
+    image.save(output, format="JPEG", quality=85)
+    return output.getvalue()
+
+
+def _color(source: random.Random) -> tuple[int, int, int]:
+    return (source.randrange(256), source.randrange(256), source.randrange(256))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: FakePhotosServer
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self) -> None:
+        self._serve(include_body=False)
+
+    def do_GET(self) -> None:
+        self._serve(include_body=True)
+
+    def log_message(self, format: str, *args: object) -> None:
+        return
+
+    def _serve(self, *, include_body: bool) -> None:
+        config = self.server.config
+        if config.latency_ms:
+            time.sleep(config.latency_ms / 1000)
+        roll = self.server.roll()
+        if roll < config.error_rate_429:
+            self._send_error(429, retry_after=1)
+            return
+        if roll < config.error_rate_429 + config.error_rate_503:
+            self._send_error(503, retry_after=1)
+            return
+
+        parsed = urlparse(self.path)
+        match = _PATH.match(parsed.path)
+        if match is None:
+            self._send_error(404)
+            return
+        dimensions = self._dimensions(match.group("params"), parse_qs(parsed.query))
+        if dimensions is None:
+            self._send_error(400)
+            return
+        width, height = dimensions
+        body = render_photo(match.group("group"), match.group("variant"), width, height)
+
+        status, start, end = 200, 0, len(body) - 1
+        range_header = self.headers.get("Range")
+        if range_header:
+            byte_range = _parse_range(range_header, len(body))
+            if byte_range is None:
+                self._send_error(416)
+                return
+            status, (start, end) = 206, byte_range
+
+        self.send_response(status)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(body)}")
+        self.end_headers()
+        if include_body:
+            self._write_throttled(body[start : end + 1], config.bandwidth_bytes_per_second)
+
+    def _dimensions(
+        self, params: str | None, query: dict[str, list[str]]
+    ) -> tuple[int, int] | None:
+        config = self.server.config
+        width, height = config.default_width, config.default_height
+        size = _SIZE_PARAM.match(params or "")
+        if size is not None and (size.group("w") or size.group("h")):
+            requested_w = int(size.group("w") or 0)
+            requested_h = int(size.group("h") or 0)
+            scale = min(
+                requested_w / width if requested_w else 1.0,
+                requested_h / height if requested_h else 1.0,
+            )
+            width, height = max(int(width * scale), 1), max(int(height * scale), 1)
+        if "w" in query and "h" in query:
+            try:
+                width, height = int(query["w"][0]), int(query["h"][0])
+            except ValueError:
+                return None
+        return _clamp(width), _clamp(height)
+
+    def _write_throttled(self, body: bytes, bandwidth: float | None) -> None:
+        for offset in range(0, len(body), _CHUNK_BYTES):
+            chunk = body[offset : offset + _CHUNK_BYTES]
+            self.wfile.write(chunk)
+            if bandwidth:
+                time.sleep(len(chunk) / bandwidth)
+
+    def _send_error(self, status: int, retry_after: int | None = None) -> None:
+        self.send_response(status)
+        if retry_after is not None:
+            self.send_header("Retry-After", str(retry_after))
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+def _clamp(dimension: int) -> int:
+    return min(max(dimension, 1), MAX_DIMENSION)
+
+
+def _parse_range(header: str, size: int) -> tuple[int, int] | None:
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", header.strip())
+    if match is None or (not match.group(1) and not match.group(2)):
+        return None
+    if not match.group(1):
+        start = max(size - int(match.group(2)), 0)
+        end = size - 1
+    else:
+        start = int(match.group(1))
+        end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+    if start >= size or start > end:
+        return None
+    return start, end
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Serve synthetic Google Photos media.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--bandwidth", type=float, default=None, help="bytes per second")
+    parser.add_argument("--error-rate-429", type=float, default=0.0)
+    parser.add_argument("--error-rate-503", type=float, default=0.0)
+    parser.add_argument("--width", type=int, default=1024)
+    parser.add_argument("--height", type=int, default=768)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    config = StandInConfig(
+        latency_ms=args.latency_ms,
+        bandwidth_bytes_per_second=args.bandwidth,
+        error_rate_429=args.error_rate_429,
+        error_rate_503=args.error_rate_503,
+        default_width=args.width,
+        default_height=args.height,
+        seed=args.seed,
+    )
+    server = FakePhotosServer((args.host, args.port), config)
+    print(f"Serving synthetic photos on {server.origin}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()